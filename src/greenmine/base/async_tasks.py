@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+
+from greenqueue.core import Library
+register = Library()
+
+from django.conf import settings
+from django.core.cache import cache
+
+from greenmine.scrum.models import Project
+from greenmine.base.backup.exporter import export_project, \
+    get_export_progress_key, EXPORT_PROGRESS_TIMEOUT
+
+import os
+
+# The sync backend runs the task in the web request thread, which
+# must not fork a pool of compressor processes.
+if getattr(settings, 'GREENQUEUE_BACKEND', None) == 'greenqueue.backends.sync.SyncService':
+    EXPORT_CODEC = 'gzip'
+else:
+    EXPORT_CODEC = None
+
+
+@register.task(name='export-project')
+def export_project_task(project_id, differential=False):
+    project = Project.objects.get(pk=project_id)
+    key = get_export_progress_key(project)
+
+    def progress(done, total):
+        cache.set(key, {'done': done, 'total': total, 'finished': False},
+                  EXPORT_PROGRESS_TIMEOUT)
+
+    progress(0, 0)
+    try:
+        path, stats = export_project(project, progress=progress, differential=differential,
+                                     codec=EXPORT_CODEC)
+    except Exception:
+        cache.delete(key)
+        raise
+
+    progress_data = cache.get(key) or {'done': 0, 'total': 0}
+    progress_data.update({'finished': True, 'filename': os.path.basename(path),
+                          'throughput': stats['throughput']})
+    cache.set(key, progress_data, EXPORT_PROGRESS_TIMEOUT)
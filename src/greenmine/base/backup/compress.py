@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+from collections import deque
+from StringIO import StringIO
+import multiprocessing
+import gzip
+import time
+
+# 'gzip' compresses in the exporting process, 'parallel-gzip' splits
+# the archive in blocks compressed by a pool of processes. Both write
+# gzip files (the parallel one with a member per block) that any gzip
+# reader decompresses as a whole. The pool is forked by the process
+# running the export: the export_project command or a greenqueue
+# worker. With the sync greenqueue backend exports started from the
+# web run in the request thread, and use 'gzip' instead.
+BACKUP_CODEC = getattr(settings, 'BACKUP_CODEC', 'gzip')
+BACKUP_COMPRESSION_LEVEL = getattr(settings, 'BACKUP_COMPRESSION_LEVEL', 6)
+# Processes of the parallel codec, all cpus by default.
+BACKUP_COMPRESSION_PROCESSES = getattr(settings, 'BACKUP_COMPRESSION_PROCESSES', None)
+BACKUP_COMPRESSION_BLOCK_SIZE = getattr(settings, 'BACKUP_COMPRESSION_BLOCK_SIZE', 1024 * 1024)
+
+
+class _CountingFile(object):
+    def __init__(self, fileobj):
+        self.fileobj = fileobj
+        self.written = 0
+
+    def write(self, data):
+        self.written += len(data)
+        self.fileobj.write(data)
+
+    def flush(self):
+        self.fileobj.flush()
+
+
+class GzipCompressor(object):
+    """
+    Compress a stream into ``fileobj`` as it is written. ``bytes_in``,
+    ``bytes_out`` and ``seconds`` (from creation to close) measure
+    the compression throughput.
+    """
+
+    def __init__(self, fileobj, level=BACKUP_COMPRESSION_LEVEL):
+        self.fileobj = _CountingFile(fileobj)
+        self.level = level
+        self.bytes_in = 0
+        self.started = time.time()
+        self.seconds = None
+        self.open()
+
+    def open(self):
+        self.stream = gzip.GzipFile(fileobj=self.fileobj, mode='wb', compresslevel=self.level)
+
+    @property
+    def bytes_out(self):
+        return self.fileobj.written
+
+    def write(self, data):
+        self.bytes_in += len(data)
+        self.stream.write(data)
+
+    def close(self):
+        self.stream.close()
+        self.seconds = time.time() - self.started
+
+    def get_stats(self):
+        seconds = self.seconds or time.time() - self.started
+        return {
+            'bytes_in': self.bytes_in,
+            'bytes_out': self.bytes_out,
+            'seconds': seconds,
+            'throughput': self.bytes_in / seconds if seconds else 0,
+        }
+
+
+def _compress_block(args):
+    data, level = args
+    buf = StringIO()
+    stream = gzip.GzipFile(fileobj=buf, mode='wb', compresslevel=level, mtime=0)
+    stream.write(data)
+    stream.close()
+    return buf.getvalue()
+
+
+class ParallelGzipCompressor(GzipCompressor):
+    """
+    Compress blocks of ``block_size`` bytes in a pool of processes,
+    each as a gzip member, and write them in order. At most two blocks
+    per process are queued, which bounds the memory used.
+    """
+
+    def __init__(self, fileobj, level=BACKUP_COMPRESSION_LEVEL,
+                 processes=BACKUP_COMPRESSION_PROCESSES,
+                 block_size=BACKUP_COMPRESSION_BLOCK_SIZE):
+        self.processes = processes or multiprocessing.cpu_count()
+        self.block_size = block_size
+        super(ParallelGzipCompressor, self).__init__(fileobj, level)
+
+    def open(self):
+        self.pool = multiprocessing.Pool(self.processes)
+        self.pending = deque()
+        self.buffer, self.buffered = [], 0
+
+    def write(self, data):
+        self.bytes_in += len(data)
+        self.buffer.append(data)
+        self.buffered += len(data)
+
+        if self.buffered >= self.block_size:
+            self.submit()
+
+    def submit(self):
+        block = "".join(self.buffer)
+        self.buffer, self.buffered = [], 0
+
+        for start in xrange(0, len(block), self.block_size):
+            self.pending.append(self.pool.apply_async(_compress_block,
+                [(block[start:start + self.block_size], self.level)]))
+
+        while len(self.pending) > self.processes * 2:
+            self.fileobj.write(self.pending.popleft().get())
+
+    def close(self):
+        try:
+            if self.buffered:
+                self.submit()
+
+            while self.pending:
+                self.fileobj.write(self.pending.popleft().get())
+
+            self.pool.close()
+        except:
+            self.pool.terminate()
+            raise
+        finally:
+            self.pool.join()
+
+        self.seconds = time.time() - self.started
+
+
+CODECS = {
+    'gzip': GzipCompressor,
+    'parallel-gzip': ParallelGzipCompressor,
+}
+
+
+def get_compressor(fileobj, codec=None, **kwargs):
+    codec = codec or BACKUP_CODEC
+    if codec not in CODECS:
+        raise ImproperlyConfigured(u"Unknown BACKUP_CODEC {0}.".format(codec))
+    return CODECS[codec](fileobj, **kwargs)
@@ -0,0 +1,435 @@
+# -*- coding: utf-8 -*-
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import FileField
+from django.utils import timezone
+
+from greenmine.profile.models import Role
+from greenmine.scrum.models import Project, ProjectExtras, ProjectUserRole, \
+    Milestone, UserStory, Task
+from greenmine.questions.models import Question, QuestionResponse
+from greenmine.wiki.models import WikiPage, WikiPageHistory, WikiPageAttachment
+from greenmine.documents.models import Document
+from greenmine.taggit.managers import TaggableManager
+from greenmine.taggit.models import TaggedItem
+
+from .manifest import BackupManifest, get_manifest_path
+from .compress import get_compressor
+
+import logging
+import hashlib
+import base64
+import json
+import io
+import os
+import re
+
+logger = logging.getLogger('greenmine')
+
+BACKUP_FORMAT_VERSION = 1
+BACKUP_EXTENSION = '.json.gz'
+
+# Objects read from the database at once.
+BACKUP_CHUNK_SIZE = getattr(settings, 'BACKUP_CHUNK_SIZE', 500)
+# Bytes of an attached file written in each archive line.
+BACKUP_FILE_CHUNK_SIZE = getattr(settings, 'BACKUP_FILE_CHUNK_SIZE', 512 * 1024)
+# Differential backups made in a row before a new full one.
+BACKUP_MAX_CHAIN_LENGTH = getattr(settings, 'BACKUP_MAX_CHAIN_LENGTH', 24)
+
+EXPORT_PROGRESS_TIMEOUT = 60 * 60 * 24
+
+
+# Exported models in order, so that every object comes after
+# the objects it references.
+EXPORT_MODELS = (ProjectExtras, Project, ProjectUserRole, Milestone, UserStory,
+                 Task, Question, QuestionResponse, WikiPage, WikiPageHistory,
+                 WikiPageAttachment, Document)
+
+# Fields of the referenced users written to backups, enough to match
+# them on import. Passwords and permissions never leave the site.
+EXPORT_USER_FIELDS = ('username', 'email', 'first_name', 'last_name')
+
+
+def get_export_querysets(project):
+    querysets = {
+        ProjectExtras: ProjectExtras.objects.filter(project=project),
+        Project: Project.objects.filter(pk=project.pk),
+        ProjectUserRole: ProjectUserRole.objects.filter(project=project),
+        Milestone: project.milestones.all(),
+        UserStory: project.user_stories.all(),
+        Task: project.tasks.all(),
+        Question: project.questions.all(),
+        QuestionResponse: QuestionResponse.objects.filter(question__project=project),
+        WikiPage: project.wiki_pages.all(),
+        WikiPageHistory: WikiPageHistory.objects.filter(wikipage__project=project),
+        WikiPageAttachment: WikiPageAttachment.objects.filter(wikipage__project=project),
+        Document: project.documents.all(),
+    }
+    return [(model, querysets[model]) for model in EXPORT_MODELS]
+
+
+def get_model_label(model):
+    return u"{0}.{1}".format(model._meta.app_label, model._meta.module_name)
+
+
+def iter_chunks(queryset, chunk_size=BACKUP_CHUNK_SIZE):
+    """
+    Iterate over a queryset in lists of ``chunk_size`` objects,
+    paginating by primary key so that each query stays cheap.
+    """
+
+    queryset = queryset.order_by('pk')
+    last_pk = 0
+
+    while True:
+        objects = list(queryset.filter(pk__gt=last_pk)[:chunk_size])
+        if not objects:
+            break
+
+        yield objects
+        last_pk = objects[-1].pk
+
+
+def serialize_fields(obj, only=None):
+    """
+    Values of the concrete fields of an object, by attribute name
+    (foreign keys as ids and files as their storage names), limited
+    to the attribute names in ``only`` if given.
+    """
+
+    fields = {}
+    for field in obj._meta.local_fields:
+        if field.primary_key or (only is not None and field.attname not in only):
+            continue
+
+        value = field.value_from_object(obj)
+        if isinstance(field, FileField):
+            value = value.name or None
+
+        fields[field.attname] = value
+    return fields
+
+
+class ProjectExporter(object):
+    """
+    Write a project and all its objects to a single compressed stream
+    of json lines. Objects are read in chunks of ``chunk_size`` and
+    attached files in pieces of ``BACKUP_FILE_CHUNK_SIZE`` bytes, so
+    memory use does not depend on the size of the project.
+
+    Users and roles are written the first time they are referenced
+    and attached files just before the objects they belong to.
+    ``progress`` is called with the number of processed and total
+    objects after every chunk.
+
+    Every object and file is recorded in ``manifest``. If the manifest
+    has a base, the backup is differential: only objects whose content
+    hash changed and files that are new or changed are written,
+    followed by the objects deleted since the base backup.
+    """
+
+    def __init__(self, project, chunk_size=BACKUP_CHUNK_SIZE, progress=None,
+                 manifest=None):
+        self.project = project
+        self.chunk_size = chunk_size
+        self.progress = progress
+        self.manifest = manifest if manifest is not None else BackupManifest()
+        self.written = {User: set(), Role: set()}
+        self.counts = {}
+
+    def write(self, fileobj, codec=None):
+        """
+        Write the backup compressed with ``codec`` (``BACKUP_CODEC`` by
+        default) and return the compression statistics.
+        """
+
+        self.stream = get_compressor(fileobj, codec)
+        try:
+            self.write_objects(get_export_querysets(self.project))
+        finally:
+            self.stream.close()
+
+        return self.stream.get_stats()
+
+    def write_objects(self, querysets):
+        total = sum(queryset.count() for model, queryset in querysets)
+        done = 0
+
+        base = self.manifest.base
+        self.write_record({
+            'type': 'header',
+            'version': BACKUP_FORMAT_VERSION,
+            'project': self.project.slug,
+            'created_date': timezone.now(),
+            'total': total,
+            'kind': 'full' if base is None else 'diff',
+            'base': None if base is None else base.chain[-1],
+        })
+
+        for model, queryset in querysets:
+            for objects in iter_chunks(queryset, self.chunk_size):
+                self.write_chunk(model, objects)
+
+                done += len(objects)
+                if self.progress is not None:
+                    self.progress(done, total)
+
+        for label, pk in self.manifest.iter_deleted():
+            self.write_record({'type': 'delete', 'model': label, 'pk': pk})
+
+        self.write_record({'type': 'end', 'counts': self.counts})
+
+    def write_record(self, record):
+        self.stream.write(json.dumps(record, cls=DjangoJSONEncoder, separators=(',', ':')))
+        self.stream.write('\n')
+
+    def write_chunk(self, model, objects):
+        m2m = self.get_m2m(model, objects)
+        tags = self.get_tags(model, objects)
+        file_fields = [x for x in model._meta.local_fields if isinstance(x, FileField)]
+
+        label = get_model_label(model)
+        changed = []
+        for obj in objects:
+            record = {
+                'type': 'object',
+                'model': label,
+                'pk': obj.pk,
+                'fields': serialize_fields(obj),
+            }
+
+            obj_m2m = dict((name, values.get(obj.pk, [])) for name, values in m2m.items())
+            if obj_m2m:
+                record['m2m'] = obj_m2m
+            if tags is not None:
+                record['tags'] = tags.get(obj.pk, [])
+
+            digest = hashlib.sha1(json.dumps(record, cls=DjangoJSONEncoder,
+                                             sort_keys=True)).hexdigest()
+            if self.manifest.add_object(label, obj.pk, digest):
+                changed.append((obj, record))
+            else:
+                for field in file_fields:
+                    self.manifest.keep_file(getattr(obj, field.attname).name)
+
+        self.write_dependencies(model, [obj for obj, record in changed], m2m)
+
+        for obj, record in changed:
+            for field in file_fields:
+                self.write_file(getattr(obj, field.attname))
+            self.write_record(record)
+
+        self.counts[label] = self.counts.get(label, 0) + len(changed)
+
+    def write_dependencies(self, model, objects, m2m):
+        """
+        Write the users and roles referenced by a chunk of objects
+        that are not in the stream yet.
+        """
+
+        for related_model in (User, Role):
+            ids = set()
+            for field in model._meta.local_fields:
+                if field.rel is not None and field.rel.to is related_model:
+                    ids.update(getattr(obj, field.attname) for obj in objects)
+
+            for field in model._meta.many_to_many:
+                if field.name in m2m and field.rel.to is related_model:
+                    for obj in objects:
+                        ids.update(m2m[field.name].get(obj.pk, []))
+
+            ids.discard(None)
+            ids -= self.written[related_model]
+            if not ids:
+                continue
+
+            label = get_model_label(related_model)
+            only = EXPORT_USER_FIELDS if related_model is User else None
+            for obj in related_model.objects.filter(pk__in=ids).order_by('pk'):
+                self.write_record({
+                    'type': 'object',
+                    'model': label,
+                    'pk': obj.pk,
+                    'fields': serialize_fields(obj, only),
+                })
+
+            self.written[related_model].update(ids)
+
+    def get_m2m(self, model, objects):
+        """
+        Related ids of the many to many fields of a chunk of objects,
+        as a dict of ``{field name: {object id: [related ids]}}``.
+        """
+
+        result = {}
+        pks = [x.pk for x in objects]
+
+        for field in model._meta.many_to_many:
+            if isinstance(field, TaggableManager):
+                continue
+
+            through = field.rel.through
+            if not through._meta.auto_created:
+                continue
+
+            source, target = field.m2m_field_name(), field.m2m_reverse_field_name()
+            rows = through.objects.filter(**{"{0}__in".format(source): pks})\
+                .order_by('pk').values_list(source, target)
+
+            values = result[field.name] = {}
+            for source_id, target_id in rows:
+                values.setdefault(source_id, []).append(target_id)
+
+        return result
+
+    def get_tags(self, model, objects):
+        if not any(isinstance(x, TaggableManager) for x in model._meta.many_to_many):
+            return None
+
+        rows = TaggedItem.objects.filter(
+            content_type = ContentType.objects.get_for_model(model),
+            object_id__in = [x.pk for x in objects],
+        ).order_by('tag__id').values_list('object_id', 'tag__name')
+
+        tags = {}
+        for object_id, name in rows:
+            tags.setdefault(object_id, []).append(name)
+        return tags
+
+    def write_file(self, fieldfile):
+        if not fieldfile:
+            return
+
+        try:
+            # Storage names are never reused, so the size is enough
+            # to tell if a file changed without reading it.
+            if not self.manifest.add_file(fieldfile.name, fieldfile.size):
+                return
+            fieldfile.open('rb')
+        except (IOError, OSError):
+            logger.warning(u"Backup of %s: missing file %s", self.project.slug, fieldfile.name)
+            return
+
+        try:
+            empty = True
+            for data in fieldfile.chunks(BACKUP_FILE_CHUNK_SIZE):
+                self.write_record({'type': 'file', 'name': fieldfile.name,
+                                   'data': base64.b64encode(data)})
+                empty = False
+
+            if empty:
+                self.write_record({'type': 'file', 'name': fieldfile.name, 'data': ''})
+        finally:
+            fieldfile.close()
+
+
+def get_backup_filename(project, differential=False):
+    return u"{0}-{1}{2}{3}".format(project.slug, timezone.now().strftime("%Y%m%d-%H%M%S"),
+        "-diff" if differential else "", BACKUP_EXTENSION)
+
+
+_backup_filename_re = re.compile(r"^(?P<slug>[\w\-]+)-\d{8}-\d{6}(?P<diff>-diff)?"
+                                 + re.escape(BACKUP_EXTENSION) + "$")
+
+
+def parse_backup_filename(name):
+    """
+    Project slug and kind ('full' or 'diff') of a backup file name,
+    or None if it is not a backup.
+    """
+
+    match = _backup_filename_re.match(name)
+    if match is None:
+        return None
+    return match.group('slug'), 'diff' if match.group('diff') else 'full'
+
+
+def list_backups(project=None):
+    """
+    Backups in ``BACKUP_PATH``, optionally only those of a project,
+    as dicts with the file name (``path``) and size.
+    """
+
+    for name in sorted(os.listdir(settings.BACKUP_PATH)):
+        parsed = parse_backup_filename(name)
+        if parsed is None:
+            continue
+        if project is not None and parsed[0] != project.slug:
+            continue
+
+        path = os.path.join(settings.BACKUP_PATH, name)
+        yield {'path': name, 'size': os.path.getsize(path)}
+
+
+def get_export_progress_key(project):
+    return "project-export-progress:{0}".format(project.pk)
+
+
+def get_export_progress(project):
+    return cache.get(get_export_progress_key(project))
+
+
+def get_last_manifest(project):
+    """
+    Manifest of the last backup of a project, if any.
+    """
+
+    for backup in reversed(list(list_backups(project))):
+        path = os.path.join(settings.BACKUP_PATH, backup['path'])
+        manifest = BackupManifest.load(get_manifest_path(path))
+        if manifest is not None:
+            return manifest
+    return None
+
+
+def export_project(project, progress=None, differential=False, codec=None):
+    """
+    Write a backup of a project to ``BACKUP_PATH`` and return its
+    path and the compression statistics. The archive is written with
+    a temporary name and renamed when complete, so partial backups
+    are never listed.
+
+    A differential backup only holds the changes since the previous
+    backup; it is full anyway if there is no previous one or its chain
+    already has ``BACKUP_MAX_CHAIN_LENGTH`` backups.
+
+    ``codec`` overrides ``BACKUP_CODEC``.
+    """
+
+    base = get_last_manifest(project) if differential else None
+    if base is not None and len(base.chain) >= BACKUP_MAX_CHAIN_LENGTH:
+        base = None
+
+    filename = get_backup_filename(project, differential=base is not None)
+    manifest = BackupManifest(filename, base)
+
+    path = os.path.join(settings.BACKUP_PATH, filename)
+    partial_path = path + '.part'
+
+    try:
+        with io.open(partial_path, 'wb') as f:
+            stats = ProjectExporter(project, progress=progress, manifest=manifest).write(f, codec)
+        manifest.save(get_manifest_path(path))
+    except:
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+        raise
+
+    os.rename(partial_path, path)
+    logger.info(u"Backup of %s: %s bytes compressed to %s in %.1f seconds (%.1f MB/s)",
+        project.slug, stats['bytes_in'], stats['bytes_out'], stats['seconds'],
+        stats['throughput'] / (1024 * 1024))
+
+    # The backup is written; a failing catalog is synced again
+    # by the export page.
+    from greenmine.base.models import ExportDirectoryCache
+    try:
+        ExportDirectoryCache.objects.sync()
+    except Exception:
+        logger.exception(u"Backup of %s: cannot sync the export directory catalog", project.slug)
+
+    return path, stats
@@ -0,0 +1,463 @@
+# -*- coding: utf-8 -*-
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.contrib.contenttypes.models import ContentType
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.db import transaction, IntegrityError
+from django.db.models import FileField, get_model
+
+from greenmine.core.utils.slug import slugify_uniquely
+from greenmine.profile.models import Role
+from greenmine.scrum.models import Project, ProjectExtras, ReferenceCounter, \
+    Milestone, UserStory, Task
+from greenmine.wiki.models import WikiPage
+from greenmine.search.models import SearchIndexQueueItem
+from greenmine.taggit.models import Tag, TaggedItem
+
+from .exporter import BACKUP_FORMAT_VERSION, EXPORT_MODELS, EXPORT_USER_FIELDS, \
+    get_model_label, iter_chunks
+from .manifest import BackupManifest, get_manifest_path
+
+import tempfile
+import base64
+import gzip
+import json
+import uuid
+import os
+
+BACKUP_IMPORT_BATCH_SIZE = getattr(settings, 'BACKUP_IMPORT_BATCH_SIZE', 500)
+
+# Field used to find the primary keys of objects created in bulk,
+# which are not returned by bulk_create.
+IMPORT_KEY_FIELDS = {
+    'scrum.milestone': 'uuid',
+    'scrum.userstory': 'uuid',
+    'scrum.task': 'uuid',
+    'questions.question': 'slug',
+    'wiki.wikipage': 'slug',
+    'documents.document': 'slug',
+}
+
+# Models referenced by others, whose id maps are kept until the end.
+REFERENCED_MODELS = ('scrum.milestone', 'scrum.userstory', 'questions.question',
+                     'wiki.wikipage')
+
+SEARCH_INDEXED_MODELS = ('scrum.userstory', 'scrum.task', 'wiki.wikipage',
+                         'questions.question', 'documents.document')
+
+
+class BackupImportError(Exception):
+    pass
+
+
+class ProjectImporter(object):
+    """
+    Create a new project from a backup written by ``ProjectExporter``.
+
+    The archive is read line by line and objects are inserted with
+    ``bulk_create`` in batches of ``batch_size``, in the order of the
+    archive, which puts every object after the ones it references.
+    Ids are remapped to the new objects; only the id maps of models
+    referenced by other objects are kept for the whole import. Users
+    and roles are matched by username and slug and created if missing;
+    created users are inactive, without password or permissions, and
+    only take the identifying fields of the backup.
+
+    Everything runs in a single transaction: a failing or truncated
+    import leaves no trace in the database.
+    """
+
+    def __init__(self, name=None, slug=None, batch_size=BACKUP_IMPORT_BATCH_SIZE):
+        self.name = name
+        self.slug = slug
+        self.batch_size = batch_size
+
+        self.project = None
+        self.ids = {}
+        self.files = {}
+        self.tags = {}
+        self.counts = {}
+        self.max_refs = {'us': 0, 'task': 0}
+
+        self.pending_model = None
+        self.pending = []
+        self.current_file = None
+
+    def run(self, fileobj):
+        return self.run_records(iter_archive_records(fileobj))
+
+    def run_records(self, records):
+        with transaction.commit_on_success():
+            self.read(records)
+            self.finish()
+        return self.project
+
+    def read(self, records):
+        header, end = None, None
+
+        for record in records:
+            if record['type'] != 'file':
+                self.close_file()
+
+            if header is None:
+                if record['type'] != 'header' or record['version'] != BACKUP_FORMAT_VERSION:
+                    raise BackupImportError("Not a project backup or unsupported version.")
+                if record.get('kind', 'full') != 'full':
+                    raise BackupImportError("A differential backup is restored with its chain.")
+                header = record
+            elif record['type'] == 'object':
+                self.read_object(record)
+            elif record['type'] == 'file':
+                self.read_file(record)
+            elif record['type'] == 'end':
+                end = record
+
+        self.close_file()
+        self.flush()
+
+        if end is None:
+            raise BackupImportError("The backup is truncated.")
+        if end['counts'] != self.counts:
+            raise BackupImportError("The backup is inconsistent.")
+
+    def read_object(self, record):
+        model = get_model(*record['model'].split('.'))
+
+        if model is User:
+            self.import_user(record)
+        elif model is Role:
+            self.import_role(record)
+        elif model in (ProjectExtras, Project):
+            self.import_single(model, record)
+        else:
+            if model is not self.pending_model or len(self.pending) >= self.batch_size:
+                self.flush()
+                self.pending_model = model
+            self.pending.append(record)
+
+    def read_file(self, record):
+        if self.current_file is None or self.current_file[0] != record['name']:
+            self.close_file()
+            self.current_file = (record['name'], tempfile.TemporaryFile())
+
+        self.current_file[1].write(base64.b64decode(record['data']))
+
+    def close_file(self):
+        if self.current_file is None:
+            return
+
+        name, tmp = self.current_file
+        self.current_file = None
+
+        content = File(tmp, name=name)
+        content.size = tmp.tell()
+        self.files[name] = default_storage.save(name, content)
+        tmp.close()
+
+    def set_id(self, model, old_id, new_id):
+        self.ids.setdefault(model, {})[old_id] = new_id
+
+    def build_fields(self, model, record):
+        """
+        Field values of a record with the references remapped to
+        the imported objects.
+        """
+
+        fields = {}
+        for field in model._meta.local_fields:
+            if field.primary_key or field.attname not in record['fields']:
+                continue
+
+            value = record['fields'][field.attname]
+            if value is not None and field.rel is not None:
+                value = self.ids.get(field.rel.to, {}).get(value)
+                if value is None and not field.null:
+                    raise BackupImportError(u"{0} {1} references a missing {2}.".format(
+                        record['model'], record['pk'], get_model_label(field.rel.to)))
+
+            elif value is not None and isinstance(field, FileField):
+                value = self.files.get(value, value)
+
+            elif value is not None:
+                value = field.to_python(value)
+
+            fields[field.attname] = value
+
+        if 'uuid' in fields:
+            fields['uuid'] = unicode(uuid.uuid1())
+        return fields
+
+    def import_user(self, record):
+        fields = dict((name, record['fields'][name]) for name in EXPORT_USER_FIELDS
+                      if record['fields'].get(name) is not None)
+
+        users = list(User.objects.filter(username=fields['username'])[:1])
+        if users:
+            user = users[0]
+        else:
+            user = User(is_active=False, **fields)
+            user.set_unusable_password()
+            user.save()
+
+        self.set_id(User, record['pk'], user.pk)
+
+    def import_role(self, record):
+        fields = self.build_fields(Role, record)
+        roles = list(Role.objects.filter(slug=fields['slug'])[:1])
+        if roles:
+            role = roles[0]
+        else:
+            role = Role.objects.create(**fields)
+
+        self.set_id(Role, record['pk'], role.pk)
+
+    def import_single(self, model, record):
+        self.flush()
+        fields = self.build_fields(model, record)
+
+        if model is Project:
+            fields['name'] = self.name or fields['name']
+            fields['slug'] = self.slug or fields['slug']
+
+            if Project.objects.filter(slug=fields['slug']).exists() or \
+                    Project.objects.filter(name=fields['name']).exists():
+                raise BackupImportError(u"A project named {0} already exists.".format(fields['slug']))
+
+        obj = model.objects.create(**fields)
+        if model is Project:
+            self.project = obj
+
+        self.set_id(model, record['pk'], obj.pk)
+        label = get_model_label(model)
+        self.counts[label] = self.counts.get(label, 0) + 1
+
+    def flush(self):
+        """
+        Insert the pending batch of objects of one model.
+        """
+
+        if not self.pending:
+            return
+
+        model, records = self.pending_model, self.pending
+        self.pending = []
+
+        label = get_model_label(model)
+        key_field = IMPORT_KEY_FIELDS.get(label)
+        objects = [model(**self.build_fields(model, record)) for record in records]
+
+        if model in (UserStory, Task):
+            name = 'us' if model is UserStory else 'task'
+            refs = [int(x.ref) for x in objects if x.ref and x.ref.isdigit()]
+            self.max_refs[name] = max([self.max_refs[name]] + refs)
+
+        new_ids = {}
+        if key_field == 'slug' and model._meta.get_field('slug').unique:
+            new_ids = self.bulk_create_unique_slugs(model, objects, records)
+        else:
+            self.bulk_create(model, objects)
+
+        if key_field is not None:
+            keys = dict((getattr(obj, key_field), record['pk'])
+                for obj, record in zip(objects, records) if record['pk'] not in new_ids)
+
+            queryset = model.objects.filter(project=self.project,
+                **{"{0}__in".format(key_field): keys.keys()})
+
+            for key, pk in queryset.values_list(key_field, 'pk'):
+                new_ids[keys[key]] = pk
+
+            if len(new_ids) != len(records):
+                raise BackupImportError(u"Duplicated {0} in {1} objects.".format(key_field, label))
+
+            self.import_m2m(model, records, new_ids)
+            self.import_tags(model, records, new_ids)
+
+            if label in SEARCH_INDEXED_MODELS:
+                content_type = ContentType.objects.get_for_model(model)
+                SearchIndexQueueItem.objects.bulk_create([SearchIndexQueueItem(
+                    content_type=content_type, object_id=pk) for pk in new_ids.values()])
+
+            if label in REFERENCED_MODELS:
+                self.ids.setdefault(model, {}).update(new_ids)
+
+        self.counts[label] = self.counts.get(label, 0) + len(records)
+
+    def bulk_create(self, model, objects):
+        sid = transaction.savepoint()
+        try:
+            model.objects.bulk_create(objects)
+        except:
+            transaction.savepoint_rollback(sid)
+            raise
+        transaction.savepoint_commit(sid)
+
+    def bulk_create_unique_slugs(self, model, objects, records, retries=5):
+        """
+        Insert objects whose slug is unique among all projects. Objects
+        with a taken slug are saved one by one with a new slug; their ids
+        are returned by old id. A slug taken concurrently makes the batch
+        fail, and it is retried inside its savepoint.
+        """
+
+        while True:
+            slugs = [x.slug for x in objects]
+            taken = set(model.objects.filter(slug__in=slugs).values_list('slug', flat=True))
+
+            free, clashing, seen = [], [], set()
+            for obj, record in zip(objects, records):
+                if obj.slug in taken or obj.slug in seen:
+                    clashing.append((obj, record))
+                else:
+                    free.append(obj)
+                    seen.add(obj.slug)
+
+            sid = transaction.savepoint()
+            try:
+                model.objects.bulk_create(free)
+            except IntegrityError:
+                transaction.savepoint_rollback(sid)
+                if retries <= 0:
+                    raise
+                retries -= 1
+                continue
+
+            transaction.savepoint_commit(sid)
+            break
+
+        new_ids = {}
+        for obj, record in clashing:
+            obj.slug = slugify_uniquely(obj.slug, model)
+            obj.save()
+            new_ids[record['pk']] = obj.pk
+        return new_ids
+
+    def import_m2m(self, model, records, new_ids):
+        for field in model._meta.many_to_many:
+            through = getattr(field.rel, 'through', None)
+            if through is None or not through._meta.auto_created:
+                continue
+
+            source = through._meta.get_field(field.m2m_field_name()).attname
+            target = through._meta.get_field(field.m2m_reverse_field_name()).attname
+            target_ids = self.ids.get(field.rel.to, {})
+
+            rows = []
+            for record in records:
+                for value in record.get('m2m', {}).get(field.name, []):
+                    if value in target_ids:
+                        rows.append(through(**{source: new_ids[record['pk']],
+                                               target: target_ids[value]}))
+
+            if rows:
+                through.objects.bulk_create(rows)
+
+    def import_tags(self, model, records, new_ids):
+        content_type = ContentType.objects.get_for_model(model)
+
+        rows = []
+        for record in records:
+            for name in record.get('tags', []):
+                if name not in self.tags:
+                    self.tags[name] = Tag.objects.get_or_create(name=name)[0].pk
+
+                rows.append(TaggedItem(content_type=content_type,
+                    object_id=new_ids[record['pk']], tag_id=self.tags[name]))
+
+        if rows:
+            TaggedItem.objects.bulk_create(rows)
+
+    def finish(self):
+        if self.project is None:
+            raise BackupImportError("The backup has no project.")
+
+        # References continue after the highest imported one.
+        for name, max_ref in self.max_refs.items():
+            last_ref = getattr(self.project, 'last_{0}_ref'.format(name)) or 0
+            ReferenceCounter.objects.create(project=self.project, name=name,
+                                            value=max(max_ref, last_ref))
+
+        for pages in iter_chunks(WikiPage.objects.filter(project=self.project)):
+            for page in pages:
+                page.update_links()
+
+        # The points counters of the archive may be stale, and bulk_create
+        # skips the signals that keep them up to date.
+        for milestones in iter_chunks(Milestone.objects.filter(project=self.project)):
+            for milestone in milestones:
+                milestone.update_points_counters()
+
+        self.project.update_points_counters()
+
+
+def iter_archive_records(fileobj):
+    for line in gzip.GzipFile(fileobj=fileobj, mode='rb'):
+        yield json.loads(line)
+
+
+def iter_chain_records(manifest, directory):
+    """
+    Records of the project state saved by the last backup of a chain,
+    as a single full backup. Each archive holds its objects in the
+    order of ``EXPORT_MODELS``, so they are all read side by side once:
+    for every model, each archive (oldest first, so that files come
+    before newer objects using them) gives the objects that the
+    manifest says it holds. Users and roles are always passed on.
+    """
+
+    positions = dict((get_model_label(model), x) for x, model in enumerate(EXPORT_MODELS))
+    streams, header = [], None
+
+    for name in manifest.chain:
+        f = open(os.path.join(directory, name), 'rb')
+        records = iter_archive_records(f)
+        header = next(records)
+        streams.append([f, records, next(records, None)])
+
+    header = dict(header, kind='full', base=None)
+    yield header
+
+    counts = {}
+    try:
+        for position in xrange(len(EXPORT_MODELS)):
+            for index, stream in enumerate(streams):
+                f, records, record = stream
+
+                while record is not None and record['type'] in ('object', 'file'):
+                    if record['type'] == 'file':
+                        if manifest.get_file_index(record['name']) == index:
+                            yield record
+                    elif record['model'] not in positions:
+                        yield record
+                    elif positions[record['model']] > position:
+                        break
+                    elif manifest.get_index(record['model'], record['pk']) == index:
+                        counts[record['model']] = counts.get(record['model'], 0) + 1
+                        yield record
+
+                    record = next(records, None)
+
+                stream[2] = record
+    finally:
+        for f, records, record in streams:
+            f.close()
+
+    yield {'type': 'end', 'counts': counts}
+
+
+def import_project(path, name=None, slug=None):
+    """
+    Create a project from a backup. A differential backup is restored
+    together with the backups it is based on, found next to it.
+    """
+
+    importer = ProjectImporter(name=name, slug=slug)
+
+    manifest = BackupManifest.load(get_manifest_path(path))
+    if manifest is not None and len(manifest.chain) > 1:
+        return importer.run_records(iter_chain_records(manifest, os.path.dirname(path)))
+
+    with open(path, 'rb') as f:
+        return importer.run(f)
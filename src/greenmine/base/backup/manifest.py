@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+
+import gzip
+import json
+import os
+
+
+def get_manifest_path(path):
+    return path + '.manifest'
+
+
+class BackupManifest(object):
+    """
+    Content hashes of the objects and attached files saved by a
+    backup, and for each of them the index in ``chain`` of the backup
+    that holds its data. A full backup is a chain of one; every
+    differential backup extends the chain of the one it is based on
+    and only holds what changed since, so the manifest of the last
+    backup describes the whole state of the project.
+    """
+
+    def __init__(self, name=None, base=None):
+        self.base = base
+        self.chain = (base.chain if base is not None else []) + [name]
+        self.objects = {}
+        self.files = {}
+
+    @property
+    def index(self):
+        return len(self.chain) - 1
+
+    def _add(self, entries, base_entries, key, digest):
+        previous = base_entries.get(key)
+        if previous is not None and previous[0] == digest:
+            entries[key] = previous
+            return False
+
+        entries[key] = [digest, self.index]
+        return True
+
+    def add_object(self, label, pk, digest):
+        """
+        Record an object and return whether it must be written,
+        that is if it is new or changed since the base backup.
+        """
+        base_objects = self.base.objects.get(label, {}) if self.base is not None else {}
+        return self._add(self.objects.setdefault(label, {}), base_objects, str(pk), digest)
+
+    def add_file(self, name, digest):
+        base_files = self.base.files if self.base is not None else {}
+        return self._add(self.files, base_files, name, digest)
+
+    def keep_file(self, name):
+        """
+        Record a file of an unchanged object as held by the backup
+        that holds the object.
+        """
+        if self.base is not None and name in self.base.files:
+            self.files[name] = self.base.files[name]
+
+    def iter_deleted(self):
+        """
+        Objects of the base backup that are gone in this one.
+        """
+        if self.base is None:
+            return
+
+        for label, objects in self.base.objects.items():
+            current = self.objects.get(label, {})
+            for key in objects:
+                if key not in current:
+                    yield label, int(key)
+
+    def get_index(self, label, pk):
+        return self.objects.get(label, {}).get(str(pk), (None, None))[1]
+
+    def get_file_index(self, name):
+        return self.files.get(name, (None, None))[1]
+
+    def save(self, path):
+        with open(path, 'wb') as f:
+            stream = gzip.GzipFile(fileobj=f, mode='wb')
+            json.dump({'chain': self.chain, 'objects': self.objects,
+                       'files': self.files}, stream, separators=(',', ':'))
+            stream.close()
+
+    @classmethod
+    def load(cls, path):
+        if not os.path.exists(path):
+            return None
+
+        with open(path, 'rb') as f:
+            data = json.load(gzip.GzipFile(fileobj=f, mode='rb'))
+
+        manifest = cls()
+        manifest.chain = data['chain']
+        manifest.objects = data['objects']
+        manifest.files = data['files']
+        return manifest
@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+
+import struct
+import time
+import zlib
+
+ZIP_DEFLATED_LEVEL = 6
+
+# Sizes and crc of each file go in a data descriptor after its data,
+# so that the archive can be written without seeking back.
+_FLAG_DATA_DESCRIPTOR = 0x08
+_FLAG_UTF8 = 0x800
+_VERSION = 20
+_METHOD_DEFLATED = 8
+
+
+def _dos_datetime(timestamp):
+    t = time.localtime(timestamp)
+    dos_date = (t.tm_year - 1980) << 9 | t.tm_mon << 5 | t.tm_mday
+    dos_time = t.tm_hour << 11 | t.tm_min << 5 | t.tm_sec // 2
+    return dos_time, dos_date
+
+
+class ZipStream(object):
+    """
+    Write a deflated zip archive as an iterator of strings, for
+    responses whose size is not known in advance. Each file is read
+    from an iterator of strings and compressed as it is consumed.
+
+    Usage::
+
+        archive = ZipStream()
+        for name, chunks in files:
+            for data in archive.write_iter(name, chunks):
+                yield data
+        for data in archive.close():
+            yield data
+
+    Archives and files over 4GiB (zip64) are not supported.
+    """
+
+    def __init__(self, level=ZIP_DEFLATED_LEVEL):
+        self.level = level
+        self.entries = []
+        self.offset = 0
+
+    def _emit(self, data):
+        self.offset += len(data)
+        return data
+
+    def write_iter(self, name, chunks):
+        if isinstance(name, unicode):
+            name = name.encode('utf-8')
+            flags = _FLAG_DATA_DESCRIPTOR | _FLAG_UTF8
+        else:
+            flags = _FLAG_DATA_DESCRIPTOR
+
+        dos_time, dos_date = _dos_datetime(time.time())
+        header_offset = self.offset
+
+        yield self._emit(struct.pack('<4s5H3L2H', 'PK\x03\x04', _VERSION, flags,
+            _METHOD_DEFLATED, dos_time, dos_date, 0, 0, 0, len(name), 0) + name)
+
+        compressor = zlib.compressobj(self.level, zlib.DEFLATED, -zlib.MAX_WBITS)
+        crc, size, compressed_size = 0, 0, 0
+
+        for chunk in chunks:
+            if not chunk:
+                continue
+
+            crc = zlib.crc32(chunk, crc)
+            size += len(chunk)
+
+            data = compressor.compress(chunk)
+            if data:
+                compressed_size += len(data)
+                yield self._emit(data)
+
+        data = compressor.flush()
+        compressed_size += len(data)
+        crc &= 0xffffffff
+
+        yield self._emit(data + struct.pack('<4s3L', 'PK\x07\x08', crc, compressed_size, size))
+
+        self.entries.append((name, flags, dos_time, dos_date, crc,
+                             compressed_size, size, header_offset))
+
+    def close(self):
+        directory_offset = self.offset
+
+        for name, flags, dos_time, dos_date, crc, compressed_size, size, header_offset in self.entries:
+            yield self._emit(struct.pack('<4s6H3L5H2L', 'PK\x01\x02', _VERSION, _VERSION,
+                flags, _METHOD_DEFLATED, dos_time, dos_date, crc, compressed_size, size,
+                len(name), 0, 0, 0, 0, 0600 << 16, header_offset) + name)
+
+        directory_size = self.offset - directory_offset
+        yield self._emit(struct.pack('<4s4H2LH', 'PK\x05\x06', 0, 0, len(self.entries),
+            len(self.entries), directory_size, directory_offset, 0))
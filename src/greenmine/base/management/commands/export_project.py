@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+
+from django.core.management.base import BaseCommand
+
+from greenmine.scrum.models import Project
+from greenmine.base.backup.exporter import export_project
+
+from optparse import make_option
+
+
+class Command(BaseCommand):
+    args = '<project_slug project_slug ...>'
+    help = "Write a backup of projects to BACKUP_PATH."
+
+    option_list = BaseCommand.option_list + (
+        make_option('--differential', action='store_true', dest='differential', default=False,
+            help='Only write the changes since the previous backup of each project.'),
+    )
+
+    def handle(self, *args, **options):
+        queryset = Project.objects.all()
+        if args:
+            queryset = queryset.filter(slug__in=args)
+
+        for project in queryset.iterator():
+            def progress(done, total):
+                self.stdout.write("\r%s: %s/%s objects" % (repr(project), done, total))
+
+            path, stats = export_project(project, progress=progress,
+                                         differential=options['differential'])
+            self.stdout.write("\n%s: %s (%.1f MB/s compressed)\n" % (repr(project), path,
+                              stats['throughput'] / (1024 * 1024)))
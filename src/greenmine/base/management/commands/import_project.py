@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+
+from django.core.management.base import BaseCommand, CommandError
+
+from greenmine.base.backup.importer import import_project, BackupImportError
+
+from optparse import make_option
+
+
+class Command(BaseCommand):
+    args = '<backup_path>'
+    help = "Create a new project from a backup written by export_project."
+
+    option_list = BaseCommand.option_list + (
+        make_option('--name', dest='name', default=None,
+            help='Name of the new project (the original one by default).'),
+        make_option('--slug', dest='slug', default=None,
+            help='Slug of the new project (the original one by default).'),
+    )
+
+    def handle(self, *args, **options):
+        if len(args) != 1:
+            raise CommandError("A backup path is required.")
+
+        try:
+            project = import_project(args[0], name=options['name'], slug=options['slug'])
+        except BackupImportError as e:
+            raise CommandError(unicode(e))
+
+        self.stdout.write("%s: imported\n" % (repr(project)))
@@ -1,13 +1,21 @@
 # -*- coding: utf-8 -*-
 
+from django.conf import settings
+from django.core.cache import cache
 from django.db.models import signals
 from django.dispatch import receiver
-from django.db import models
-from django.utils.timezone import now
+from django.db import models, transaction, IntegrityError
+from django.utils.timezone import now, utc
 
-from ..scrum.models import Project, UserStory, Task
+from ..scrum.models import ReferenceCounter, UserStory, Task
 
+import datetime
 import uuid
+import os
+
+# Seconds the export directory catalog is trusted before the
+# export page syncs it again.
+BACKUP_CATALOG_MAX_AGE = getattr(settings, 'BACKUP_CATALOG_MAX_AGE', 300)
 
 # Centralized uuid attachment and ref generation
 
@@ -30,12 +38,80 @@ def attach_uuid(sender, instance, **kwargs):
 @receiver(signals.pre_save, sender=Task)
 @receiver(signals.pre_save, sender=UserStory)
 def attach_unique_reference(sender, instance, **kwargs):
-    project = Project.objects.select_for_update().filter(pk=instance.project_id).get()
-    if isinstance(instance, Task):
-        project.last_task_ref += 1
-        instance.ref = project.last_task_ref
-    else:
-        project.last_us_ref += 1
-        instance.ref = project.last_us_ref
-
-    project.save()
+    # Objects created in bulk come with refs already allocated.
+    if not instance.ref:
+        instance.ref = ReferenceCounter.objects.allocate(instance.project_id, sender)[0]
+
+
+class ExportDirectoryCacheManager(models.Manager):
+    def sync(self, retries=3):
+        """
+        Bring the catalog in line with the backups in ``BACKUP_PATH``:
+        new files are inserted in bulk, vanished ones deleted and only
+        files whose size or mtime changed are updated. The catalog is
+        never emptied while syncing.
+
+        A concurrent sync inserting the same files makes the insert
+        fail; the sync is then run again over the updated catalog.
+        """
+        while True:
+            try:
+                return self._sync()
+            except IntegrityError:
+                if retries <= 0:
+                    raise
+                retries -= 1
+
+    def _sync(self):
+        from .backup.exporter import parse_backup_filename
+
+        catalog = dict((x[0], x[1:]) for x in
+                       self.values_list('path', 'pk', 'size', 'mtime'))
+        found, new, changed = set(), [], []
+
+        for name in os.listdir(settings.BACKUP_PATH):
+            parsed = parse_backup_filename(name)
+            if parsed is None:
+                continue
+
+            try:
+                stat = os.stat(os.path.join(settings.BACKUP_PATH, name))
+            except OSError:
+                continue
+
+            found.add(name)
+            mtime = datetime.datetime.fromtimestamp(int(stat.st_mtime), utc)
+
+            if name not in catalog:
+                new.append(self.model(path=name, project_slug=parsed[0], kind=parsed[1],
+                                      size=stat.st_size, mtime=mtime))
+            elif catalog[name][1:] != (stat.st_size, mtime):
+                changed.append((catalog[name][0], stat.st_size, mtime))
+
+        with transaction.commit_on_success():
+            for pk, size, mtime in changed:
+                self.filter(pk=pk).update(size=size, mtime=mtime)
+
+            self.filter(path__in=set(catalog) - found).delete()
+            self.bulk_create(new)
+
+    def refresh(self, max_age=BACKUP_CATALOG_MAX_AGE):
+        """
+        Sync the catalog unless it was synced in the last
+        ``max_age`` seconds.
+        """
+        if cache.add("export-directory-synced", True, max_age):
+            self.sync()
+
+
+class ExportDirectoryCache(models.Model):
+    path = models.CharField(max_length=500, unique=True)
+    project_slug = models.CharField(max_length=250, db_index=True)
+    kind = models.CharField(max_length=10, default='full')
+    size = models.BigIntegerField()
+    mtime = models.DateTimeField()
+
+    objects = ExportDirectoryCacheManager()
+
+    class Meta:
+        ordering = ['-mtime']
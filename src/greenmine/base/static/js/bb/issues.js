@@ -205,22 +205,25 @@ Greenmine.TasksView = Backbone.View.extend({
         _.bindAll(this);
 
         Greenmine.taskCollection.on("reset", this.reset);
+        Greenmine.taskCollection.on("add", this.addIssue);
         Greenmine.taskCollection.on("remove", this.deleteIssue);
 
         this.lightbox = new Greenmine.Lightbox({el: $("#issues-delete-dialog")});
         this.lightbox.on('delete', this.deleteIssue);
 
         this._milestone_id = this.$el.data('milestone');
-        this._order = "created_date";
-        this._order_mod = "-";
         this._status = "";
+        this._next_cursor = this.$el.data('next-cursor') || null;
+        this._loading_page = false;
 
-        var order_by = getUrlVars()["order_by"];
-        if (order_by === undefined){
-            this.options.order_by = "-priority";
-        } else {
-            this.options.order_by = order_by;
-        }
+        $(window).on("scroll", this.onWindowScroll);
+
+        // Start from the ordering of the page, which the cursor of
+        // its next page is bound to.
+        var order_by = getUrlVars()["order_by"] || "-created_date";
+        this.options.order_by = order_by;
+        this._order_mod = order_by.charAt(0) == "-" ? "-" : "";
+        this._order = order_by.replace(/^-/, "");
 
         this.options.tag_filter = getIntListFromURLParam('tags');
         this.options.milestone_filter = getIntListFromURLParam('milestone');
@@ -279,8 +282,10 @@ Greenmine.TasksView = Backbone.View.extend({
             history.pushState({}, "issues ", "?"+$.param(post_data));
         }
 
+        var self = this;
+
         $.get(url, post_data, function(data) {
-            console.log(data);
+            self._next_cursor = data.next_cursor;
             Greenmine.Filters.tagCollection.reset(data.filter_dict.tags);
             Greenmine.Filters.statusCollection.reset(data.filter_dict.status);
             Greenmine.Filters.assignedToCollection.reset(data.filter_dict.assigned_to);
@@ -290,6 +295,32 @@ Greenmine.TasksView = Backbone.View.extend({
         }, 'json');
     },
 
+    loadNextPage: function() {
+        if (!this._next_cursor || this._loading_page) {
+            return;
+        }
+
+        var self = this;
+        var url = this.$el.data('tasks-url');
+        var post_data = this.collectPostData();
+        post_data.cursor = this._next_cursor;
+
+        this._loading_page = true;
+        $.get(url, post_data, function(data) {
+            self._next_cursor = data.next_cursor;
+            Greenmine.taskCollection.add(data.tasks);
+        }, 'json').always(function() {
+            self._loading_page = false;
+        });
+    },
+
+    onWindowScroll: function() {
+        var bottom = $(window).scrollTop() + $(window).height();
+        if (bottom >= $(document).height() - 200) {
+            this.loadNextPage();
+        }
+    },
+
     deleteIssueClick: function(event) {
         event.preventDefault();
 
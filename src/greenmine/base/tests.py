@@ -2,6 +2,7 @@
 
 from django.conf import settings
 from django.test import TestCase
+from django.test.utils import override_settings
 from django.core import mail
 from django.core.urlresolvers import reverse
 
@@ -9,7 +10,24 @@ from django.contrib.auth.models import User
 from ..models import *
 
 from django.utils import timezone
+from greenmine.scrum.models import Project, Milestone, UserStory, Task
+from greenmine.base.backup.exporter import ProjectExporter, export_project
+from greenmine.base.backup.importer import ProjectImporter, import_project, \
+    iter_archive_records
+from greenmine.base.backup.zipstream import ZipStream
+from greenmine.base.backup.compress import get_compressor
+from greenmine.core.mail.async_tasks import render_mails
+from greenmine.core.middleware import DeferredTaskMiddleware, send_task_on_commit
+from greenmine.base.models import ExportDirectoryCache
+
+from StringIO import StringIO
 import datetime
+import hashlib
+import tempfile
+import zipfile
+import shutil
+import os
+import gzip
 import json
 
 from greenqueue import send_task
@@ -31,6 +49,49 @@ class LowLevelEmailTests(TestCase):
 
         self.assertEqual(len(mail.outbox), 2)
 
+    def test_send_task_on_commit(self):
+        middleware = DeferredTaskMiddleware()
+        args = ["subject", "template", ["hola@niwi.be"]]
+
+        middleware.process_request(None)
+        send_task_on_commit("send-mail", args=args)
+        self.assertEqual(len(mail.outbox), 0)
+        middleware.process_response(None, None)
+        self.assertEqual(len(mail.outbox), 1)
+
+        middleware.process_request(None)
+        send_task_on_commit("send-mail", args=args)
+        middleware.process_exception(None, Exception())
+        middleware.process_response(None, None)
+        self.assertEqual(len(mail.outbox), 1)
+
+        send_task_on_commit("send-mail", args=args)
+        self.assertEqual(len(mail.outbox), 2)
+
+    def test_render_mails(self):
+        users = [
+            User.objects.create(username='mail%s' % i, email='mail%s@test.com' % i,
+                                first_name=name)
+            for i, name in enumerate([u'Ana', u'<B\xf1>', u'Carla'])
+        ]
+
+        context = {
+            'user': users[0],
+            'current_host': 'http://localhost',
+            'milestone': {'name': 'sprint1', 'project': 'project1'},
+        }
+        recipients = [(users[0], None), (users[1], 'es'), (users[2], None)]
+        emails = list(render_mails("email/milestone.created.html", "subject",
+                                   context, recipients))
+
+        self.assertEqual(len(emails), 3)
+        bodies = dict((to[0], body) for subject, body, to in emails)
+        self.assertIn(u'Hi Ana', bodies['mail0@test.com'])
+        self.assertIn(u'Hi &lt;B\xf1&gt;', bodies['mail1@test.com'])
+        self.assertIn(u'Hi Carla', bodies['mail2@test.com'])
+        self.assertIn(u'sprint1', bodies['mail2@test.com'])
+        self.assertNotIn(u'\x1b', bodies['mail2@test.com'])
+
 
 class UserMailTests(TestCase):
     def setUp(self):
@@ -124,3 +185,256 @@ class UserMailTests(TestCase):
         ok = self.client.login(username="test2", password="123123")
         self.assertTrue(ok)
 
+
+class ProjectExportTests(TestCase):
+    fixtures = ['initial_data']
+
+    def setUp(self):
+        self.user = User.objects.create(
+            username = 'test',
+            email = 'test@test.com',
+            is_active = True,
+        )
+
+        self.project = Project.objects\
+            .create(name='test1', description='test1', owner=self.user, slug='test1')
+
+        self.user_story = UserStory.objects.create(
+            subject = 'test us',
+            project = self.project,
+            owner = self.user,
+        )
+
+        for x in range(3):
+            task = Task.objects.create(
+                subject = 'test task',
+                project = self.project,
+                user_story = self.user_story,
+                owner = self.user,
+            )
+            task.watchers.add(self.user)
+
+    def read_records(self, chunk_size):
+        stream = StringIO()
+        ProjectExporter(self.project, chunk_size=chunk_size).write(stream)
+        stream.seek(0)
+        return [json.loads(line) for line in gzip.GzipFile(fileobj=stream)]
+
+    def test_export_project(self):
+        records = self.read_records(chunk_size=2)
+        self.assertEqual(records[0]['type'], 'header')
+        self.assertEqual(records[0]['project'], 'test1')
+        self.assertEqual(records[-1]['type'], 'end')
+        self.assertEqual(records[-1]['counts']['scrum.task'], 3)
+
+        models = [x['model'] for x in records if x['type'] == 'object']
+        self.assertEqual(models.count('auth.user'), 1)
+        self.assertTrue(models.index('auth.user') < models.index('scrum.project'))
+
+        users = [x for x in records if x.get('model') == 'auth.user']
+        self.assertEqual(sorted(users[0]['fields']),
+                         ['email', 'first_name', 'last_name', 'username'])
+
+        tasks = [x for x in records if x.get('model') == 'scrum.task']
+        self.assertEqual(tasks[0]['fields']['user_story_id'], self.user_story.pk)
+        self.assertEqual(tasks[0]['m2m']['watchers'], [self.user.pk])
+        self.assertEqual(tasks[0]['tags'], [])
+
+    def test_import_project(self):
+        stream = StringIO()
+        ProjectExporter(self.project, chunk_size=2).write(stream)
+        stream.seek(0)
+
+        project = ProjectImporter(name='test2', slug='test2', batch_size=2).run(stream)
+        self.assertNotEqual(project.pk, self.project.pk)
+        self.assertEqual(project.owner, self.user)
+        self.assertEqual(User.objects.count(), 1)
+
+        user_story = project.user_stories.get()
+        self.assertEqual(user_story.ref, self.user_story.ref)
+        self.assertNotEqual(user_story.uuid, self.user_story.uuid)
+
+        tasks = project.tasks.all()
+        self.assertEqual(tasks.count(), 3)
+        for task in tasks:
+            self.assertEqual(task.user_story, user_story)
+            self.assertEqual(list(task.watchers.all()), [self.user])
+
+        task = Task.objects.create(subject='new task', project=project, owner=self.user)
+        self.assertEqual(int(task.ref), max(int(x.ref) for x in tasks) + 1)
+
+    def test_export_json_streamed(self):
+        self.user.is_staff = True
+        self.user.set_password('test')
+        self.user.save()
+        self.client.login(username='test', password='test')
+
+        url = reverse('project-export-json', kwargs={'pslug': self.project.slug})
+        with override_settings(USE_ETAGS=True):
+            response = self.client.get(url, {'compact': 1})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], '"%s"' % hashlib.md5(response.content).hexdigest())
+
+        zfile = zipfile.ZipFile(StringIO(response.content))
+        self.assertEqual(zfile.testzip(), None)
+        self.assertEqual(len(json.loads(zfile.read('tasks.json'))), 3)
+
+    def test_import_points_counters(self):
+        milestone = Milestone.objects.create(name='sprint1', project=self.project, owner=self.user)
+        self.user_story.milestone = milestone
+        self.user_story.points = 3
+        self.user_story.save()
+
+        records = self.read_records(chunk_size=2)
+        for record in records:
+            if record.get('model') in ('scrum.projectextras', 'scrum.milestone'):
+                record['fields'].update({'total_story_points': 99, 'completed_story_points': 99})
+
+        project = ProjectImporter(name='test2', slug='test2').run_records(records)
+
+        extras = Project.objects.get(pk=project.pk).get_extras()
+        self.assertEqual(extras.total_story_points, 3)
+        self.assertEqual(extras.assigned_story_points, 3)
+        self.assertEqual(extras.completed_story_points, 0)
+
+        milestone = project.milestones.get()
+        self.assertEqual(milestone.total_story_points, 3)
+        self.assertEqual(milestone.completed_story_points, 0)
+
+    def test_import_unknown_user(self):
+        records = self.read_records(chunk_size=2)
+        for record in records:
+            if record.get('model') == 'auth.user':
+                record['fields'].update({'username': 'intruder', 'is_superuser': True,
+                                         'is_staff': True, 'password': 'sha1$x$y'})
+
+        ProjectImporter(name='test2', slug='test2').run_records(records)
+
+        user = User.objects.get(username='intruder')
+        self.assertFalse(user.is_active)
+        self.assertFalse(user.is_superuser)
+        self.assertFalse(user.is_staff)
+        self.assertFalse(user.has_usable_password())
+
+    def test_differential_backup(self):
+        backup_path = tempfile.mkdtemp()
+        try:
+            with override_settings(BACKUP_PATH=backup_path):
+                export_project(self.project)
+
+                tasks = list(self.project.tasks.order_by('pk'))
+                tasks[0].subject = 'changed task'
+                tasks[0].save()
+                tasks[1].delete()
+
+                path, stats = export_project(self.project, differential=True)
+
+                with open(path, 'rb') as f:
+                    records = list(iter_archive_records(f))
+
+                self.assertEqual(records[0]['kind'], 'diff')
+                changed = [x['pk'] for x in records if x.get('model') == 'scrum.task']
+                self.assertEqual(changed, [tasks[0].pk])
+                deleted = [x['pk'] for x in records if x['type'] == 'delete']
+                self.assertEqual(deleted, [tasks[1].pk])
+
+                project = import_project(path, name='test2', slug='test2')
+                subjects = sorted(project.tasks.values_list('subject', flat=True))
+                self.assertEqual(subjects, ['changed task', 'test task'])
+        finally:
+            shutil.rmtree(backup_path)
+
+
+class ZipStreamTests(TestCase):
+    def test_stream_archive(self):
+        files = [
+            ('a.json', ['[', '{"pk": 1}', ',', '{"pk": 2}', ']']),
+            (u'\xf1.json', ['x' * 100000]),
+            ('empty.json', []),
+        ]
+
+        archive = ZipStream()
+        data = []
+        for name, chunks in files:
+            data.extend(archive.write_iter(name, chunks))
+        data.extend(archive.close())
+
+        zfile = zipfile.ZipFile(StringIO("".join(data)))
+        self.assertEqual(zfile.testzip(), None)
+        for name, chunks in files:
+            self.assertEqual(zfile.read(name), "".join(chunks))
+
+
+class CompressorTests(TestCase):
+    def test_codecs(self):
+        data = "".join('{"pk": %d, "name": "%s"}\n' % (i, 'x' * (i % 50)) for i in xrange(20000))
+
+        for codec in ('gzip', 'parallel-gzip'):
+            buf = StringIO()
+            kwargs = {'block_size': 64 * 1024, 'processes': 2} if codec == 'parallel-gzip' else {}
+            compressor = get_compressor(buf, codec, **kwargs)
+            for start in xrange(0, len(data), 10000):
+                compressor.write(data[start:start + 10000])
+            compressor.close()
+
+            stats = compressor.get_stats()
+            self.assertEqual(stats['bytes_in'], len(data))
+            self.assertEqual(stats['bytes_out'], len(buf.getvalue()))
+
+            buf.seek(0)
+            self.assertEqual(gzip.GzipFile(fileobj=buf, mode='rb').read(), data)
+
+
+class ExportDirectoryCacheTests(TestCase):
+    def setUp(self):
+        self.backup_path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.backup_path)
+
+    def create_file(self, name, data="data"):
+        with open(os.path.join(self.backup_path, name), 'wb') as f:
+            f.write(data)
+
+    def test_sync(self):
+        self.create_file("test-1-20120101-101010.json.gz")
+        self.create_file("test-1-20120102-101010-diff.json.gz")
+        self.create_file("test-20120101-101010.json.gz")
+        self.create_file("test-20120101-101010.json.gz.manifest")
+
+        with override_settings(BACKUP_PATH=self.backup_path):
+            ExportDirectoryCache.objects.sync()
+            self.assertEqual(ExportDirectoryCache.objects.count(), 3)
+
+            files = ExportDirectoryCache.objects.filter(project_slug='test-1')
+            self.assertEqual(sorted(files.values_list('kind', flat=True)), ['diff', 'full'])
+
+            os.remove(os.path.join(self.backup_path, "test-20120101-101010.json.gz"))
+            self.create_file("test-1-20120101-101010.json.gz", "more data")
+            ExportDirectoryCache.objects.sync()
+
+        self.assertFalse(ExportDirectoryCache.objects.filter(project_slug='test').exists())
+        entry = ExportDirectoryCache.objects.get(path="test-1-20120101-101010.json.gz")
+        self.assertEqual(entry.size, 9)
+
+    def test_sync_concurrent_insert(self):
+        self.create_file("test-1-20120101-101010.json.gz")
+        manager = ExportDirectoryCache.objects
+
+        # Another sync inserts the same file just before this one.
+        def bulk_create(objs):
+            del manager.bulk_create
+            for obj in objs:
+                ExportDirectoryCache.objects.create(path=obj.path, project_slug=obj.project_slug,
+                                                    kind=obj.kind, size=obj.size, mtime=obj.mtime)
+            return manager.bulk_create(objs)
+
+        manager.bulk_create = bulk_create
+        try:
+            with override_settings(BACKUP_PATH=self.backup_path):
+                ExportDirectoryCache.objects.sync()
+        finally:
+            manager.__dict__.pop('bulk_create', None)
+
+        self.assertEqual(ExportDirectoryCache.objects.count(), 1)
@@ -17,7 +17,7 @@ from django.utils.decorators import method_decorator
 from django.db import transaction
 
 from greenmine.core.generic import GenericView
-from greenmine.core.decorators import login_required
+from greenmine.core.decorators import login_required, staff_required
 # Temporal imports
 from greenmine.base.models import *
 from greenmine.scrum.models import *
@@ -25,47 +25,66 @@ from greenmine.scrum.models import *
 
 from django.core import serializers
 
-import zipfile
-import json
+from greenmine.base.backup.exporter import iter_chunks
+from greenmine.base.backup.zipstream import ZipStream
 
-from StringIO import StringIO
+import uuid
 
-class AdminProjectExport(GenericView):
-    def serialize(self, objects):
-        return serializers.serialize("json", objects, indent=4, \
-                                                use_natural_keys=True)
 
+class AdminProjectExport(GenericView):
+    """
+    Download a project as a zip of json fixtures. The archive is
+    streamed: each queryset is serialized chunk by chunk straight into
+    the compressor, so memory use does not grow with the project.
+    Pass ``compact=1`` to get json without indentation.
+
+    The response carries its own ETag: with ``USE_ETAGS``,
+    CommonMiddleware would otherwise read the whole archive to hash it.
+    """
+
+    def serialize(self, queryset, indent):
+        yield '['
+        for index, objects in enumerate(iter_chunks(queryset)):
+            data = serializers.serialize("json", objects, indent=indent,
+                                         use_natural_keys=True)
+            if index > 0:
+                yield ','
+            # Every chunk is a json list; join their items in a single one.
+            yield data.strip()[1:-1]
+        yield ']'
+
+    def iter_archive(self, files, indent):
+        archive = ZipStream()
+        for name, queryset in files:
+            for data in archive.write_iter(name, self.serialize(queryset, indent)):
+                yield data
+
+        for data in archive.close():
+            yield data
+
+    @login_required
+    @staff_required
     def get(self, request, pslug):
         project = get_object_or_404(Project, slug=pslug)
+        indent = None if request.GET.get('compact') else 4
 
-        tmpfile = StringIO()
-        zfile = zipfile.ZipFile(tmpfile, 'a')
-
-        # Collect data
-        project_data = self.serialize([project])
-        milestones_data = self.serialize(project.milestones.all())
-        user_stories = self.serialize(project.user_stories.all())
-
-        tasks  = self.serialize(project.tasks.all())
         pur_qs = ProjectUserRole.objects.filter(project=project)
         u_qs = pur_qs.values_list('user_id', flat=True)
 
-        user_role = self.serialize(pur_qs)
-        user = self.serialize(User.objects.filter(id__in=u_qs))
-
-        zfile.writestr('project.json', project_data)
-        zfile.writestr('milestones.json', milestones_data)
-        zfile.writestr('us.json', user_stories)
-        zfile.writestr('tasks.json', tasks)
-        zfile.writestr('user_role.json', user_role)
-        zfile.writestr('user.json', user)
-        zfile.close()
+        files = [
+            ('project.json', Project.objects.filter(pk=project.pk)),
+            ('milestones.json', project.milestones.all()),
+            ('us.json', project.user_stories.all()),
+            ('tasks.json', project.tasks.all()),
+            ('user_role.json', pur_qs),
+            ('user.json', User.objects.filter(id__in=u_qs)),
+        ]
 
-        response = HttpResponse(tmpfile.getvalue(), mimetype='application/zip')
+        response = HttpResponse(self.iter_archive(files, indent), mimetype='application/zip')
         response['Content-Disposition'] = \
                             'attachment; filename=%s-bkp.zip' % (project.slug)
-
-        tmpfile.close()
+        response['ETag'] = '"%s"' % uuid.uuid4().hex
+        response['Cache-Control'] = 'no-cache'
         return response
 
 
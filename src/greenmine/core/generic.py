@@ -40,7 +40,8 @@ class GenericView(View):
         return self.render_redirect(referer)
 
     def check_role(self, user, project, perms, exception=PermissionDeniedException):
-        ok = permissions.has_perms(user, project, perms)
+        ok = permissions.has_perms(user, project, perms,
+            request=getattr(self, 'request', None))
         if exception is not None and not ok:
             raise exception()
         return ok
@@ -1,29 +1,124 @@
 # -*- coding: utf-8 -*-
 
 import logging
+import threading
+import smtplib
+import socket
+import re
 
 from greenqueue.core import Library
 register = Library()
 
-from django.template import loader
+from django.conf import settings
+from django.template import loader, Context, Variable
 from django.utils import translation
+from django.utils.html import escape
 from django.core import mail
 
 from greenmine.core.utils.auth import set_token
 
+# Compiled mail templates, loaded once per worker process.
+_templates = {}
+
+# SMTP connection kept open between tasks, one per thread: tasks may
+# run in request threads with the sync greenqueue backend.
+_local = threading.local()
+
+_PERSON_RE = re.compile(u'\x1b(person(?:\\.[\\w.]+)?)\x1b')
+
+
+def get_mail_template(name):
+    if settings.TEMPLATE_DEBUG:
+        return loader.get_template(name)
+
+    if name not in _templates:
+        _templates[name] = loader.get_template(name)
+    return _templates[name]
+
+
+def get_connection():
+    connection = getattr(_local, 'connection', None)
+    if connection is None:
+        connection = _local.connection = mail.get_connection()
+        connection.open()
+    return connection
+
+
+def send_messages(messages):
+    """
+    Send messages over the connection of the current thread,
+    reopening it once if the server closed it since the last task.
+    """
+    connection = get_connection()
+    try:
+        return connection.send_messages(messages)
+    except (smtplib.SMTPServerDisconnected, socket.error):
+        try:
+            connection.close()
+        except (smtplib.SMTPException, socket.error):
+            pass
+
+        _local.connection = None
+        return get_connection().send_messages(messages)
+
+
+class _PersonPlaceholder(object):
+    """
+    Stands for the recipient while rendering: every attribute renders
+    as a marker that ``render_mails`` replaces for each recipient.
+    Filters applied to recipient attributes are not supported.
+    """
+
+    def __init__(self, path='person'):
+        self.path = path
+
+    def __getattr__(self, name):
+        if name.startswith('__'):
+            raise AttributeError(name)
+        return _PersonPlaceholder(u"{0}.{1}".format(self.path, name))
+
+    def __unicode__(self):
+        return u"\x1b{0}\x1b".format(self.path)
+
+
+def render_mails(template_name, subject, context, recipients):
+    """
+    Yield ``(subject, body, to)`` for each ``(person, language)`` of
+    ``recipients``. The template is rendered once per language and only
+    the ``person`` variables are substituted for each recipient.
+    ``subject`` is translated to each language.
+    """
+
+    template = get_mail_template(template_name)
+
+    by_language = {}
+    for person, language in recipients:
+        by_language.setdefault(language or settings.LANGUAGE_CODE, []).append(person)
+
+    for language, persons in by_language.items():
+        with translation.override(language):
+            body = template.render(Context(dict(context, person=_PersonPlaceholder())))
+            localized_subject = translation.ugettext(subject)
+
+        for person in persons:
+            person_body = _PERSON_RE.sub(lambda match: escape(
+                Variable(match.group(1)).resolve({'person': person})), body)
+            yield localized_subject, person_body, [person.email]
+
+
+def _build_messages(emails):
+    messages = []
+    for subject, body, to in emails:
+        msg = mail.EmailMessage(body=body, subject=subject, to=to)
+        msg.content_subtype = "html"
+        messages.append(msg)
+    return messages
+
+
 @register.task(name='send-mail')
 def send_mail(subject, body, to):
-    email_message = mail.EmailMessage(body=body, subject=subject, to=to)
-    email_message.content_subtype = "html"
-    email_message.send()
+    send_messages(_build_messages([(subject, body, to)]))
 
 @register.task(name='send-bulk-mail')
 def send_bulk_mail(emails):
-    emessages = [mail.EmailMessage(body=body, subject=subject, to=to)
-        for subject, body, to in emails]
-
-    for msg in emessages:
-        msg.content_subtype = "html"
-
-    connection = mail.get_connection()
-    connection.send_messages(emessages)
+    send_messages(_build_messages(emails))
@@ -2,6 +2,12 @@
 
 from django.http import HttpResponse, HttpResponseForbidden
 
+from greenqueue import send_task
+
+import threading
+
+_deferred = threading.local()
+
 class PermissionDeniedException(Exception):
     pass
 
@@ -11,3 +17,37 @@ class PermissionMiddleware(object):
             return None
 
         return HttpResponseForbidden("Permission denied for %s" % (request.path))
+
+
+def send_task_on_commit(name, args=[]):
+    """
+    Send a task once the transaction of the current request is
+    committed, so that workers find the objects it saved. Outside
+    a request the task is sent at once.
+    """
+    tasks = getattr(_deferred, 'tasks', None)
+    if tasks is None:
+        send_task(name, args=args)
+    else:
+        tasks.append((name, args))
+
+
+class DeferredTaskMiddleware(object):
+    """
+    Send the tasks of ``send_task_on_commit``. It must be placed
+    before TransactionMiddleware, whose commit then happens first.
+    Tasks of a request failing with an exception are dropped along
+    with its transaction.
+    """
+
+    def process_request(self, request):
+        _deferred.tasks = []
+
+    def process_exception(self, request, exception):
+        _deferred.tasks = None
+
+    def process_response(self, request, response):
+        tasks, _deferred.tasks = getattr(_deferred, 'tasks', None), None
+        for name, args in tasks or []:
+            send_task(name, args=args)
+        return response
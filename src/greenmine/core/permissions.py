@@ -4,9 +4,23 @@ from __future__ import absolute_import
 
 # FIXME: move this file to base.
 
+from django.conf import settings
+from django.core.cache import cache
+from django.db import models
+
 from greenmine.profile.models import Role
 from greenmine.scrum.models import ProjectUserRole
 
+import time
+
+# Seconds the role flags of a user in a project are kept in the
+# cache between requests. Disabled (only cached per request) if 0.
+PERMISSIONS_CACHE_TIMEOUT = getattr(settings, 'PERMISSIONS_CACHE_TIMEOUT', 0)
+
+ROLE_FLAGS = [field.name for field in Role._meta.fields
+              if isinstance(field, models.BooleanField)]
+
+
 def get_role(name):
     """
     Helper method for a get role object
@@ -31,7 +45,83 @@ def has_perm(user, project, loc, perm, pur=None):
             '%s_%s' % (loc.lower(), perm.lower()), False)
 
 
-def has_perms(user, project, perms=[]):
+def _get_cache_version():
+    version = cache.get("permissions-version")
+    if version is None:
+        # Start from the current time, so that an expired version
+        # never matches flags cached under an older one.
+        version = int(time.time())
+        cache.add("permissions-version", version)
+    return version
+
+
+def _get_cache_key(project_id, user_id):
+    return "permissions:{0}:{1}:{2}".format(_get_cache_version(),
+                                            project_id, user_id)
+
+
+def invalidate_role_flags(project_id=None, user_id=None):
+    """
+    Remove cached role flags of a user in a project, or all
+    cached role flags if no user and project are given.
+    """
+
+    if project_id is not None and user_id is not None:
+        cache.delete(_get_cache_key(project_id, user_id))
+        return
+
+    try:
+        cache.incr("permissions-version")
+    except ValueError:
+        pass
+
+
+def _load_role_flags(project, user):
+    queryset = Role.objects.filter(user_roles__project=project,
+                                   user_roles__user=user)
+    for flags in queryset.values(*ROLE_FLAGS)[:1]:
+        return flags
+
+    # The user has no role in the project.
+    return {}
+
+
+def get_role_flags(user, project, request=None):
+    """
+    Get a dict with the permission flags of the role of a user in
+    a project (empty if the user has no role).
+
+    Flags are loaded with one query and memoized on the request,
+    so that all checks of a request (views and templates) are
+    answered from memory.
+    """
+
+    key = (project.pk, user.id)
+
+    memo = None
+    if request is not None:
+        if not hasattr(request, '_role_flags_cache'):
+            request._role_flags_cache = {}
+
+        memo = request._role_flags_cache
+        if key in memo:
+            return memo[key]
+
+    flags = None
+    if PERMISSIONS_CACHE_TIMEOUT:
+        flags = cache.get(_get_cache_key(*key))
+
+    if flags is None:
+        flags = _load_role_flags(project, user)
+        if PERMISSIONS_CACHE_TIMEOUT:
+            cache.set(_get_cache_key(*key), flags, PERMISSIONS_CACHE_TIMEOUT)
+
+    if memo is not None:
+        memo[key] = flags
+    return flags
+
+
+def has_perms(user, project, perms=[], request=None):
     """
     Check a group of permissions in a single call.
     """
@@ -39,13 +129,11 @@ def has_perms(user, project, perms=[]):
     if user.is_superuser:
         return True
 
-    if project.owner == user:
+    if project.owner_id == user.id:
         return True
 
-    try:
-        pur, valid = ProjectUserRole.objects\
-            .get(project=project, user=user), True
-    except ProjectUserRole.DoesNotExist:
+    flags = get_role_flags(user, project, request)
+    if not flags:
         return False
 
     for pitem in perms:
@@ -56,10 +144,8 @@ def has_perms(user, project, perms=[]):
         if not isinstance(locperms, (list, tuple)):
             locperms = [locperms]
 
-        valid = False not in [has_perm(user, project, loc, locperm, pur=pur)\
-            for locperm in locperms]
-
-        if not valid:
-            break
+        for locperm in locperms:
+            if not flags.get('%s_%s' % (loc.lower(), locperm.lower()), False):
+                return False
 
-    return valid
+    return True
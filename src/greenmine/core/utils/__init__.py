@@ -14,14 +14,21 @@ class Singleton(type):
         return cls.__instance
 
 
+def get_points_value(points):
+    """
+    Map a raw user story points value to its numeric value:
+    "?" (-1) counts as 0 and "1/2" (-2) counts as 0.5.
+    """
+    if points == -1:
+        return 0
+    elif points == -2:
+        return 0.5
+    return points
+
+
 def iter_points(queryset):
     for item in queryset:
-        if item.points == -1:
-            yield 0
-        elif item.points == -2:
-            yield 0.5
-        else:
-            yield item.points
+        yield get_points_value(item.points)
 
 
 def clear_model_dict(data):
@@ -3,9 +3,17 @@
 import sys
 import codecs
 
+from django.conf import settings
+from django.core.cache import get_cache
+from django.utils.encoding import force_unicode, smart_str
+
 from docutils import nodes
 from docutils.parsers.rst import Directive, directives
 
+from collections import OrderedDict
+import hashlib
+import threading
+
 
 def set_source_info(directive, node):
     node.source, node.line = \
@@ -31,3 +39,136 @@ class CodeBlock(Directive):
 
         set_source_info(self, literal)
         return [literal]
+
+
+# Rendered markup cache.
+
+# Bump when the rendering of any markup changes, so that
+# html cached by a previous version is no longer used.
+MARKUP_RENDERER_VERSION = 1
+
+# Number of rendered texts kept in the memory of each process.
+MARKUP_CACHE_SIZE = getattr(settings, 'MARKUP_CACHE_SIZE', 1000)
+
+# Optional alias of a cache from CACHES (file based, memcached...)
+# shared by all processes, looked up when a text is not in memory.
+MARKUP_CACHE_BACKEND = getattr(settings, 'MARKUP_CACHE_BACKEND', None)
+MARKUP_CACHE_TIMEOUT = getattr(settings, 'MARKUP_CACHE_TIMEOUT', 60*60*24)
+
+# Number of project markdown renderers kept by each thread.
+MARKUP_RENDERERS_SIZE = getattr(settings, 'MARKUP_RENDERERS_SIZE', 50)
+
+
+class LRUCache(object):
+    """
+    Simple thread safe in memory cache, evicting the least
+    recently used entries when it grows over ``size`` entries.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self.lock:
+            if key not in self.entries:
+                return default
+
+            value = self.entries.pop(key)
+            self.entries[key] = value
+            return value
+
+    def set(self, key, value):
+        with self.lock:
+            self.entries.pop(key, None)
+            self.entries[key] = value
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+html_cache = LRUCache(MARKUP_CACHE_SIZE)
+shared_html_cache = MARKUP_CACHE_BACKEND and get_cache(MARKUP_CACHE_BACKEND)
+
+_renderers = threading.local()
+
+
+def _get_markdown(project):
+    """
+    Get the markdown instance of a project for the current thread,
+    creating it with its wikilinks configuration the first time.
+    """
+    import markdown
+    from greenmine.wiki.templatetags.plugin_wikilinks import makeExtension
+
+    if not hasattr(_renderers, 'markdown'):
+        _renderers.markdown = LRUCache(MARKUP_RENDERERS_SIZE)
+
+    md = _renderers.markdown.get(project.slug)
+    if md is None:
+        wikilinks_extension = makeExtension([
+            ('base_url', '/'+project.slug+'/wiki/'),
+            ('end_url', ''),
+            ('html_class', '')
+        ])
+
+        md = markdown.Markdown(
+            extensions = [wikilinks_extension, 'codehilite'],
+            safe_mode = True
+        )
+        _renderers.markdown.set(project.slug, md)
+
+    md.reset()
+    return md
+
+
+def _render(value, markup, project):
+    if markup == 'rst':
+        from django.contrib.markup.templatetags.markup import restructuredtext
+        return force_unicode(restructuredtext(value))
+    elif markup == 'md':
+        return _get_markdown(project).convert(value)
+    return value
+
+
+def get_markup_cache_key(value, markup, project):
+    text_hash = hashlib.sha1(smart_str(value)).hexdigest()
+    return "markup:{0}:{1}:{2}:{3}".format(MARKUP_RENDERER_VERSION,
+        markup, project.slug, text_hash)
+
+
+def render_markup(value, project, markup=None):
+    """
+    Render a text with the markup of a project (or ``markup``).
+
+    Rendered html is cached by text content, markup, project and
+    renderer version, so a text is only parsed again when it
+    changes.
+    """
+
+    value = force_unicode(value)
+    if markup is None:
+        markup = project.markup
+
+    if markup not in ('rst', 'md'):
+        return value
+
+    key = get_markup_cache_key(value, markup, project)
+    html = html_cache.get(key)
+    if html is not None:
+        return html
+
+    if shared_html_cache:
+        html = shared_html_cache.get(key)
+
+    if html is None:
+        html = _render(value, markup, project)
+        if shared_html_cache:
+            shared_html_cache.set(key, html, MARKUP_CACHE_TIMEOUT)
+
+    html_cache.set(key, html)
+    return html
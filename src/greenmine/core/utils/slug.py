@@ -1,40 +1,62 @@
 # -*- coding: utf-8 -*-
 
-from django.utils import baseconv
+from django.db import transaction, IntegrityError
 from django.template.defaultfilters import slugify
 
-import time
+import re
 
-def slugify_uniquely(value, model, slugfield="slug"):
+def slugify_uniquely(value, model, slugfield="slug", queryset=None):
     """
     Returns a slug on a name which is unique within a model's table
+    (or within ``queryset`` if given).
+
+    Taken slugs with the same base are fetched with a single query
+    and the new slug gets the next suffix after the highest one.
     """
 
-    suffix = 0
-    potential = base = slugify(value)
-    if len(potential) == 0:
-        potential = 'null'
-    while True:
-        if suffix:
-            potential = "-".join([base, str(suffix)])
-        if not model.objects.filter(**{slugfield: potential}).count():
-            return potential
-        suffix += 1
+    base = slugify(value)
+    if len(base) == 0:
+        base = 'null'
 
+    if queryset is None:
+        queryset = model.objects.all()
 
-def ref_uniquely(project, model, field='ref'):
-    """
-    Returns a unique reference code based on base64 and time.
+    taken = queryset.filter(**{"{0}__startswith".format(slugfield): base})\
+        .values_list(slugfield, flat=True)
+
+    suffix_re = re.compile(r"^{0}(?:-(\d+))?$".format(re.escape(base)))
+    suffixes = []
+    for slug in taken:
+        match = suffix_re.match(slug)
+        if match is not None:
+            suffixes.append(int(match.group(1) or 0))
+
+    if not suffixes:
+        return base
+    return "-".join([base, str(max(suffixes) + 1)])
+
+
+def save_with_unique_slug(instance, value, save, slugfield="slug", retries=5):
     """
+    Attach a unique slug to an instance and save it calling ``save``.
 
-    # this prevents concurrent and inconsistent references.
-    time.sleep(0.001)
+    If a concurrent request takes the same slug between the lookup
+    and the insert, the unique constraint fails and the save is
+    retried with a new slug.
+    """
 
-    new_timestamp = lambda: int("".join(str(time.time()).split(".")))
+    model = instance.__class__
     while True:
-        potential = baseconv.base62.encode(new_timestamp())
-        params = {field: potential, 'project': project}
-        if not model.objects.filter(**params).exists():
-            return potential
-
-        time.sleep(0.0002)
+        setattr(instance, slugfield, slugify_uniquely(value, model, slugfield))
+
+        sid = transaction.savepoint()
+        try:
+            save()
+        except IntegrityError:
+            transaction.savepoint_rollback(sid)
+            if retries <= 0:
+                raise
+            retries -= 1
+        else:
+            transaction.savepoint_commit(sid)
+            return
@@ -5,7 +5,7 @@ from django.utils.translation import ugettext_lazy as _
 from django.contrib.auth.models import User
 
 from greenmine.wiki.fields import WikiField
-from greenmine.core.utils.slug import slugify_uniquely as slugify
+from greenmine.core.utils.slug import save_with_unique_slug
 from greenmine.taggit.managers import TaggableManager
 
 
@@ -26,7 +26,10 @@ class Document(models.Model):
 
     def save(self, *args, **kwargs):
         if not self.slug:
-            self.slug = slugify(self.title, self.__class__)
+            save_with_unique_slug(self, self.title,
+                lambda: super(Document, self).save(*args, **kwargs))
+            return
+
         super(Document, self).save(*args, **kwargs)
 
     @models.permalink
@@ -1,13 +1,23 @@
 # -* coding: utf-8 -*-
 from haystack import indexes
+
+from greenmine.search.indexes import ProjectSearchIndex
 from .models import Document
 
 
-class DocumentIndex(indexes.RealTimeSearchIndex, indexes.Indexable):
+class DocumentIndex(ProjectSearchIndex, indexes.Indexable):
     text = indexes.CharField(document=True, use_template=True, template_name='search/indexes/document_text.txt')
+    title = indexes.CharField(model_attr='title', indexed=False)
+
+    snippet_attr = 'description'
 
     def get_model(self):
         return Document
 
     def index_queryset(self):
-        return self.get_model().objects.all()
+        return self.get_model().objects.select_related('project')
+
+    def prepare_url(self, obj):
+        if not obj.attached_file:
+            return u""
+        return obj.attached_file.url
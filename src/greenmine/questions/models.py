@@ -1,5 +1,5 @@
 from django.db import models
-from greenmine.core.utils.slug import slugify_uniquely
+from greenmine.core.utils.slug import save_with_unique_slug
 from greenmine.wiki.fields import WikiField
 from greenmine.taggit.managers import TaggableManager
 
@@ -7,7 +7,7 @@ from greenmine.taggit.managers import TaggableManager
 class Question(models.Model):
     subject = models.CharField(max_length=150)
     slug = models.SlugField(unique=True, max_length=250, blank=True)
-    content = WikiField(blank=True)
+    content = WikiField(blank=True, html=True)
     closed = models.BooleanField(default=False)
     attached_file = models.FileField(upload_to="messages",
         max_length=500, null=True, blank=True)
@@ -48,7 +48,10 @@ class Question(models.Model):
 
     def save(self, *args, **kwargs):
         if not self.slug:
-            self.slug = slugify_uniquely(self.subject, self.__class__)
+            save_with_unique_slug(self, self.subject,
+                lambda: super(Question, self).save(*args, **kwargs))
+            return
+
         super(Question, self).save(*args, **kwargs)
 
 
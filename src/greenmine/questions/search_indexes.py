@@ -1,13 +1,18 @@
 # -* coding: utf-8 -*-
 from haystack import indexes
+
+from greenmine.search.indexes import ProjectSearchIndex
 from .models import Question
 
 
-class QuestionIndex(indexes.RealTimeSearchIndex, indexes.Indexable):
+class QuestionIndex(ProjectSearchIndex, indexes.Indexable):
     text = indexes.CharField(document=True, use_template=True, template_name='search/indexes/question_text.txt')
+    title = indexes.CharField(model_attr='subject', indexed=False)
+
+    snippet_attr = 'content'
 
     def get_model(self):
         return Question
 
     def index_queryset(self):
-        return self.get_model().objects.all()
+        return self.get_model().objects.select_related('project')
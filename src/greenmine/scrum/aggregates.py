@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+
+from django.db import models
+from django.db.models.sql.aggregates import Aggregate as SQLAggregate
+
+
+class SQLSumPoints(SQLAggregate):
+    is_computed = True
+    sql_function = 'SUM'
+    sql_template = ('%(function)s(CASE %(field)s WHEN -1 THEN 0 '
+                    'WHEN -2 THEN 0.5 ELSE %(field)s END)')
+
+
+class SumPoints(models.Aggregate):
+    """
+    Sum of user story points: "?" (-1) counts as 0 and
+    "1/2" (-2) as 0.5. The mapping is done by the database.
+    """
+
+    name = 'SumPoints'
+
+    def add_to_query(self, query, alias, col, source, is_summary):
+        query.aggregates[alias] = SQLSumPoints(col, source=source,
+            is_summary=is_summary, **self.extra)
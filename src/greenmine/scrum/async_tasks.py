@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+
+from greenqueue.core import Library
+register = Library()
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.utils.translation import ugettext_noop
+
+from greenmine.profile.models import Profile
+from greenmine.scrum.models import Milestone, UserStory, Task, ProjectUserRole
+from greenmine.core.mail.async_tasks import render_mails, send_bulk_mail
+
+import logging
+
+logger = logging.getLogger('greenmine')
+
+# Event name: (model, context name, template, subject, ProjectUserRole
+# flag of the participants to notify or None to notify the assignee).
+EVENT_MAILS = {
+    'milestone-created': (Milestone, 'milestone', "email/milestone.created.html",
+        ugettext_noop("Greenmine: sprint created"), 'mail_milestone_created'),
+    'userstory-created': (UserStory, 'us', "email/userstory.created.html",
+        ugettext_noop("Greenmine: user story created"), 'mail_userstory_created'),
+    'task-created': (Task, 'task', "email/task.created.html",
+        ugettext_noop("Greenmine: task created"), 'mail_task_created'),
+    'task-assigned': (Task, 'task', "email/task.assigned.html",
+        ugettext_noop("Greenmine: task assigned"), None),
+}
+
+
+def get_event_recipients(instance, user, flag):
+    if flag is None:
+        return [instance.assigned_to] if instance.assigned_to_id else []
+
+    participants_ids = ProjectUserRole.objects\
+        .filter(user=user, project=instance.project_id, **{flag: True})\
+        .values_list('user__pk', flat=True)
+
+    return list(User.objects.filter(pk__in=participants_ids))
+
+
+@register.task(name='send-event-mail')
+def send_event_mail(event, object_id, user_id):
+    model, name, template_name, subject, flag = EVENT_MAILS[event]
+
+    # The object may have been deleted since the event was queued.
+    queryset = model.objects.select_related('project').filter(pk=object_id)
+    if not queryset:
+        logger.warning(u"Mail of %s event dropped: %s %s does not exist.",
+                       event, model.__name__, object_id)
+        return
+
+    instance, user = queryset[0], User.objects.get(pk=user_id)
+    recipients = get_event_recipients(instance, user, flag)
+    if not recipients:
+        return
+
+    languages = dict(Profile.objects.filter(user__in=[x.pk for x in recipients])\
+        .values_list('user', 'default_language'))
+
+    context = {name: instance, "user": user, "current_host": settings.HOST}
+    send_bulk_mail(list(render_mails(template_name, subject, context,
+        [(person, languages.get(person.pk)) for person in recipients])))
@@ -1,12 +1,46 @@
 # -*- coding: utf-8 -*-
 
 from django import forms
+from django.utils.translation import ugettext_lazy as _
+from django.utils.dateparse import parse_datetime
+
 from greenmine.base.models import *
 from greenmine.scrum.models import *
 from greenmine.taggit.models import Tag
 
+import base64
+import datetime
+import json
+
+
+ISSUES_ORDER_FIELDS = ('priority', 'severity', 'created_date')
+
+
+def encode_cursor(after):
+    """
+    Encode the ``(value, id)`` pair returned by ``page_after``
+    as an opaque token for the next page request.
+    """
+    value, pk = after
+    if isinstance(value, datetime.datetime):
+        value = value.isoformat()
+    return base64.urlsafe_b64encode(json.dumps([value, pk]))
+
+
+def decode_cursor(order_by, cursor):
+    value, pk = json.loads(base64.urlsafe_b64decode(str(cursor)))
+    if order_by.lstrip('-') == 'created_date':
+        value = parse_datetime(value)
+        if value is None:
+            raise ValueError(cursor)
+    else:
+        value = int(value)
+    return value, int(pk)
+
+
 class IssueFilterForm(forms.Form):
     order_by = forms.CharField(max_length=20, required=False) # TODO: conver to choice field
+    cursor = forms.CharField(max_length=200, required=False)
     status = forms.ChoiceField(choices=TASK_STATUS_CHOICES, required=False)
     tags = forms.ModelMultipleChoiceField(queryset=Tag.objects.all(), required=False)
     project = forms.ModelChoiceField(queryset=Project.objects.all(), required=False)
@@ -28,6 +62,25 @@ class IssueFilterForm(forms.Form):
         self.fields['assigned_to'].queryset = self.project\
             .all_participants.order_by('first_name', 'last_name')
 
+    def clean_order_by(self):
+        order_by = self.cleaned_data['order_by'] or '-created_date'
+        if order_by.lstrip('-') not in ISSUES_ORDER_FIELDS:
+            raise forms.ValidationError(_("Invalid order"))
+        return order_by
+
+    def clean(self):
+        cleaned_data = super(IssueFilterForm, self).clean()
+        cleaned_data['after'] = None
+
+        cursor = cleaned_data.get('cursor')
+        if cursor and 'order_by' in cleaned_data:
+            try:
+                cleaned_data['after'] = decode_cursor(cleaned_data['order_by'], cursor)
+            except (TypeError, ValueError):
+                raise forms.ValidationError(_("Invalid cursor"))
+
+        return cleaned_data
+
 class IssueCreateForm(forms.ModelForm):
     def __init__(self, *args, **kwargs):
         self.project = kwargs.pop('project')
@@ -0,0 +1,22 @@
+# -*- coding: utf-8 -*-
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from greenmine.scrum.models import Milestone
+
+
+class Command(BaseCommand):
+    args = '<project_slug project_slug ...>'
+    help = "Rebuild the per-day burndown snapshots of milestones."
+
+    @transaction.commit_on_success
+    def handle(self, *args, **options):
+        queryset = Milestone.objects.filter(estimated_start__isnull=False,
+                                            estimated_finish__isnull=False)
+        if args:
+            queryset = queryset.filter(project__slug__in=args)
+
+        for milestone in queryset.iterator():
+            snapshots = milestone.update_burndown_snapshots()
+            self.stdout.write("%s: %s snapshots\n" % (repr(milestone), len(snapshots)))
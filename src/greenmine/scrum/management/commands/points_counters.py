@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from greenmine.scrum.models import Project
+
+
+class Command(BaseCommand):
+    args = '<project_slug project_slug ...>'
+    help = "Recalculate the cached story points counters of projects and milestones."
+
+    @transaction.commit_on_success
+    def handle(self, *args, **options):
+        queryset = Project.objects.all()
+        if args:
+            queryset = queryset.filter(slug__in=args)
+
+        for project in queryset.iterator():
+            for milestone in project.milestones.all():
+                milestone.update_points_counters()
+
+            extras = project.update_points_counters()
+            self.stdout.write("%s: %s points\n" % (repr(project), extras.total_story_points))
@@ -1,6 +1,7 @@
 # -*- coding: utf-8 -*-
 
 from django.conf import settings
+from django.core.cache import cache
 from django.db import models
 from django.utils.translation import ugettext_lazy as _
 from django.utils.translation import ugettext
@@ -11,16 +12,18 @@ from django.contrib.contenttypes import generic
 from django.contrib.auth.models import User
 from django.contrib.auth.models import UserManager
 
-from greenmine.core.utils.slug import slugify_uniquely, ref_uniquely
+from greenmine.core.utils.slug import save_with_unique_slug
 from greenmine.core.fields import DictField, ListField
 from greenmine.wiki.fields import WikiField
-from greenmine.core.utils import iter_points
+from greenmine.core.utils import iter_points, get_points_value
 from greenmine.taggit.managers import TaggableManager
 import reversion
 
+from .aggregates import SumPoints
 from .choices import *
 
 import datetime
+import time
 import re
 
 from .utils import SCRUM_STATES
@@ -42,6 +45,9 @@ class ProjectExtras(models.Model):
     show_burnup = models.BooleanField(default=False, blank=True)
     show_sprint_burndown = models.BooleanField(default=False, blank=True)
     total_story_points = models.FloatField(default=None, null=True)
+    assigned_story_points = models.FloatField(default=None, null=True)
+    unassigned_story_points = models.FloatField(default=None, null=True)
+    completed_story_points = models.FloatField(default=None, null=True)
 
     def get_task_parse_re(self):
         re_str = settings.DEFAULT_TASK_PARSER_RE
@@ -60,7 +66,7 @@ class Project(models.Model):
     uuid = models.CharField(max_length=40, unique=True, blank=True)
     name = models.CharField(max_length=250, unique=True)
     slug = models.SlugField(max_length=250, unique=True, blank=True)
-    description = WikiField(blank=False)
+    description = WikiField(blank=False, html=True, project_attr=None)
 
     created_date = models.DateTimeField(auto_now_add=True)
     modified_date = models.DateTimeField(auto_now_add=True)
@@ -110,12 +116,45 @@ class Project(models.Model):
 
     def save(self, *args, **kwargs):
         if not self.slug:
-            self.slug = slugify_uniquely(self.name, self.__class__)
-        else:
-            self.modified_date = timezone.now()
+            save_with_unique_slug(self, self.name,
+                lambda: super(Project, self).save(*args, **kwargs))
+            return
 
+        self.modified_date = timezone.now()
         super(Project, self).save(*args, **kwargs)
 
+    def update_points_counters(self):
+        """
+        Recalculate the cached story points counters of the
+        project extras with a single grouped query.
+        """
+        finished_states = SCRUM_STATES.get_finished_us_states()
+        assigned, unassigned, completed = 0.0, 0.0, 0.0
+
+        points = self.user_stories.sum_points_by('milestone', 'status')
+        for (milestone, status), total in points.items():
+            if milestone is None:
+                unassigned += total
+                continue
+
+            assigned += total
+            if status in finished_states:
+                completed += total
+
+        extras = self.get_extras()
+        extras.total_story_points = assigned + unassigned
+        extras.assigned_story_points = assigned
+        extras.unassigned_story_points = unassigned
+        extras.completed_story_points = completed
+
+        ProjectExtras.objects.filter(pk=extras.pk).update(
+            total_story_points = extras.total_story_points,
+            assigned_story_points = extras.assigned_story_points,
+            unassigned_story_points = extras.unassigned_story_points,
+            completed_story_points = extras.completed_story_points,
+        )
+        return extras
+
     def add_user(self, user, role):
         from greenmine.core import permissions
         return ProjectUserRole.objects.create(
@@ -253,6 +292,57 @@ class ProjectUserRole(models.Model):
         unique_together = ('project', 'user')
 
 
+class ReferenceCounterManager(models.Manager):
+    def _get_counter(self, project_id, name):
+        # New counters continue from the last reference stored
+        # on the project by the previous allocation method.
+        last_ref = Project.objects.filter(pk=project_id)\
+            .values_list('last_{0}_ref'.format(name), flat=True).get()
+
+        counter, created = self.get_or_create(project_id=project_id, name=name,
+                                              defaults={'value': last_ref or 0})
+        return counter
+
+    def allocate(self, project, model, count=1):
+        """
+        Reserve a block of ``count`` consecutive references for
+        new ``model`` objects of a project and return them.
+
+        Only the counter row of the project and model is updated,
+        so a whole block costs the same as a single reference and
+        the project row is not touched. The row is read locked and
+        stays locked until the update is committed, so concurrent
+        callers get disjoint blocks with or without a transaction
+        around them.
+        """
+        if count < 1:
+            return []
+
+        project_id = getattr(project, 'pk', project)
+        name = 'us' if model is UserStory else 'task'
+
+        queryset = self.filter(project_id=project_id, name=name)
+        values = list(queryset.select_for_update().values_list('value', flat=True))
+        if not values:
+            self._get_counter(project_id, name)
+            values = list(queryset.select_for_update().values_list('value', flat=True))
+
+        last_ref = values[0] + count
+        queryset.update(value=last_ref)
+        return range(last_ref - count + 1, last_ref + 1)
+
+
+class ReferenceCounter(models.Model):
+    project = models.ForeignKey("Project", related_name="reference_counters")
+    name = models.CharField(max_length=10)
+    value = models.BigIntegerField(default=0)
+
+    objects = ReferenceCounterManager()
+
+    class Meta:
+        unique_together = ('project', 'name')
+
+
 class MilestoneManager(models.Manager):
     def get_by_natural_key(self, name, project):
         return self.get(name=name, project__slug=project)
@@ -272,6 +362,10 @@ class Milestone(models.Model):
     closed = models.BooleanField(default=False)
 
     disponibility = models.FloatField(null=True, default=0.0)
+
+    total_story_points = models.FloatField(default=None, null=True)
+    completed_story_points = models.FloatField(default=None, null=True)
+
     objects = MilestoneManager()
 
     class Meta:
@@ -284,8 +378,32 @@ class Milestone(models.Model):
         Get total story points for this milestone.
         """
 
-        total = sum(iter_points(self.user_stories.all()))
-        return "{0:.1f}".format(total)
+        return "{0:.1f}".format(self.get_points_counters()[0])
+
+    def get_points_counters(self):
+        """
+        Get the cached total and completed story points, calculating
+        them the first time they are needed.
+        """
+        if self.total_story_points is None or self.completed_story_points is None:
+            self.update_points_counters()
+        return self.total_story_points, self.completed_story_points
+
+    def update_points_counters(self):
+        """
+        Recalculate the cached story points counters of this milestone.
+        """
+        finished_states = SCRUM_STATES.get_finished_us_states()
+        points = self.user_stories.sum_points_by('status')
+
+        self.total_story_points = float(sum(points.values()))
+        self.completed_story_points = float(sum(total for status, total
+            in points.items() if status in finished_states))
+
+        self.__class__.objects.filter(pk=self.pk).update(
+            total_story_points = self.total_story_points,
+            completed_story_points = self.completed_story_points,
+        )
 
     def get_points_done_at_date(self, date):
         """
@@ -306,21 +424,84 @@ class Milestone(models.Model):
 
         return "{0:.1f}".format(total)
 
+    def get_burndown_dates(self):
+        """
+        Iterate over all days of the sprint burndown chart: from the
+        estimated start to the day after the estimated finish.
+        """
+        if self.estimated_start is None or self.estimated_finish is None:
+            return
+
+        date = self.estimated_start
+        while date <= self.estimated_finish + datetime.timedelta(days=1):
+            yield date
+            date = date + datetime.timedelta(days=1)
+
+    def update_burndown_snapshots(self):
+        """
+        Recalculate all per-day burndown snapshots of this milestone.
+
+        Completed user stories are fetched once together with the
+        date of its first finished task, so the whole sprint costs a
+        single query instead of one query per day and user story.
+        """
+        queryset = self.user_stories\
+            .filter(status__in=SCRUM_STATES.get_finished_us_states())\
+            .annotate(first_finished_date=models.Min('tasks__finished_date'))\
+            .values_list('first_finished_date', 'points')
+
+        finished = sorted((date, get_points_value(points))
+            for date, points in queryset if date is not None)
+
+        total_points = float(self.user_stories.sum_points())
+        completed_points, position = 0.0, 0
+        snapshots = []
+
+        for date in self.get_burndown_dates():
+            limit = datetime.datetime.combine(date, datetime.time(0))
+            if settings.USE_TZ:
+                limit = timezone.make_aware(limit, timezone.get_default_timezone())
+
+            while position < len(finished) and finished[position][0] < limit:
+                completed_points += finished[position][1]
+                position += 1
+
+            snapshots.append(BurndownSnapshot(
+                milestone = self,
+                date = date,
+                completed_points = completed_points,
+                remaining_points = total_points - completed_points,
+            ))
+
+        self.burndown_snapshots.all().delete()
+        BurndownSnapshot.objects.bulk_create(snapshots)
+        return snapshots
+
+    def get_burndown_snapshots(self):
+        """
+        Get the per-day burndown snapshots of this milestone, rebuilding
+        them if they do not match the current milestone dates.
+        """
+        snapshots = list(self.burndown_snapshots.order_by('date'))
+        if [x.date for x in snapshots] != list(self.get_burndown_dates()):
+            snapshots = self.update_burndown_snapshots()
+        return snapshots
+
     @property
     def completed_points(self):
         """
         Get a total of completed points.
         """
 
-        queryset = self.user_stories.filter(status__in=SCRUM_STATES.get_finished_us_states())
-        total = sum(iter_points(queryset))
-        return "{0:.1f}".format(total)
+        return "{0:.1f}".format(self.get_points_counters()[1])
 
     @property
     def percentage_completed(self):
-        return "{0:.1f}".format(
-            (float(self.completed_points) * 100) / float(self.total_points)
-        )
+        total_points, completed_points = self.get_points_counters()
+        if not total_points:
+            return "{0:.1f}".format(0)
+
+        return "{0:.1f}".format((completed_points * 100) / total_points)
 
     @models.permalink
     def get_absolute_url(self):
@@ -409,6 +590,61 @@ class Milestone(models.Model):
         super(Milestone, self).save(*args, **kwargs)
 
 
+class BurndownSnapshot(models.Model):
+    milestone = models.ForeignKey("Milestone", related_name="burndown_snapshots")
+    date = models.DateField()
+    completed_points = models.FloatField(default=0.0)
+    remaining_points = models.FloatField(default=0.0)
+
+    class Meta:
+        ordering = ['date']
+        unique_together = ('milestone', 'date')
+
+    def __repr__(self):
+        return u"<BurndownSnapshot %s %s>" % (self.milestone_id, self.date)
+
+
+class UserStoryQuerySet(models.query.QuerySet):
+    def sum_points(self):
+        """
+        Get the total story points of this queryset.
+        """
+        result = self.aggregate(total=SumPoints('points'))
+        return result['total'] or 0
+
+    def sum_points_by(self, *fields):
+        """
+        Get the total story points grouped by the given fields
+        (for example ``milestone`` or ``status``) in one query.
+
+        Returns a dict keyed by the field value, or by a tuple of
+        values when grouping by more than one field.
+        """
+        queryset = self.order_by().values(*fields)\
+            .annotate(total=SumPoints('points'))
+
+        result = {}
+        for row in queryset:
+            if len(fields) == 1:
+                key = row[fields[0]]
+            else:
+                key = tuple(row[field] for field in fields)
+            result[key] = row['total'] or 0
+
+        return result
+
+
+class UserStoryManager(models.Manager):
+    def get_query_set(self):
+        return UserStoryQuerySet(self.model)
+
+    def sum_points(self):
+        return self.get_query_set().sum_points()
+
+    def sum_points_by(self, *fields):
+        return self.get_query_set().sum_points_by(*fields)
+
+
 class UserStory(models.Model):
     uuid = models.CharField(max_length=40, unique=True, blank=True)
     ref = models.CharField(max_length=200, db_index=True, null=True, default=None)
@@ -429,7 +665,7 @@ class UserStory(models.Model):
     tested = models.BooleanField(default=False)
 
     subject = models.CharField(max_length=500)
-    description = WikiField()
+    description = WikiField(html=True)
     finish_date = models.DateTimeField(null=True, blank=True)
 
     watchers = models.ManyToManyField('auth.User',
@@ -438,6 +674,8 @@ class UserStory(models.Model):
     client_requirement = models.BooleanField(default=False)
     team_requirement = models.BooleanField(default=False)
 
+    objects = UserStoryManager()
+
     class Meta:
         unique_together = ('ref', 'project')
 
@@ -460,8 +698,6 @@ class UserStory(models.Model):
     def save(self, *args, **kwargs):
         if self.id:
             self.modified_date = timezone.now()
-        if not self.ref:
-            self.ref = ref_uniquely(self.project, self.__class__)
 
         super(UserStory, self).save(*args, **kwargs)
 
@@ -570,14 +806,14 @@ class ChangeAttachment(models.Model):
 
 
 class TaskQuerySet(models.query.QuerySet):
-    def _add_categories(self, section_dict, category_id, category_element, selected):
+    def _add_categories(self, section_dict, category_id, category_element, selected, count=1):
         section_dict[category_id] = section_dict.get(category_id, {
             'element': unicode(category_element),
             'count': 0,
             'id': category_id,
             'selected': selected,
         })
-        section_dict[category_id]['count'] += 1
+        section_dict[category_id]['count'] += count
 
     def _get_category(self, section_dict, order_by='element', reverse=False):
         values = section_dict.values()
@@ -586,46 +822,62 @@ class TaskQuerySet(models.query.QuerySet):
             values.reverse()
         return values
 
-    def _get_filter_and_build_filter_dict(self, queryset, milestone_id, status_id, tags_ids, assigned_to_id, severity_id):
-        task_list = list(queryset)
+    def _count_by(self, queryset, *fields):
+        return queryset.order_by().values(*fields).annotate(count=models.Count('id'))
+
+    def build_filter_dict(self, milestone_id=None, status_id=None, tags_ids=None,
+                                    assigned_to_id=None, severity_id=None):
+        """
+        Build the filter sidebar counts of this queryset with one
+        grouped query per facet instead of walking every task.
+        """
+        from greenmine.taggit.models import Tag
+
         milestones = {}
         status = {}
         tags = {}
         assigned_to = {}
         severity = {}
 
-        for task in task_list:
-            if task.milestone:
-                selected = milestone_id and task.milestone.id == milestone_id
-                self._add_categories(milestones, task.milestone.id, task.milestone.name, selected)
-
-            selected = status_id and task.status == status_id
-            self._add_categories(status, task.status, task.get_status_display(), selected)
-
-            for tag in task.tags.all():
-                selected = tags_ids and tag.id in tags_ids
-                self._add_categories(tags, tag.id, tag.name, selected)
-
-            if task.assigned_to:
-                selected = assigned_to_id and task.assigned_to.id == assigned_to_id
-                self._add_categories(assigned_to, task.assigned_to.id, task.assigned_to.first_name, selected)
-
-            selected = severity_id and task.severity == int(severity_id)
-            self._add_categories(severity, task.severity, task.get_severity_display(), selected)
-
-        return{
-            'list': task_list,
-            'filters' : {
-                'milestones' : self._get_category(milestones),
-                'status' : self._get_category(status),
-                'tags' : self._get_category(tags),
-                'assigned_to' : self._get_category(assigned_to),
-                'severity' : self._get_category(severity),
-            }
-        }
+        queryset = self._count_by(self.filter(milestone__isnull=False),
+                                  'milestone', 'milestone__name')
+        for row in queryset:
+            selected = milestone_id and row['milestone'] == milestone_id
+            self._add_categories(milestones, row['milestone'], row['milestone__name'],
+                                 selected, row['count'])
+
+        status_names = dict(TASK_STATUS_CHOICES)
+        for row in self._count_by(self, 'status'):
+            selected = status_id and row['status'] == status_id
+            self._add_categories(status, row['status'], status_names.get(row['status'], row['status']),
+                                 selected, row['count'])
+
+        for tag in Tag.objects.tags_for_queryset(self):
+            selected = tags_ids and tag.id in tags_ids
+            self._add_categories(tags, tag.id, tag.name, selected, tag.count)
+
+        queryset = self._count_by(self.filter(assigned_to__isnull=False),
+                                  'assigned_to', 'assigned_to__first_name')
+        for row in queryset:
+            selected = assigned_to_id and row['assigned_to'] == assigned_to_id
+            self._add_categories(assigned_to, row['assigned_to'], row['assigned_to__first_name'],
+                                 selected, row['count'])
+
+        severity_names = dict(TASK_SEVERITY_CHOICES)
+        for row in self._count_by(self, 'severity'):
+            selected = severity_id and row['severity'] == int(severity_id)
+            self._add_categories(severity, row['severity'], severity_names.get(row['severity'], row['severity']),
+                                 selected, row['count'])
 
-    def filter_and_build_filter_dict(self, milestone=None, status=None, tags=None, assigned_to=None, severity=None):
+        return {
+            'milestones' : self._get_category(milestones),
+            'status' : self._get_category(status),
+            'tags' : self._get_category(tags),
+            'assigned_to' : self._get_category(assigned_to),
+            'severity' : self._get_category(severity),
+        }
 
+    def filter_by(self, milestone=None, status=None, tags=None, assigned_to=None, severity=None):
         queryset = self
         if milestone:
             queryset = queryset.filter(milestone = milestone)
@@ -643,6 +895,40 @@ class TaskQuerySet(models.query.QuerySet):
         if severity:
             queryset = queryset.filter(severity = severity)
 
+        return queryset
+
+    def page_after(self, order_by, after=None, limit=50):
+        """
+        Get one page of tasks sorted by ``order_by`` and, for ties,
+        by id. ``after`` is the ``(value, id)`` pair of the last task
+        of the previous page, so that every page is a range scan
+        instead of a growing offset.
+
+        Returns the tasks of the page and the ``(value, id)`` pair
+        for the next one, or None if this is the last page.
+        """
+        field = order_by.lstrip('-')
+        lookup = 'lt' if order_by.startswith('-') else 'gt'
+
+        queryset = self
+        if after is not None:
+            value, pk = after
+            queryset = queryset.filter(
+                models.Q(**{'{0}__{1}'.format(field, lookup): value}) |
+                models.Q(**{field: value, 'pk__{0}'.format(lookup): pk})
+            )
+
+        id_order_by = '-id' if lookup == 'lt' else 'id'
+        tasks = list(queryset.order_by(order_by, id_order_by)[:limit + 1])
+
+        if len(tasks) <= limit:
+            return tasks, None
+
+        tasks = tasks[:limit]
+        return tasks, (getattr(tasks[-1], field), tasks[-1].pk)
+
+    def filter_and_build_filter_dict(self, milestone=None, status=None, tags=None, assigned_to=None, severity=None):
+        queryset = self.filter_by(milestone, status, tags, assigned_to, severity)
 
         milestone_id = milestone and milestone.id
         status_id = status
@@ -650,12 +936,40 @@ class TaskQuerySet(models.query.QuerySet):
         assigned_to_id = assigned_to and assigned_to.id
         severity_id = severity
 
-        return self._get_filter_and_build_filter_dict(queryset, milestone_id, status_id, tags_ids, assigned_to_id, severity_id)
+        return {
+            'list': queryset,
+            'filters': queryset.build_filter_dict(milestone_id, status_id, tags_ids,
+                                                  assigned_to_id, severity_id),
+        }
+
 
 class TaskManager(models.Manager):
     def get_query_set(self):
         return TaskQuerySet(self.model)
 
+    def _filters_version_key(self, project_id):
+        return "issues-filters-version:{0}".format(project_id)
+
+    def get_filters_version(self, project_id):
+        """
+        Get the current version of the cached issue filter counts
+        of a project. It changes every time a task is modified.
+        """
+        key = self._filters_version_key(project_id)
+        version = cache.get(key)
+        if version is None:
+            # Start from the current time, so that an expired version
+            # never matches results cached under an older one.
+            version = int(time.time())
+            cache.add(key, version)
+        return version
+
+    def invalidate_filters(self, project_id):
+        try:
+            cache.incr(self._filters_version_key(project_id))
+        except ValueError:
+            pass
+
 
 class Task(models.Model):
     uuid = models.CharField(max_length=40, unique=True, blank=True)
@@ -683,7 +997,7 @@ class Task(models.Model):
         choices=TASK_STATUS_CHOICES, null=True, blank=True)
 
     subject = models.CharField(max_length=500)
-    description = WikiField(blank=True)
+    description = WikiField(blank=True, html=True)
     assigned_to = models.ForeignKey('auth.User',
         related_name='user_storys_assigned_to_me',
         blank=True, null=True, default=None)
@@ -758,14 +1072,13 @@ class Task(models.Model):
                         self.finished_date = timezone.now()
                 self.last_status = self.status
 
-        if not self.ref:
-            self.ref = ref_uniquely(self.project, self.__class__)
-
         super(Task, self).save(*args, **kwargs)
 
         if last_user_story:
             last_user_story.update_status()
 
+        # The sprint burndown snapshots are rebuilt when a finished
+        # task changes the status of its user story.
         if self.user_story:
             self.user_story.update_status()
 
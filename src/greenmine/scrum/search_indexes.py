@@ -1,23 +1,31 @@
 # -* coding: utf-8 -*-
 from haystack import indexes
+
+from greenmine.search.indexes import ProjectSearchIndex
 from .models import Project, Milestone, UserStory, Task
 
 
-class UserStoryIndex(indexes.SearchIndex, indexes.Indexable):
+class UserStoryIndex(ProjectSearchIndex, indexes.Indexable):
     text = indexes.CharField(document=True, use_template=True, template_name='search/indexes/userstory_text.txt')
+    title = indexes.CharField(model_attr='subject', indexed=False)
+
+    snippet_attr = 'description'
 
     def get_model(self):
         return UserStory
 
     def index_queryset(self):
-        return self.get_model().objects.all()
+        return self.get_model().objects.select_related('project')
 
 
-class TaskIndex(indexes.SearchIndex, indexes.Indexable):
+class TaskIndex(ProjectSearchIndex, indexes.Indexable):
     text = indexes.CharField(document=True, use_template=True, template_name='search/indexes/task_text.txt')
+    title = indexes.CharField(model_attr='subject', indexed=False)
+
+    snippet_attr = 'description'
 
     def get_model(self):
         return Task
 
     def index_queryset(self):
-        return self.get_model().objects.all()
+        return self.get_model().objects.select_related('project')
@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+
+from django.contrib.auth.models import User
+from django.contrib.contenttypes.models import ContentType
+from django.core.urlresolvers import reverse
+from django.utils.translation import ugettext
+
+from greenmine.taggit.models import TaggedItem
+
+from .models import Project, UserStory, Task
+
+_REF_PLACEHOLDER = 'REF'
+
+
+class _UrlBuilder(object):
+    """
+    Build object urls from a prefix reversed once per url name
+    and project, instead of reversing the url of every object.
+    """
+
+    def __init__(self, objects):
+        project_ids = set(x.project_id for x in objects)
+        self.slugs = dict(Project.objects.filter(pk__in=project_ids)\
+            .values_list('pk', 'slug'))
+        self.parts = {}
+
+    def __call__(self, name, ref_kwarg, obj):
+        key = (name, obj.project_id)
+        if key not in self.parts:
+            url = reverse(name, kwargs={
+                'pslug': self.slugs[obj.project_id],
+                ref_kwarg: _REF_PLACEHOLDER,
+            })
+            # The ref is always the last url argument.
+            prefix, placeholder, suffix = url.rpartition(_REF_PLACEHOLDER)
+            self.parts[key] = (prefix, suffix)
+
+        prefix, suffix = self.parts[key]
+        return u"{0}{1}{2}".format(prefix, obj.ref, suffix)
+
+
+def _get_tags(objects, model):
+    """
+    Get the tags of all objects with one query, as a dict
+    of tag lists by object id.
+    """
+    tags = {}
+    if not objects:
+        return tags
+
+    queryset = TaggedItem.objects.filter(
+        content_type = ContentType.objects.get_for_model(model),
+        object_id__in = [x.pk for x in objects],
+    ).select_related('tag').order_by('tag__id')
+
+    for tagged_item in queryset:
+        tags.setdefault(tagged_item.object_id, []).append(tagged_item.tag)
+    return tags
+
+
+def serialize_user_stories(user_stories):
+    """
+    Same as ``UserStory.to_dict`` for every user story, with
+    a fixed number of queries.
+    """
+    user_stories = list(user_stories)
+    tags = _get_tags(user_stories, UserStory)
+    build_url = _UrlBuilder(user_stories)
+
+    return [{
+        "id": us.pk,
+        "ref": us.ref,
+        "subject": us.subject,
+        "viewUrl": build_url('user-story', 'iref', us),
+        "pointsDisplay": us.get_points_display(),
+        "tags": [ {'id': tag.id, 'name': tag.name} for tag in tags.get(us.pk, []) ]
+    } for us in user_stories]
+
+
+def serialize_tasks(tasks):
+    """
+    Same as ``Task.to_dict`` for every task, with a fixed
+    number of queries.
+    """
+    tasks = list(tasks)
+    tags = _get_tags(tasks, Task)
+    build_url = _UrlBuilder(tasks)
+    users = User.objects.in_bulk(set(x.assigned_to_id for x in tasks
+                                     if x.assigned_to_id is not None))
+
+    result = []
+    for task in tasks:
+        urls_prefix = 'issues' if task.type == 'bug' else 'tasks'
+        assigned_to = users.get(task.assigned_to_id)
+
+        task_dict = {
+            'id': task.pk,
+            'editUrl': build_url('issues-edit', 'tref', task),
+            'viewUrl': build_url(urls_prefix + '-view', 'tref', task),
+            'deleteUrl': build_url(urls_prefix + '-delete', 'tref', task),
+            'subject': task.subject,
+            'type': task.get_type_display(),
+            'statusDisplay': task.get_status_display(),
+            'status': task.status,
+            'fakeStatus': task.fake_status,
+            'us': task.user_story_id or None,
+            'assignedTo': assigned_to and assigned_to.pk or None,
+            'tags': [tag.to_dict() for tag in tags.get(task.pk, [])],
+            'priority': task.priority,
+            'priorityDisplay': task.get_priority_display(),
+            'severity': task.severity,
+            'severityDisplay': task.get_severity_display(),
+        }
+
+        if task_dict['assignedTo']:
+            task_dict['assignedToDisplay'] = assigned_to.get_full_name()
+        else:
+            task_dict['assignedToDisplay'] = ugettext("Unassigned")
+
+        result.append(task_dict)
+    return result
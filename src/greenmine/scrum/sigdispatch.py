@@ -1,21 +1,143 @@
 # -*- coding: utf-8 -*-
 
-from django.db.models.signals import post_save
+from django.db.models.signals import pre_save, post_save, pre_delete, post_delete
 from django.dispatch import receiver
-from django.contrib.auth.models import User
 from django.utils import timezone
 
-from greenmine.profile.models import Profile
-from greenmine.scrum.models import UserStory, Task, ProjectUserRole
+from django.contrib.contenttypes.models import ContentType
+
+from greenmine.profile.models import Profile, Role
+from greenmine.taggit.models import TaggedItem
+from greenmine.scrum.models import Project, Milestone, UserStory, Task, ProjectUserRole, \
+    BurndownSnapshot
 from greenmine.core.utils import normalize_tagname
 from greenmine.core import signals
 from greenmine.core.utils.auth import set_token
+from greenmine.core.middleware import send_task_on_commit
 
 from greenqueue import send_task
 from django.conf import settings
 from django.utils.translation import ugettext
 from django.template.loader import render_to_string
 
+import threading
+
+# Cached story points counters and burndown snapshots.
+
+# Projects and milestones being deleted in this thread. pre_delete is
+# sent for every collected object before any is deleted, so the user
+# stories deleted in cascade can skip recounting their containers.
+_deleting = threading.local()
+
+def get_deleting_ids(model):
+    return _deleting.__dict__.setdefault(model, set())
+
+def update_points_counters(project_id, milestone_ids):
+    milestone_ids = [x for x in milestone_ids if x is not None]
+    for milestone in Milestone.objects.filter(pk__in=milestone_ids):
+        milestone.update_points_counters()
+
+    for project in Project.objects.filter(pk=project_id):
+        project.update_points_counters()
+
+def update_burndown_snapshots(milestone_ids):
+    milestone_ids = [x for x in milestone_ids if x is not None]
+    for milestone in Milestone.objects.filter(pk__in=milestone_ids):
+        milestone.update_burndown_snapshots()
+
+def invalidate_burndown_snapshots(milestone_ids):
+    # Deletions may cascade from the milestone itself, so the snapshots
+    # are only dropped here and rebuilt when they are next read.
+    BurndownSnapshot.objects.filter(milestone__in=milestone_ids).delete()
+
+@receiver(pre_save, sender=UserStory)
+def userstory_store_old_milestone(sender, instance, **kwargs):
+    instance._old_milestone_id = None
+    instance._old_burndown_values = None
+    if instance.pk:
+        queryset = UserStory.objects.filter(pk=instance.pk)\
+            .values_list('milestone', 'points', 'status')
+        for milestone_id, points, status in queryset:
+            instance._old_milestone_id = milestone_id
+            instance._old_burndown_values = (milestone_id, points, status)
+
+@receiver(post_save, sender=UserStory)
+def userstory_update_points_counters(sender, instance, **kwargs):
+    milestone_ids = set([instance.milestone_id, instance._old_milestone_id])
+    update_points_counters(instance.project_id, milestone_ids)
+
+    # Saves that do not change the user story points in the sprint,
+    # like the ones of update_status on every task edit, keep them.
+    values = (instance.milestone_id, instance.points, instance.status)
+    if values != instance._old_burndown_values:
+        update_burndown_snapshots(milestone_ids)
+
+@receiver(post_delete, sender=UserStory)
+def userstory_delete_points_counters(sender, instance, **kwargs):
+    if instance.project_id in get_deleting_ids(Project):
+        return
+
+    # The milestone recounts its project once when it is deleted.
+    if instance.milestone_id in get_deleting_ids(Milestone):
+        return
+
+    update_points_counters(instance.project_id, [instance.milestone_id])
+    invalidate_burndown_snapshots([instance.milestone_id])
+
+@receiver(pre_delete, sender=Project)
+@receiver(pre_delete, sender=Milestone)
+def store_deleting_ids(sender, instance, **kwargs):
+    get_deleting_ids(sender).add(instance.pk)
+
+@receiver(post_delete, sender=Project)
+def project_clear_deleting_ids(sender, instance, **kwargs):
+    get_deleting_ids(Project).discard(instance.pk)
+
+@receiver(post_delete, sender=Milestone)
+def milestone_delete_points_counters(sender, instance, **kwargs):
+    get_deleting_ids(Milestone).discard(instance.pk)
+    if instance.project_id not in get_deleting_ids(Project):
+        update_points_counters(instance.project_id, [])
+
+@receiver(post_delete, sender=Task)
+def task_delete_burndown_snapshots(sender, instance, **kwargs):
+    invalidate_burndown_snapshots(UserStory.objects\
+        .filter(pk=instance.user_story_id).values_list('milestone', flat=True))
+
+
+# Cached issue filter counts.
+
+@receiver(post_save, sender=Task)
+@receiver(post_delete, sender=Task)
+def task_invalidate_filters(sender, instance, **kwargs):
+    Task.objects.invalidate_filters(instance.project_id)
+
+@receiver(post_save, sender=TaggedItem)
+@receiver(post_delete, sender=TaggedItem)
+def tagged_task_invalidate_filters(sender, instance, **kwargs):
+    if instance.content_type_id != ContentType.objects.get_for_model(Task).id:
+        return
+
+    queryset = Task.objects.filter(pk=instance.object_id)\
+        .values_list('project', flat=True)
+    for project_id in queryset:
+        Task.objects.invalidate_filters(project_id)
+
+# Cached permission flags.
+
+@receiver(post_save, sender=ProjectUserRole)
+@receiver(post_delete, sender=ProjectUserRole)
+def project_user_role_invalidate_permissions(sender, instance, **kwargs):
+    from greenmine.core.permissions import invalidate_role_flags
+    invalidate_role_flags(instance.project_id, instance.user_id)
+
+@receiver(post_save, sender=Role)
+@receiver(post_delete, sender=Role)
+def role_invalidate_permissions(sender, instance, **kwargs):
+    from greenmine.core.permissions import invalidate_role_flags
+    invalidate_role_flags()
+
+
 @receiver(signals.mail_new_user)
 def mail_new_user(sender, user, **kwargs):
     template = render_to_string("email/new.user.html", {
@@ -38,84 +160,22 @@ def mail_recovery_password(sender, user, **kwargs):
     send_task("send-mail", args = [subject, template, [user.email]])
 
 
+# Mails about scrum objects are rendered and sent by the
+# "send-event-mail" task, the request only queues the event once
+# its transaction is committed.
+
 @receiver(signals.mail_milestone_created)
 def mail_milestone_created(sender, milestone, user, **kwargs):
-    participants_ids = ProjectUserRole.objects\
-        .filter(user=user, mail_milestone_created=True, project=milestone.project)\
-        .values_list('user__pk', flat=True)
-
-    participants = User.objects.filter(pk__in=participants_ids)
-
-    emails_list = []
-    subject = ugettext("Greenmine: sprint created")
-    for person in participants:
-        template = render_to_string("email/milestone.created.html", {
-            "person": person,
-            "current_host": settings.HOST,
-            "milestone": milestone,
-            "user": user,
-        })
-
-        emails_list.append([subject, template, [person.email]])
-
-    send_task("send-bulk-mail", args=[emails_list])
+    send_task_on_commit("send-event-mail", args=["milestone-created", milestone.pk, user.pk])
 
 @receiver(signals.mail_userstory_created)
 def mail_userstory_created(sender, us, user, **kwargs):
-    participants_ids = ProjectUserRole.objects\
-        .filter(user=user, mail_userstory_created=True, project=us.project)\
-        .values_list('user__pk', flat=True)
-
-    participants = User.objects.filter(pk__in=participants_ids)
-
-    emails_list = []
-    subject = ugettext("Greenmine: user story created")
-
-    for person in participants:
-        template = render_to_string("email/userstory.created.html", {
-            "person": person,
-            "current_host": settings.HOST,
-            "us": us,
-            "user": user,
-        })
-
-        emails_list.append([subject, template, [person.email]])
-
-    send_task("send-bulk-mail", args=[emails_list])
-
+    send_task_on_commit("send-event-mail", args=["userstory-created", us.pk, user.pk])
 
 @receiver(signals.mail_task_created)
 def mail_task_created(sender, task, user, **kwargs):
-    participants_ids = ProjectUserRole.objects\
-        .filter(user=user, mail_task_created=True, project=task.project)\
-        .values_list('user__pk', flat=True)
-
-    participants = User.objects.filter(pk__in=participants_ids)
-
-    emails_list = []
-    subject = ugettext("Greenmine: task created")
-
-    for person in participants:
-        template = render_to_string("email/task.created.html", {
-            "person": person,
-            "current_host": settings.HOST,
-            "task": task,
-            "user": user,
-        })
-
-        emails_list.append([subject, template, [person.email]])
-
-    send_task("send-bulk-mail", args=[emails_list])
-
+    send_task_on_commit("send-event-mail", args=["task-created", task.pk, user.pk])
 
 @receiver(signals.mail_task_assigned)
 def mail_task_assigned(sender, task, user, **kwargs):
-    template = render_to_string("email/task.assigned.html", {
-        "person": task.assigned_to,
-        "task": task,
-        "user": user,
-        "current_host": settings.HOST,
-    })
-
-    subject = ugettext("Greenmine: task assigned")
-    send_task("send-mail", args = [subject, template, [task.assigned_to.email]])
+    send_task_on_commit("send-event-mail", args=["task-assigned", task.pk, user.pk])
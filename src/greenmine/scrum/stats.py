@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+
+from greenmine.core.utils import get_points_value
+from .utils import SCRUM_STATES
+
+from bisect import bisect_left, bisect_right
+import datetime
+
+
+def _as_datetime(date):
+    """
+    Convert a date to a datetime in the same way the ORM does
+    when a date is used in a lookup against a datetime field.
+    """
+    value = datetime.datetime.combine(date, datetime.time(0))
+    if settings.USE_TZ:
+        value = timezone.make_aware(value, timezone.get_default_timezone())
+    return value
+
+
+class _CreatedDateWindow(object):
+    """
+    Sorted created dates of user stories with accumulated
+    points, for summing points created between two dates
+    without touching the database.
+    """
+
+    def __init__(self, rows):
+        self.dates, self.sums = [], [0.0]
+        for date, points in rows:
+            self.dates.append(date)
+            self.sums.append(self.sums[-1] + points)
+
+    def sum(self, start, end, inclusive=True):
+        if inclusive:
+            lo, hi = bisect_left(self.dates, start), bisect_right(self.dates, end)
+        else:
+            lo, hi = bisect_right(self.dates, start), bisect_left(self.dates, end)
+
+        if hi <= lo:
+            return 0
+        return self.sums[hi] - self.sums[lo]
+
+
+def get_backlog_burn_stats(project):
+    """
+    Calculate the burndown and burnup series of a project backlog.
+
+    User story points are fetched already grouped by milestone,
+    status and requirement type, and client/team requirements
+    are fetched once ordered by creation date. Both series are
+    then built in one pass over project milestones.
+    """
+
+    finished_states = SCRUM_STATES.get_finished_us_states()
+    completed_points, total_points = {}, 0
+
+    points_by_group = project.user_stories.sum_points_by('milestone', 'status',
+                                                         'client_requirement',
+                                                         'team_requirement')
+
+    for key, points in points_by_group.items():
+        milestone, status, client_requirement, team_requirement = key
+
+        if milestone is not None and status in finished_states:
+            completed_points[milestone] = completed_points.get(milestone, 0) + points
+
+        if not client_requirement and not team_requirement:
+            total_points += points
+
+    client_rows, team_rows = [], []
+
+    queryset = project.user_stories\
+        .filter(Q(client_requirement=True) | Q(team_requirement=True))\
+        .order_by('created_date')\
+        .values_list('created_date', 'points', 'client_requirement', 'team_requirement')
+
+    for created_date, points, client_requirement, team_requirement in queryset:
+        points = get_points_value(points)
+        if client_requirement and team_requirement:
+            points = points / 2.0
+
+        if client_requirement:
+            client_rows.append((created_date, points))
+        if team_requirement:
+            team_rows.append((created_date, points))
+
+    client_window = _CreatedDateWindow(client_rows)
+    team_window = _CreatedDateWindow(team_rows)
+
+    points_sum, burndown_extra_sum = 0, 0
+    burnup_extra_sum, burnup_extra_team_sum = 0, 0
+
+    points_for_sprint = [points_sum]
+    burndown_extra_points, disponibility = [0], []
+    burnup_extra_points, burnup_extra_points_team = [0], [0]
+
+    now_position = None
+    today = timezone.now().date()
+
+    for i, sprint in enumerate(project.milestones.order_by('created_date'), 1):
+        points_sum += completed_points.get(sprint.id, 0)
+
+        if sprint.estimated_finish is not None:
+            end = _as_datetime(sprint.estimated_finish)
+            burndown_extra_sum += client_window.sum(sprint.created_date, end)
+            burnup_extra_sum += client_window.sum(sprint.created_date, end, inclusive=False)
+            burnup_extra_team_sum += team_window.sum(sprint.created_date, end, inclusive=False)
+
+        points_for_sprint.append(points_sum)
+        disponibility.append(sprint.disponibility)
+        burndown_extra_points.append(burndown_extra_sum)
+        burnup_extra_points.append(burnup_extra_sum)
+        burnup_extra_points_team.append(burnup_extra_team_sum)
+
+        if sprint.estimated_start is None or sprint.estimated_finish is None:
+            continue
+
+        if today <= sprint.estimated_finish and today >= sprint.estimated_start:
+            end_days = (sprint.estimated_finish-sprint.estimated_start).days
+            now_days = (today-sprint.estimated_start).days
+            now_position = (float(now_days)/float(end_days))+i
+
+    return {
+        'points_for_sprint': points_for_sprint,
+        'disponibility': disponibility,
+        'burndown_extra_points': burndown_extra_points,
+        'burnup_extra_points': burnup_extra_points,
+        'burnup_extra_points_team': burnup_extra_points_team,
+        'now_position': now_position,
+        'total_points': total_points,
+    }
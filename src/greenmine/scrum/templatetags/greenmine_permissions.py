@@ -12,4 +12,5 @@ register = template.Library()
 @register.assignment_tag(takes_context=True)
 def check_role(context, loc, perms):
     project, user, perms = context['project'], context['user'], perms.split(",")
-    return permissions.has_perms(user, project, (loc, perms))
+    return permissions.has_perms(user, project, [(loc, perms)],
+                                 request=context.get('request'))
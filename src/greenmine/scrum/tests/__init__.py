@@ -2,5 +2,5 @@
 
 from __future__ import absolute_import
 from .project import *
-
-
+from .stats import *
+from .issues import *
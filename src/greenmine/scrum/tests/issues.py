@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+
+from django.test import TestCase
+from django.contrib.auth.models import User
+
+from ..models import *
+from ..serializers import serialize_tasks, serialize_user_stories
+
+
+class IssueFiltersTests(TestCase):
+    fixtures = ['initial_data']
+
+    def setUp(self):
+        self.user = User.objects.create(
+            username = 'test',
+            first_name = 'Test',
+            email = 'test@test.com',
+            is_active = True,
+            is_staff = False,
+            is_superuser = False,
+        )
+
+        self.project = Project.objects\
+            .create(name='test1', description='test1', owner=self.user, slug='test1')
+
+        self.milestone = Milestone.objects.create(
+            project = self.project,
+            owner = self.user,
+            name = 'test milestone',
+        )
+
+        for severity in (1, 3, 3):
+            Task.objects.create(
+                type = 'bug',
+                subject = 'test bug',
+                severity = severity,
+                project = self.project,
+                milestone = self.milestone,
+                assigned_to = self.user if severity == 3 else None,
+            )
+
+        bug = Task.objects.filter(severity=1).get()
+        bug.tags.add('foo')
+
+    def tearDown(self):
+        Task.objects.all().delete()
+        Milestone.objects.all().delete()
+        Project.objects.all().delete()
+        User.objects.all().delete()
+
+    def test_build_filter_dict(self):
+        queryset = self.project.tasks.filter(type='bug')
+        filters = queryset.build_filter_dict(severity_id='3')
+
+        self.assertEqual([(x['id'], x['count'], x['selected']) for x in filters['severity']],
+                         [(3, 2, True), (1, 1, False)])
+        self.assertEqual([(x['element'], x['count']) for x in filters['milestones']],
+                         [(u'test milestone', 3)])
+        self.assertEqual([(x['element'], x['count']) for x in filters['assigned_to']],
+                         [(u'Test', 2)])
+        self.assertEqual([(x['element'], x['count']) for x in filters['tags']],
+                         [(u'foo', 1)])
+        self.assertEqual([(x['id'], x['count']) for x in filters['status']],
+                         [('open', 3)])
+
+        filters = queryset.filter_by(severity='3').build_filter_dict(severity_id='3')
+        self.assertEqual([(x['id'], x['count']) for x in filters['severity']], [(3, 2)])
+        self.assertEqual(filters['tags'], [])
+
+    def test_filters_version(self):
+        version = Task.objects.get_filters_version(self.project.id)
+        self.assertEqual(Task.objects.get_filters_version(self.project.id), version)
+
+        Task.objects.filter(severity=1).get().tags.add('bar')
+        self.assertNotEqual(Task.objects.get_filters_version(self.project.id), version)
+
+    def test_page_after(self):
+        queryset = self.project.tasks.filter(type='bug')
+        expected = list(queryset.order_by('severity', 'id').values_list('id', flat=True))
+
+        tasks, after = queryset.page_after('severity', limit=2)
+        self.assertEqual([x.id for x in tasks], expected[:2])
+        self.assertEqual(after, (3, expected[1]))
+
+        tasks, after = queryset.page_after('severity', after, limit=2)
+        self.assertEqual([x.id for x in tasks], expected[2:])
+        self.assertEqual(after, None)
+
+        tasks, after = queryset.page_after('-severity', limit=3)
+        self.assertEqual([x.id for x in tasks], list(reversed(expected)))
+        self.assertEqual(after, None)
+
+    def test_serialize_tasks(self):
+        user_story = UserStory.objects.create(
+            project = self.project,
+            owner = self.user,
+            milestone = self.milestone,
+            subject = 'test us',
+            points = 2,
+        )
+        user_story.tags.add('foo', 'bar')
+
+        task = Task.objects.filter(severity=1).get()
+        task.user_story = user_story
+        task.save()
+
+        tasks = self.project.tasks.order_by('id')
+        self.assertEqual(serialize_tasks(tasks), [x.to_dict() for x in tasks])
+
+        user_stories = self.project.user_stories.all()
+        self.assertEqual(serialize_user_stories(user_stories),
+                         [x.to_dict() for x in user_stories])
+
+    def test_allocate_references(self):
+        refs = set(self.project.tasks.values_list('ref', flat=True))
+        self.assertEqual(len(refs), 3)
+
+        block = ReferenceCounter.objects.allocate(self.project, Task, 3)
+        self.assertEqual(len(block), 3)
+        self.assertEqual(block, range(block[0], block[0] + 3))
+        self.assertFalse(set(unicode(x) for x in block) & refs)
+
+        task = Task.objects.create(type='bug', subject='test bug', project=self.project)
+        self.assertEqual(task.ref, block[-1] + 1)
+
+        ref = task.ref
+        task.subject = 'test bug edited'
+        task.save()
+        self.assertEqual(task.ref, ref)
+
+        self.assertEqual(ReferenceCounter.objects.allocate(self.project, Task, 0), [])
@@ -3,6 +3,7 @@
 from django.contrib.auth.models import User
 from django.core.urlresolvers import reverse
 from django.core import mail
+from django.http import HttpRequest
 from django.test import TestCase
 from django.utils import timezone
 
@@ -58,6 +59,22 @@ class SimplePermissionMethodsTest(TestCase):
             ('userstory', 'view'),
         ]))
 
+    def test_permissions_cached_on_request(self):
+        owner = User.objects.create(username='owner', email='owner@test.com')
+        user = User.objects.create(username='test', email='test@test.com')
+
+        project = Project.objects.create(name='test1', description='test1', owner=owner, slug='test1')
+        project.add_user(user, "developer")
+
+        request = HttpRequest()
+        with self.assertNumQueries(1):
+            self.assertTrue(perms.has_perms(user, project, [('task', 'edit')], request=request))
+            self.assertTrue(perms.has_perms(user, project, [('project', 'view')], request=request))
+            self.assertFalse(perms.has_perms(user, project, [('project', 'delete')], request=request))
+
+        ProjectUserRole.objects.filter(project=project, user=user).delete()
+        self.assertFalse(perms.has_perms(user, project, [('project', 'view')]))
+
     def tearDown(self):
         ProjectUserRole.objects.all().delete()
         Project.objects.all().delete()
@@ -276,3 +293,12 @@ class ProjectRelatedTests(TestCase):
 
         # expected redirect
         self.assertEqual(response.redirect_chain, [('http://testserver/', 302)])
+
+    def test_unique_slugs(self):
+        slugs = [Project.objects.create(name=name, description='test', owner=self.user).slug
+                 for name in ('foo', 'Foo.', 'foo!', 'foo bar')]
+        self.assertEqual(slugs, ['foo', 'foo-1', 'foo-2', 'foo-bar'])
+
+        Project.objects.filter(slug='foo-1').delete()
+        project = Project.objects.create(name='foo?', description='test', owner=self.user)
+        self.assertEqual(project.slug, 'foo-3')
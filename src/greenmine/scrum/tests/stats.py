@@ -0,0 +1,291 @@
+# -*- coding: utf-8 -*-
+
+from django.test import TestCase
+from django.contrib.auth.models import User
+from django.utils import timezone
+
+from ..models import *
+from ..stats import get_backlog_burn_stats
+
+import datetime
+
+
+class MilestoneStatsTests(TestCase):
+    fixtures = ['initial_data']
+
+    def setUp(self):
+        self.today = timezone.localtime(timezone.now()).date()
+
+        self.user = User.objects.create(
+            username = 'test',
+            email = 'test@test.com',
+            is_active = True,
+            is_staff = False,
+            is_superuser = False,
+        )
+
+        self.project = Project.objects\
+            .create(name='test1', description='test1', owner=self.user, slug='test1')
+
+        self.milestone = Milestone.objects.create(
+            project = self.project,
+            owner = self.user,
+            name = 'test milestone',
+            estimated_start = self.today - datetime.timedelta(3),
+            estimated_finish = self.today + datetime.timedelta(3),
+        )
+
+        self.user_story = UserStory.objects.create(
+            subject = 'test us',
+            description = 'test desc us',
+            points = 3,
+            owner = self.user,
+            project = self.project,
+            milestone = self.milestone,
+        )
+
+    def tearDown(self):
+        Task.objects.all().delete()
+        UserStory.objects.all().delete()
+        Milestone.objects.all().delete()
+        Project.objects.all().delete()
+        User.objects.all().delete()
+
+    def test_burndown_snapshots(self):
+        snapshots = self.milestone.get_burndown_snapshots()
+        self.assertEqual(len(snapshots), 8)
+        self.assertEqual([x.completed_points for x in snapshots], [0.0] * 8)
+        self.assertEqual([x.remaining_points for x in snapshots], [3.0] * 8)
+
+        task = Task.objects.create(
+            subject = 'test task',
+            project = self.project,
+            user_story = self.user_story,
+            status = 'open',
+            last_status = 'open',
+        )
+
+        task.status = 'closed'
+        task.save()
+
+        snapshots = list(self.milestone.burndown_snapshots.order_by('date'))
+        self.assertEqual(len(snapshots), 8)
+
+        for snapshot in snapshots:
+            expected = 3.0 if snapshot.date > self.today else 0.0
+            self.assertEqual(snapshot.completed_points, expected)
+            self.assertEqual(snapshot.remaining_points, 3.0 - expected)
+
+    def test_burndown_snapshots_follow_user_stories(self):
+        self.milestone.get_burndown_snapshots()
+
+        self.user_story.points = 5
+        self.user_story.save()
+
+        snapshots = list(self.milestone.burndown_snapshots.order_by('date'))
+        self.assertEqual([x.remaining_points for x in snapshots], [5.0] * 8)
+
+        other = Milestone.objects.create(
+            project = self.project,
+            owner = self.user,
+            name = 'other milestone',
+            estimated_start = self.today,
+            estimated_finish = self.today + datetime.timedelta(3),
+        )
+        other.get_burndown_snapshots()
+
+        self.user_story.milestone = other
+        self.user_story.save()
+
+        snapshots = list(self.milestone.burndown_snapshots.order_by('date'))
+        self.assertEqual([x.remaining_points for x in snapshots], [0.0] * 8)
+        snapshots = list(other.burndown_snapshots.order_by('date'))
+        self.assertEqual([x.remaining_points for x in snapshots], [5.0] * 5)
+
+        self.user_story.delete()
+        self.assertEqual(other.burndown_snapshots.count(), 0)
+        self.assertEqual([x.remaining_points for x in other.get_burndown_snapshots()], [0.0] * 5)
+
+    def test_burndown_snapshots_kept_on_unchanged_saves(self):
+        self.milestone.get_burndown_snapshots()
+        snapshot_ids = list(self.milestone.burndown_snapshots.values_list('pk', flat=True))
+
+        self.user_story.subject = 'renamed us'
+        self.user_story.save()
+
+        task = Task.objects.create(
+            subject = 'test task',
+            project = self.project,
+            user_story = self.user_story,
+            status = 'open',
+            last_status = 'open',
+        )
+        task.subject = 'renamed task'
+        task.save()
+
+        self.assertEqual(list(self.milestone.burndown_snapshots.values_list('pk', flat=True)),
+                         snapshot_ids)
+
+    def test_burndown_snapshots_follow_deleted_tasks(self):
+        self.user_story.status = 'closed'
+        self.user_story.save()
+
+        task = Task.objects.create(
+            subject = 'test task',
+            project = self.project,
+            user_story = self.user_story,
+            status = 'open',
+            last_status = 'open',
+        )
+        task.status = 'closed'
+        task.save()
+
+        snapshots = self.milestone.get_burndown_snapshots()
+        self.assertEqual(snapshots[-1].completed_points, 3.0)
+
+        task.delete()
+        self.assertEqual(self.milestone.burndown_snapshots.count(), 0)
+
+        snapshots = self.milestone.get_burndown_snapshots()
+        self.assertEqual([x.completed_points for x in snapshots], [0.0] * 8)
+
+    def test_burndown_snapshots_follow_milestone_dates(self):
+        self.assertEqual(len(self.milestone.get_burndown_snapshots()), 8)
+
+        self.milestone.estimated_finish = self.today + datetime.timedelta(10)
+        self.milestone.save()
+
+        self.assertEqual(len(self.milestone.get_burndown_snapshots()), 15)
+        self.assertEqual(self.milestone.burndown_snapshots.count(), 15)
+
+    def test_backlog_burn_stats(self):
+        self.user_story.status = 'closed'
+        self.user_story.save()
+
+        UserStory.objects.create(
+            subject = 'client requirement',
+            points = 5,
+            client_requirement = True,
+            owner = self.user,
+            project = self.project,
+        )
+
+        UserStory.objects.create(
+            subject = 'shared requirement',
+            points = 2,
+            client_requirement = True,
+            team_requirement = True,
+            owner = self.user,
+            project = self.project,
+        )
+
+        other_project = Project.objects\
+            .create(name='test2', description='test2', owner=self.user, slug='test2')
+
+        UserStory.objects.create(
+            subject = 'other project requirement',
+            points = 8,
+            client_requirement = True,
+            owner = self.user,
+            project = other_project,
+        )
+
+        stats = get_backlog_burn_stats(self.project)
+
+        self.assertEqual(stats['points_for_sprint'], [0, 3])
+        self.assertEqual(stats['burndown_extra_points'], [0, 6])
+        self.assertEqual(stats['burnup_extra_points'], [0, 6])
+        self.assertEqual(stats['burnup_extra_points_team'], [0, 1])
+        self.assertEqual(stats['total_points'], 3)
+        self.assertNotEqual(stats['now_position'], None)
+
+    def test_sum_points(self):
+        for points in (-1, -2, 5):
+            UserStory.objects.create(
+                subject = 'test us {0}'.format(points),
+                points = points,
+                status = 'closed',
+                owner = self.user,
+                project = self.project,
+            )
+
+        self.assertEqual(UserStory.objects.sum_points(), 8.5)
+        self.assertEqual(self.milestone.user_stories.sum_points(), 3)
+        self.assertEqual(UserStory.objects.filter(pk=0).sum_points(), 0)
+
+        self.assertEqual(self.project.user_stories.sum_points_by('milestone'), {
+            None: 5.5,
+            self.milestone.id: 3,
+        })
+
+        self.assertEqual(self.project.user_stories.sum_points_by('milestone', 'status'), {
+            (None, 'closed'): 5.5,
+            (self.milestone.id, 'open'): 3,
+        })
+
+    def test_points_counters_lazy(self):
+        Milestone.objects.filter(pk=self.milestone.pk)\
+            .update(total_story_points=None, completed_story_points=None)
+
+        milestone = Milestone.objects.get(pk=self.milestone.pk)
+        self.assertEqual(milestone.total_points, "3.0")
+
+        milestone = Milestone.objects.get(pk=self.milestone.pk)
+        self.assertEqual(milestone.total_story_points, 3)
+        self.assertEqual(milestone.completed_story_points, 0)
+
+    def test_points_counters_milestone_delete(self):
+        from ..sigdispatch import get_deleting_ids
+
+        UserStory.objects.create(
+            subject = 'unassigned us',
+            points = 5,
+            owner = self.user,
+            project = self.project,
+        )
+
+        self.milestone.delete()
+
+        extras = Project.objects.get(pk=self.project.pk).get_extras()
+        self.assertEqual(extras.total_story_points, 5)
+        self.assertEqual(extras.assigned_story_points, 0)
+        self.assertEqual(get_deleting_ids(Milestone), set())
+
+    def test_points_counters(self):
+        milestone = Milestone.objects.get(pk=self.milestone.pk)
+        self.assertEqual(milestone.total_points, "3.0")
+        self.assertEqual(milestone.completed_points, "0.0")
+        self.assertEqual(milestone.percentage_completed, "0.0")
+
+        user_story = UserStory.objects.create(
+            subject = 'unassigned us',
+            points = 5,
+            owner = self.user,
+            project = self.project,
+        )
+
+        extras = Project.objects.get(pk=self.project.pk).get_extras()
+        self.assertEqual(extras.total_story_points, 8)
+        self.assertEqual(extras.assigned_story_points, 3)
+        self.assertEqual(extras.unassigned_story_points, 5)
+        self.assertEqual(extras.completed_story_points, 0)
+
+        user_story.milestone = self.milestone
+        user_story.status = 'closed'
+        user_story.save()
+
+        milestone = Milestone.objects.get(pk=self.milestone.pk)
+        self.assertEqual(milestone.total_points, "8.0")
+        self.assertEqual(milestone.completed_points, "5.0")
+        self.assertEqual(milestone.percentage_completed, "62.5")
+
+        extras = Project.objects.get(pk=self.project.pk).get_extras()
+        self.assertEqual(extras.assigned_story_points, 8)
+        self.assertEqual(extras.unassigned_story_points, 0)
+        self.assertEqual(extras.completed_story_points, 5)
+
+        user_story.delete()
+
+        milestone = Milestone.objects.get(pk=self.milestone.pk)
+        self.assertEqual(milestone.total_points, "3.0")
+        self.assertEqual(milestone.completed_points, "0.0")
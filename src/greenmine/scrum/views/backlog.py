@@ -9,19 +9,23 @@ from greenmine.core.decorators import login_required
 
 from datetime import timedelta
 from greenmine.forms import base as forms
-from greenmine.core.utils import iter_points
 from greenmine.taggit.models import Tag
 
 from django.utils import timezone
 
 from ..models import *
+from ..stats import get_backlog_burn_stats
 
 
 class BacklogStats(GenericView):
-    def calculate_stats(self, unassigned, assigned, completed):
-        unassigned_points = sum(iter_points(unassigned))
-        assigned_points = sum(iter_points(assigned))
-        completed_points = sum(iter_points(completed))
+    def calculate_stats(self, project):
+        extras = project.get_extras()
+        if extras.total_story_points is None:
+            extras = project.update_points_counters()
+
+        unassigned_points = extras.unassigned_story_points
+        assigned_points = extras.assigned_story_points
+        completed_points = extras.completed_story_points
 
         total_points = unassigned_points + assigned_points
 
@@ -53,17 +57,7 @@ class BacklogStats(GenericView):
             ('userstory', 'view'),
         ])
 
-        unassigned = project.user_stories\
-            .filter(milestone__isnull=True)\
-            .only('points')
-
-        assigned = project.user_stories\
-            .filter(milestone__isnull=False)\
-            .only('points')
-
-        completed = assigned.filter(status__in=['completed', 'closed'])
-
-        context = self.calculate_stats(unassigned, assigned, completed)
+        context = self.calculate_stats(project)
         stats = loader.render_to_string("modules/backlog-stats.html", context)
         return self.render_to_ok({'stats_html': stats, 'stats': context})
 
@@ -159,52 +153,15 @@ class BacklogBurnDownView(GenericView):
         ])
 
         extras = project.get_extras()
-
-        points_sum, extra_points_sum = 0, 0
-        points_for_sprint = [points_sum]
-        disponibility, extra_points = [], [0]
-
-        sprints_queryset = project.milestones.order_by('created_date')
-
-        now_position = None
-
-        for i, sprint in enumerate(sprints_queryset, 1):
-            usqs = sprint.user_stories.filter(status__in=['completed', 'closed'])
-            points_sum += sum(iter_points(usqs))
-
-            extra_points_user_stories = UserStory.objects.filter(
-                created_date__gte=sprint.created_date,
-                created_date__lte=sprint.estimated_finish
-            )
-
-            extra_points_user_stories_shareds = extra_points_user_stories\
-                .filter(client_requirement=True, team_requirement=True)
-            extra_points_sum += sum(x/2.0 for x in iter_points(extra_points_user_stories_shareds))
-
-
-            extra_points_user_stories = extra_points_user_stories\
-                .filter(client_requirement=True, team_requirement=False)
-            extra_points_sum += sum(iter_points(extra_points_user_stories))
-            extra_points.append(extra_points_sum)
-
-            points_for_sprint.append(points_sum)
-            disponibility.append(sprint.disponibility)
-
-            if timezone.now().date() <= sprint.estimated_finish and timezone.now().date() >= sprint.estimated_start:
-                end_days = (sprint.estimated_finish-sprint.estimated_start).days
-                now_days = (timezone.now().date()-sprint.estimated_start).days
-                now_position = (float(now_days)/float(end_days))+i
+        stats = get_backlog_burn_stats(project)
 
         context = {
-            'points_for_sprint': points_for_sprint,
-            'disponibility': disponibility,
+            'points_for_sprint': stats['points_for_sprint'],
+            'disponibility': stats['disponibility'],
             'sprints_number': extras.sprints,
-            'extra_points': extra_points,
-            'now_position': now_position,
-            #old
-            #'total_points': sum(iter_points(project.user_stories.all())),
-            'total_points': sum(iter_points(project.user_stories\
-                .exclude(Q(client_requirement=True) | Q(team_requirement=True)))),
+            'extra_points': stats['burndown_extra_points'],
+            'now_position': stats['now_position'],
+            'total_points': stats['total_points'],
         }
 
         return self.render_to_ok(context)
@@ -222,74 +179,18 @@ class BacklogBurnUpView(GenericView):
         ])
 
         extras = project.get_extras()
-
-        points_sum = 0
-        points_for_sprint = [points_sum]
-        disponibility = []
-        extra_points = [0]
-        extra_points_sum = 0
-        extra_points_team = [0]
-        extra_points_team_sum = 0
-
-        sprints_queryset = project.milestones.order_by('created_date')
-
-        now_position = None
-
-        for i, sprint in enumerate(sprints_queryset, 1):
-            usqs = sprint.user_stories.filter(status__in=['completed', 'closed'])
-            points_sum += sum(iter_points(usqs))
-
-            extra_points_user_stories = UserStory.objects.filter(
-                created_date__gt=sprint.created_date,
-                created_date__lt=sprint.estimated_finish
-            )
-
-            extra_points_user_stories_shareds = extra_points_user_stories\
-                .filter(client_requirement=True, team_requirement=True)
-            extra_points_sum += sum(x/2.0 for x in iter_points(extra_points_user_stories_shareds))
-
-            extra_points_user_stories = extra_points_user_stories\
-                .filter(client_requirement=True, team_requirement=False)
-            extra_points_sum += sum(iter_points(extra_points_user_stories))
-            extra_points.append(extra_points_sum)
-
-            extra_points_team_user_stories = UserStory.objects.filter(
-                created_date__gt=sprint.created_date,
-                created_date__lt=sprint.estimated_finish
-            )
-
-            extra_points_team_user_stories_shareds = extra_points_team_user_stories\
-                .filter(team_requirement=True, client_requirement=True)
-
-            extra_points_team_sum += sum(x/2.0 for x in iter_points(extra_points_team_user_stories_shareds))
-
-            extra_points_team_user_stories = extra_points_team_user_stories\
-                .filter(team_requirement=True, client_requirement=False)
-
-            extra_points_team_sum += sum(iter_points(extra_points_team_user_stories))
-            extra_points_team.append(extra_points_team_sum)
-
-            points_for_sprint.append(points_sum)
-
-            if timezone.now().date() <= sprint.estimated_finish and timezone.now().date() >= sprint.estimated_start:
-                end_days = (sprint.estimated_finish-sprint.estimated_start).days
-                now_days = (timezone.now().date()-sprint.estimated_start).days
-                now_position = (float(now_days)/float(end_days))+i
-
-        total_points = sum(iter_points(project.user_stories.all()))
+        stats = get_backlog_burn_stats(project)
 
         sprints = []
-        sprints.append(points_for_sprint)
-        sprints.append(extra_points_team)
-        sprints.append(extra_points)
+        sprints.append(stats['points_for_sprint'])
+        sprints.append(stats['burnup_extra_points_team'])
+        sprints.append(stats['burnup_extra_points'])
 
         context = {
             'sprints': sprints,
-            #'total_points': sum(iter_points(project.user_stories.all())),
-            'total_points': sum(iter_points(project.user_stories\
-                .exclude(Q(client_requirement=True) | Q(team_requirement=True)))),
+            'total_points': stats['total_points'],
             'total_sprints': extras.sprints,
-            'now_position': now_position,
+            'now_position': stats['now_position'],
         }
 
         return self.render_to_ok(context)
@@ -9,24 +9,20 @@ from django.db import transaction
 
 from ...core.generic import GenericView
 from ...core.decorators import login_required
-from ...core.utils import iter_points
 
-from ..models import Project, Task
+from ..models import Project, Task, ReferenceCounter
 from ..models import TASK_STATUS_CHOICES
+from ..utils import SCRUM_STATES
 from ..forms.dashboard import ApiForm as DashboardApiForm
+from ..serializers import serialize_user_stories, serialize_tasks
 
 from datetime import timedelta, datetime, time
 
 
 class MilestoneStats(GenericView):
     def get_burndown_context(self, project, milestone):
-        points_done_on_date = []
-        date = milestone.estimated_start
-
-        while date <= milestone.estimated_finish:
-            points_done_on_date.append(milestone.get_points_done_at_date(date))
-            date = date + timedelta(days=1)
-        points_done_on_date.append(milestone.get_points_done_at_date(date))
+        points_done_on_date = ["{0:.1f}".format(x.completed_points)
+            for x in milestone.get_burndown_snapshots()]
 
         now_position = None
 
@@ -52,11 +48,14 @@ class MilestoneStats(GenericView):
         return context
 
     def get_stats_context(self, project, milestone):
+        finished_states = SCRUM_STATES.get_finished_us_states()
         all_us = milestone.user_stories.all()
-        completed_us = milestone.user_stories.filter(status__in=['completed', 'closed'])
+        completed_us = milestone.user_stories.filter(status__in=finished_states)
 
-        total_points = sum(iter_points(all_us))
-        completed_points = sum(iter_points(completed_us))
+        points = milestone.user_stories.sum_points_by('status')
+        total_points = sum(points.values())
+        completed_points = sum(total for status, total in points.items()
+                               if status in finished_states)
 
         us_number = all_us.count()
         us_completed_number = completed_us.count()
@@ -131,11 +130,11 @@ class DashboardView(GenericView):
             messages.error(request, _("No milestones found"))
             return self.render_redirect(project.get_backlog_url())
 
-        user_stories = [x.to_dict() for x in
-            milestone.user_stories.order_by('-priority', 'subject')]
+        user_stories = serialize_user_stories(
+            milestone.user_stories.order_by('-priority', 'subject'))
 
-        tasks = [x.to_dict() for x in
-            Task.objects.filter(type="task", user_story__pk__in=[y['id'] for y in user_stories])]
+        tasks = serialize_tasks(
+            Task.objects.filter(type="task", user_story__pk__in=[y['id'] for y in user_stories]))
 
         context = {
             'user_stories': user_stories,
@@ -223,13 +222,14 @@ class DashboardCreateTask(GenericView):
             ('task', ('view', 'edit')),
         ])
 
-        tasks = []
-        for task_text in request.POST.getlist("task"):
-            if not task_text:
-                continue
+        texts = [x for x in request.POST.getlist("task") if x]
+        refs = ReferenceCounter.objects.allocate(project, Task, len(texts))
 
-            task = Task(type="task", subject=task_text, project=project, user_story=user_story)
+        tasks = []
+        for task_text, ref in zip(texts, refs):
+            task = Task(type="task", subject=task_text, project=project,
+                        user_story=user_story, ref=ref)
             task.save()
             tasks.append(task)
 
-        return self.render_json({"tasks": [x.to_dict() for x in tasks]})
+        return self.render_json({"tasks": serialize_tasks(tasks)})
@@ -2,7 +2,10 @@
 
 from django.utils.translation import ugettext_lazy as _
 from django.utils.translation import ugettext
+from django.utils import translation
 
+from django.conf import settings
+from django.core.cache import cache
 from django.core.urlresolvers import reverse
 from django.shortcuts import get_object_or_404
 from django.template import loader
@@ -17,11 +20,18 @@ from datetime import timedelta
 from greenmine.forms import base as forms
 from greenmine.core.utils import iter_points
 
-from greenmine.scrum.forms.issues import IssueFilterForm, IssueCreateForm
+from greenmine.scrum.forms.issues import IssueFilterForm, IssueCreateForm, encode_cursor
 from greenmine.forms.base import CommentForm
 from greenmine.scrum.models import *
+from greenmine.scrum.serializers import serialize_tasks
 from greenmine.taggit.models import Tag
 
+import hashlib
+
+
+ISSUES_FILTERS_CACHE_TIMEOUT = getattr(settings, 'ISSUES_FILTERS_CACHE_TIMEOUT', 300)
+ISSUES_PAGE_SIZE = getattr(settings, 'ISSUES_PAGE_SIZE', 50)
+
 
 class IssueList(GenericView):
     """
@@ -58,7 +68,7 @@ class IssueList(GenericView):
         self.form = IssueFilterForm(request.GET, project=self.project)
         self.valid_form = self.form.is_valid()
         if not self.valid_form:
-            self.tasks = []
+            self.tasks, self.next_cursor = [], None
             self.filter_dict = {}
             messages.error(request, _("Uops!, something went wrong!"))
             return
@@ -69,12 +79,42 @@ class IssueList(GenericView):
         tags = self.form.cleaned_data['tags']
         assigned_to = self.form.cleaned_data['assigned_to']
         severity = self.form.cleaned_data['severity']
+        after = self.form.cleaned_data['after']
 
-        tasks_and_filters = self.project.tasks.filter(type='bug').\
-            filter_and_build_filter_dict(milestone, status, tags, assigned_to, severity)
+        queryset = self.project.tasks.filter(type='bug')\
+            .filter_by(milestone, status, tags, assigned_to, severity)
 
-        self.tasks = tasks_and_filters['list']
-        self.filter_dict = tasks_and_filters['filters']
+        self.tasks, next_after = queryset.page_after(order_by, after, ISSUES_PAGE_SIZE)
+        self.next_cursor = next_after and encode_cursor(next_after)
+
+        # Filter counts are only sent with the first page, the
+        # following ones are fetched while scrolling the list.
+        self.filter_dict = None
+        if after is not None:
+            return
+
+        milestone_id = milestone and milestone.id
+        tags_ids = tags and list(tags.values_list('id', flat=True))
+        assigned_to_id = assigned_to and assigned_to.id
+
+        cache_key = self.get_filter_dict_cache_key(milestone_id, status,
+            tags_ids, assigned_to_id, severity)
+
+        self.filter_dict = cache.get(cache_key)
+        if self.filter_dict is None:
+            self.filter_dict = queryset.build_filter_dict(milestone_id, status,
+                tags_ids, assigned_to_id, severity)
+            cache.set(cache_key, self.filter_dict, ISSUES_FILTERS_CACHE_TIMEOUT)
+
+    def get_filter_dict_cache_key(self, *filters):
+        """
+        Cache key of the filter counts for one combination of filters,
+        tied to the current filters version of the project.
+        """
+        filters_hash = hashlib.md5(repr(filters)).hexdigest()
+        return "issues-filters:{0}:{1}:{2}:{3}".format(self.project.id,
+            Task.objects.get_filters_version(self.project.id),
+            translation.get_language(), filters_hash)
 
     @login_required
     def get(self, request, pslug):
@@ -88,16 +128,20 @@ class IssueList(GenericView):
                 return self.render_to_error(self.form.errors)
 
             context = {
-                "tasks": [task.to_dict() for task in self.tasks],
-                'filter_dict': self.filter_dict,
+                "tasks": serialize_tasks(self.tasks),
+                "next_cursor": self.next_cursor,
             }
-            context.update(_aditional_context)
+            if self.filter_dict is not None:
+                context['filter_dict'] = self.filter_dict
+                context.update(_aditional_context)
+
             return self.render_json(context, ok=True)
 
         context = {
             'project': self.project,
-            'tasks': (task.to_dict() for task in self.tasks),
-            'filter_dict': self.filter_dict,
+            'tasks': serialize_tasks(self.tasks),
+            'next_cursor': self.next_cursor,
+            'filter_dict': self.filter_dict or {},
         }
 
         context.update(_aditional_context)
@@ -165,5 +165,6 @@ class MilestoneDeleteView(GenericView):
         milestone.tasks.filter(user_story__isnull=True).delete()
 
         milestone.delete()
+        project.update_points_counters()
 
         return self.render_to_ok()
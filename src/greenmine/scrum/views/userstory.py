@@ -125,12 +125,13 @@ class UserStoryCreateView(GenericView):
 
     def create_asociated_tasks(self, project, user_story):
         texts = list(project.get_extras().parse_ustext(user_story.description))
+        refs = ReferenceCounter.objects.allocate(project, Task, len(texts))
         tasks = []
 
-        for text in texts:
+        for text, ref in zip(texts, refs):
             task = Task(
                 user_story=user_story,
-                ref = ref_uniquely(project, user_story.__class__),
+                ref = ref,
                 description = "",
                 project = project,
                 milestone = user_story.milestone,
@@ -0,0 +1,11 @@
+# -*- coding: utf-8 -*-
+
+from greenqueue.core import Library
+register = Library()
+
+from greenmine.search.models import SearchIndexQueueItem
+
+@register.task(name='update-search-index')
+def update_search_index():
+    while SearchIndexQueueItem.objects.process_batch():
+        pass
@@ -1,8 +1,19 @@
 # -* coding: utf-8 -*-
 from haystack import forms
+from haystack.query import SearchQuerySet
 
 
 class SearchForm(forms.SearchForm):
+    """
+    Search restricted to the documents of some projects. The project
+    filter is applied by the search backend, and results are rendered
+    from their stored fields, so objects are not loaded.
+    """
+
     def __init__(self, *args, **kwargs):
-        kwargs['load_all'] = True
+        projects = kwargs.pop('projects', None)
+        if projects is not None:
+            kwargs['searchqueryset'] = SearchQuerySet().filter(project__in=projects)
+
+        kwargs['load_all'] = False
         super(SearchForm, self).__init__(*args, **kwargs)
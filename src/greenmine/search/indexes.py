@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+
+from django.utils.text import Truncator
+
+from haystack import indexes
+
+
+class ProjectSearchIndex(indexes.SearchIndex):
+    """
+    Base index of the objects of a project. The project id is stored
+    to filter the results inside the search backend, and the title,
+    snippet and url to render them without loading the objects.
+    Subclasses define ``title`` and name the attribute used for the
+    snippet in ``snippet_attr``.
+    """
+
+    project = indexes.IntegerField(model_attr='project_id')
+    project_name = indexes.CharField(model_attr='project__name', indexed=False)
+    snippet = indexes.CharField(indexed=False)
+    url = indexes.CharField(indexed=False)
+
+    snippet_attr = None
+    snippet_words = 30
+
+    def prepare_snippet(self, obj):
+        value = getattr(obj, self.snippet_attr, None) or u""
+        return Truncator(value).words(self.snippet_words)
+
+    def prepare_url(self, obj):
+        return obj.get_absolute_url()
+
+    def get_updated_field(self):
+        return 'modified_date'
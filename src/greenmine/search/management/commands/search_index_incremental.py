@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+
+from django.core.management.base import BaseCommand
+from django.contrib.contenttypes.models import ContentType
+
+from haystack import connections
+
+from greenmine.search.models import SearchIndexWatermark
+
+from optparse import make_option
+
+
+class Command(BaseCommand):
+    help = "Update the search index with the objects modified since the last run."
+
+    option_list = BaseCommand.option_list + (
+        make_option('--batch-size', type='int', dest='batch_size', default=500,
+            help='Number of objects read and written to the index at once.'),
+        make_option('--full', action='store_true', dest='full', default=False,
+            help='Forget the previous runs and index all objects.'),
+        make_option('--using', dest='using', default='default',
+            help='Search connection to update.'),
+    )
+
+    def handle(self, *args, **options):
+        unified_index = connections[options['using']].get_unified_index()
+
+        for model in unified_index.get_indexed_models():
+            index = unified_index.get_index(model)
+
+            if options['full']:
+                SearchIndexWatermark.objects.filter(
+                    content_type=ContentType.objects.get_for_model(model)).delete()
+
+            result = SearchIndexWatermark.objects.reindex(index,
+                batch_size=options['batch_size'], using=options['using'])
+
+            if result is None:
+                self.stdout.write("%s: skipped, no updated field\n" % (model.__name__))
+            else:
+                self.stdout.write("%s: %s updated, %s removed\n" % ((model.__name__,) + result))
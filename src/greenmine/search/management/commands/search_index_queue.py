@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+
+from django.core.management.base import BaseCommand
+
+from greenmine.search.models import SearchIndexQueueItem
+
+from optparse import make_option
+
+
+class Command(BaseCommand):
+    help = "Write the pending changes of the search index queue to the index."
+
+    option_list = BaseCommand.option_list + (
+        make_option('--lag', action='store_true', dest='lag', default=False,
+            help='Only show the pending changes and the age of the oldest one.'),
+        make_option('--batch-size', type='int', dest='batch_size', default=500,
+            help='Number of queued changes written to the index at once.'),
+    )
+
+    def handle(self, *args, **options):
+        count, seconds = SearchIndexQueueItem.objects.lag()
+        self.stdout.write("%s pending changes, oldest %.1f seconds ago\n" % (count, seconds))
+
+        if options['lag']:
+            return
+
+        processed = 0
+        while True:
+            batch = SearchIndexQueueItem.objects.process_batch(options['batch_size'])
+            if not batch:
+                break
+            processed += batch
+
+        self.stdout.write("%s changes indexed\n" % (processed))
@@ -0,0 +1,197 @@
+# -*- coding: utf-8 -*-
+
+from django.conf import settings
+from django.db import models
+from django.db.models import Min
+from django.contrib.contenttypes.models import ContentType
+from django.utils import timezone
+
+from haystack import connections
+from haystack.exceptions import NotHandled
+
+import datetime
+
+# Rows saved this many seconds before the previous incremental
+# reindex started are indexed again, so that changes committed by
+# long transactions after it read the database are not lost.
+SEARCH_REINDEX_OVERLAP = getattr(settings, 'SEARCH_REINDEX_OVERLAP', 300)
+
+
+class SearchIndexQueueManager(models.Manager):
+    def enqueue(self, instance):
+        """
+        Record that an object changed and its search index entry
+        must be updated (or removed if the object is gone).
+        """
+        return self.create(
+            content_type = ContentType.objects.get_for_model(instance),
+            object_id = instance.pk,
+        )
+
+    def lag(self):
+        """
+        Return the number of pending changes and the age in seconds
+        of the oldest one (0 if the queue is empty).
+        """
+        stats = self.aggregate(count=models.Count('id'), oldest=Min('created_date'))
+        if stats['oldest'] is None:
+            return 0, 0
+
+        return stats['count'], (timezone.now() - stats['oldest']).total_seconds()
+
+    def process_batch(self, batch_size=500, using='default'):
+        """
+        Write one batch of pending changes to the search index.
+
+        Items are only deleted from the queue after the index is
+        updated, so a failing worker leaves them for the next run
+        (at least once delivery). The tombstones of the removed
+        objects are deleted too, the incremental reindex has nothing
+        left to do for them. Returns the number of processed queue
+        items.
+        """
+
+        items = list(self.order_by('pk')[:batch_size])
+        if not items:
+            return 0
+
+        object_ids = {}
+        for item in items:
+            object_ids.setdefault(item.content_type_id, set()).add(item.object_id)
+
+        backend = connections[using].get_backend()
+        unified_index = connections[using].get_unified_index()
+
+        for content_type_id, ids in object_ids.items():
+            model = ContentType.objects.get_for_id(content_type_id).model_class()
+
+            try:
+                index = unified_index.get_index(model)
+            except NotHandled:
+                continue
+
+            existing = index.index_queryset().filter(pk__in=ids)
+            existing = dict((x.pk, x) for x in existing)
+
+            if existing:
+                backend.update(index, existing.values())
+
+            removed = ids - set(existing)
+            for object_id in removed:
+                backend.remove(u"{0}.{1}.{2}".format(model._meta.app_label,
+                    model._meta.module_name, object_id))
+
+            if removed:
+                SearchIndexTombstone.objects.filter(content_type=content_type_id,
+                                                    object_id__in=removed).delete()
+
+        # Changes queued again meanwhile have a higher pk and stay.
+        self.filter(pk__in=[x.pk for x in items]).delete()
+        return len(items)
+
+
+class SearchIndexQueueItem(models.Model):
+    content_type = models.ForeignKey(ContentType)
+    object_id = models.PositiveIntegerField()
+    created_date = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    objects = SearchIndexQueueManager()
+
+
+class SearchIndexTombstoneManager(models.Manager):
+    def record(self, instance):
+        return self.create(
+            content_type = ContentType.objects.get_for_model(instance),
+            object_id = instance.pk,
+        )
+
+
+class SearchIndexTombstone(models.Model):
+    """
+    Object deleted since the last incremental reindex, that must be
+    removed from the index (it has no modified_date to find it by).
+    """
+    content_type = models.ForeignKey(ContentType)
+    object_id = models.PositiveIntegerField()
+    deleted_date = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    objects = SearchIndexTombstoneManager()
+
+
+class SearchIndexWatermarkManager(models.Manager):
+    def reindex(self, index, batch_size=500, using='default'):
+        """
+        Update in the index the objects of ``index`` modified since
+        the last run and remove the deleted ones, reading them in
+        batches of ``batch_size`` by primary key. The watermark is only
+        moved forward once everything was written, so an interrupted
+        run is repeated entirely by the next one.
+
+        Returns the number of updated and removed objects, or None if
+        the index does not define ``get_updated_field``.
+        """
+
+        updated_field = index.get_updated_field()
+        if not updated_field:
+            return None
+
+        model = index.get_model()
+        content_type = ContentType.objects.get_for_model(model)
+        backend = connections[using].get_backend()
+        started = timezone.now()
+
+        queryset = index.index_queryset().filter(**{
+            "{0}__lte".format(updated_field): started,
+        }).order_by('pk')
+
+        watermark = list(self.filter(content_type=content_type)[:1])
+        watermark = watermark[0] if watermark else None
+
+        if watermark is not None:
+            since = watermark.last_modified - datetime.timedelta(seconds=SEARCH_REINDEX_OVERLAP)
+            queryset = queryset.filter(**{"{0}__gt".format(updated_field): since})
+
+        last_pk, updated = 0, 0
+        while True:
+            objects = list(queryset.filter(pk__gt=last_pk)[:batch_size])
+            if not objects:
+                break
+
+            backend.update(index, objects)
+            updated += len(objects)
+            last_pk = objects[-1].pk
+
+        tombstones = SearchIndexTombstone.objects.filter(content_type=content_type,
+                                                         deleted_date__lte=started)
+        removed = 0
+        while True:
+            batch = list(tombstones.order_by('pk')[:batch_size])
+            if not batch:
+                break
+
+            for tombstone in batch:
+                backend.remove(u"{0}.{1}.{2}".format(model._meta.app_label,
+                    model._meta.module_name, tombstone.object_id))
+
+            SearchIndexTombstone.objects.filter(pk__in=[x.pk for x in batch]).delete()
+            removed += len(batch)
+
+        if watermark is None:
+            self.create(content_type=content_type, last_modified=started)
+        else:
+            self.filter(pk=watermark.pk).update(last_modified=started)
+
+        return updated, removed
+
+
+class SearchIndexWatermark(models.Model):
+    """
+    Start time of the last incremental reindex of a model.
+    """
+    content_type = models.ForeignKey(ContentType, unique=True)
+    last_modified = models.DateTimeField()
+
+    objects = SearchIndexWatermarkManager()
+
+
+from . import sigdispatch
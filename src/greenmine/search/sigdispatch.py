@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+
+from django.conf import settings
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from greenqueue import send_task
+
+from greenmine.scrum.models import UserStory, Task
+from greenmine.wiki.models import WikiPage
+from greenmine.questions.models import Question
+from greenmine.documents.models import Document
+
+from .models import SearchIndexQueueItem, SearchIndexTombstone
+
+# Ask a worker to process the queue on every change. If disabled,
+# the queue is only processed by the search_index_queue command.
+# Disabled by default with the sync greenqueue backend, which would
+# update the index inside the request that saved the object.
+SEARCH_INDEX_QUEUE_NOTIFY = getattr(settings, 'SEARCH_INDEX_QUEUE_NOTIFY',
+    getattr(settings, 'GREENQUEUE_BACKEND', None) != 'greenqueue.backends.sync.SyncService')
+
+
+@receiver(post_save, sender=UserStory)
+@receiver(post_save, sender=Task)
+@receiver(post_save, sender=WikiPage)
+@receiver(post_save, sender=Question)
+@receiver(post_save, sender=Document)
+@receiver(post_delete, sender=UserStory)
+@receiver(post_delete, sender=Task)
+@receiver(post_delete, sender=WikiPage)
+@receiver(post_delete, sender=Question)
+@receiver(post_delete, sender=Document)
+def enqueue_search_index_update(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+
+    SearchIndexQueueItem.objects.enqueue(instance)
+    if SEARCH_INDEX_QUEUE_NOTIFY:
+        send_task("update-search-index", args=[])
+
+
+@receiver(post_delete, sender=UserStory)
+@receiver(post_delete, sender=Task)
+@receiver(post_delete, sender=WikiPage)
+@receiver(post_delete, sender=Question)
+@receiver(post_delete, sender=Document)
+def record_search_index_tombstone(sender, instance, **kwargs):
+    SearchIndexTombstone.objects.record(instance)
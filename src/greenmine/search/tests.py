@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+
+from django.test import TestCase
+from django.contrib.auth.models import User
+from django.core.urlresolvers import reverse
+from django.utils import timezone
+
+from haystack import connections
+from haystack.query import SearchQuerySet
+
+from greenmine.scrum.models import Project, Task
+from greenmine.search.forms import SearchForm
+from greenmine.search.models import SearchIndexQueueItem, SearchIndexTombstone, \
+    SearchIndexWatermark
+
+import datetime
+import tempfile
+import shutil
+
+
+class SearchIndexTestCase(TestCase):
+    """
+    Tests writing to a temporary whoosh index.
+    """
+
+    fixtures = ['initial_data']
+
+    def setUp(self):
+        self.index_path = tempfile.mkdtemp()
+        self.backend = connections['default'].get_backend()
+        self.old_index_path = self.backend.path
+        self.backend.path = self.index_path
+        self.backend.setup_complete = False
+
+        self.user = User.objects.create(
+            username = 'test',
+            email = 'test@test.com',
+            is_active = True,
+        )
+
+        self.project = Project.objects\
+            .create(name='test1', description='test1', owner=self.user, slug='test1')
+
+    def tearDown(self):
+        self.backend.path = self.old_index_path
+        self.backend.setup_complete = False
+        shutil.rmtree(self.index_path)
+
+    def create_task(self, subject, project=None):
+        return Task.objects.create(
+            subject = subject,
+            project = project or self.project,
+            owner = self.user,
+        )
+
+    def search_tasks(self, query):
+        results = SearchQuerySet().models(Task).auto_query(query)
+        return sorted(int(x.pk) for x in results)
+
+
+class SearchIndexQueueTests(SearchIndexTestCase):
+    def test_lag(self):
+        self.assertEqual(SearchIndexQueueItem.objects.lag(), (0, 0))
+
+        self.create_task('lagging task')
+        count, age = SearchIndexQueueItem.objects.lag()
+        self.assertEqual(count, 1)
+        self.assertTrue(age >= 0)
+
+    def test_process_batch(self):
+        tasks = [self.create_task('queued task') for x in range(3)]
+        self.assertEqual(self.search_tasks('queued'), [])
+
+        self.assertEqual(SearchIndexQueueItem.objects.process_batch(batch_size=2), 2)
+        self.assertEqual(SearchIndexQueueItem.objects.process_batch(batch_size=2), 1)
+        self.assertEqual(SearchIndexQueueItem.objects.process_batch(batch_size=2), 0)
+
+        self.assertEqual(self.search_tasks('queued'), sorted(x.pk for x in tasks))
+        self.assertEqual(SearchIndexQueueItem.objects.lag(), (0, 0))
+
+    def test_process_batch_deleted(self):
+        tasks = [self.create_task('queued task') for x in range(2)]
+        SearchIndexQueueItem.objects.process_batch()
+
+        tasks[0].delete()
+        self.assertEqual(SearchIndexQueueItem.objects.lag()[0], 1)
+
+        SearchIndexQueueItem.objects.process_batch()
+        self.assertEqual(self.search_tasks('queued'), [tasks[1].pk])
+        self.assertEqual(SearchIndexTombstone.objects.count(), 0)
+
+
+class SearchIndexWatermarkTests(SearchIndexTestCase):
+    def setUp(self):
+        super(SearchIndexWatermarkTests, self).setUp()
+        self.index = connections['default'].get_unified_index().get_index(Task)
+
+    def test_reindex_tombstones(self):
+        tasks = [self.create_task('indexed task') for x in range(3)]
+        self.assertEqual(SearchIndexWatermark.objects.reindex(self.index, batch_size=2), (3, 0))
+        self.assertEqual(self.search_tasks('indexed'), sorted(x.pk for x in tasks))
+
+        tasks[0].delete()
+        self.assertEqual(SearchIndexTombstone.objects.count(), 1)
+
+        updated, removed = SearchIndexWatermark.objects.reindex(self.index)
+        self.assertEqual(removed, 1)
+        self.assertEqual(self.search_tasks('indexed'), sorted(x.pk for x in tasks[1:]))
+        self.assertEqual(SearchIndexTombstone.objects.count(), 0)
+
+    def test_reindex_resumes_from_watermark(self):
+        tasks = [self.create_task('indexed task') for x in range(3)]
+        self.assertEqual(SearchIndexWatermark.objects.reindex(self.index), (3, 0))
+
+        # Rows modified before the watermark and its overlap are skipped.
+        Task.objects.update(modified_date=timezone.now() - datetime.timedelta(hours=1))
+        Task.objects.filter(pk=tasks[0].pk).update(subject='changed task',
+            modified_date=timezone.now())
+
+        self.assertEqual(SearchIndexWatermark.objects.reindex(self.index), (1, 0))
+        self.assertEqual(self.search_tasks('changed'), [tasks[0].pk])
+
+
+class ProjectSearchTests(SearchIndexTestCase):
+    def setUp(self):
+        super(ProjectSearchTests, self).setUp()
+        self.user.set_password('test')
+        self.user.save()
+
+        self.other_user = User.objects.create(username='other', email='other@test.com')
+        self.other_project = Project.objects.create(name='test2', description='test2',
+            owner=self.other_user, slug='test2')
+
+        self.task = self.create_task('shared task')
+        self.other_task = self.create_task('shared task', project=self.other_project)
+        SearchIndexQueueItem.objects.process_batch()
+
+    def test_form_filters_projects(self):
+        form = SearchForm({'q': 'shared'}, projects=[self.project.id])
+        self.assertTrue(form.is_valid())
+        self.assertEqual([int(x.pk) for x in form.search()], [self.task.pk])
+
+        form = SearchForm({'q': 'shared'})
+        self.assertTrue(form.is_valid())
+        self.assertEqual(sorted(int(x.pk) for x in form.search()),
+                         sorted([self.task.pk, self.other_task.pk]))
+
+    def test_view_filters_projects(self):
+        self.client.login(username='test', password='test')
+        response = self.client.get(reverse('search'), {'q': 'shared'})
+        self.assertEqual(response.status_code, 200)
+
+        results = response.context['page'].object_list
+        self.assertEqual([int(x.pk) for x in results], [self.task.pk])
@@ -2,11 +2,11 @@
 from django.core.paginator import Paginator, InvalidPage
 from django.conf import settings
 from django.http import Http404
+from django.utils.translation import ugettext as _
 from haystack.query import EmptySearchQuerySet
 
 from greenmine.core.decorators import login_required
 from greenmine.core.generic import GenericView
-from greenmine.scrum.models import Project
 from .forms import SearchForm
 
 
@@ -21,20 +21,19 @@ class SearchView(GenericView):
         query = ''
         results = EmptySearchQuerySet()
 
-        if request.user.is_staff:
-            projects = Project.objects.all()
-        else:
+        # Staff users can see every project and need no filter.
+        projects = None
+        if not request.user.is_staff:
             projects = request.user.projects.all() | \
                 request.user.projects_participant.all()
-
-        projects = projects.order_by('name').distinct()
+            projects = list(projects.values_list('id', flat=True).distinct())
 
         if request.GET.get('q'):
-            form = SearchForm(request.GET)
+            form = SearchForm(request.GET, projects=projects)
 
-            if form.is_valid():
+            if form.is_valid() and (projects is None or projects):
                 query = form.cleaned_data['q']
-                results = form.search().filter(project__in=projects)
+                results = form.search()
         else:
             form = SearchForm()
 
@@ -100,11 +100,17 @@ EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
 #EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
 
 
+# The sync backend runs tasks inline, inside the request. Search index
+# updates are then left to the search_index_queue command unless
+# SEARCH_INDEX_QUEUE_NOTIFY is set.
 GREENQUEUE_BACKEND = 'greenqueue.backends.sync.SyncService'
 GREENQUEUE_WORKER_MANAGER = 'greenqueue.worker.sync.SyncManager'
 
 GREENQUEUE_TASK_MODULES = [
     'greenmine.core.mail.async_tasks',
+    'greenmine.search.async_tasks',
+    'greenmine.base.async_tasks',
+    'greenmine.scrum.async_tasks',
 ]
 
 
@@ -171,6 +177,7 @@ MIDDLEWARE_CLASSES = [
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'greenmine.core.middleware.PermissionMiddleware',
+    'greenmine.core.middleware.DeferredTaskMiddleware',
     'django.middleware.transaction.TransactionMiddleware',
     'reversion.middleware.RevisionMiddleware',
 ]
@@ -182,6 +189,7 @@ TEMPLATE_CONTEXT_PROCESSORS = [
     "django.core.context_processors.media",
     "django.core.context_processors.static",
     "django.core.context_processors.tz",
+    "django.core.context_processors.request",
     "django.contrib.messages.context_processors.messages",
     "greenmine.core.context.main",
 ]
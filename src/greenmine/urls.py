@@ -11,6 +11,7 @@ js_info_dict = {
 
 from greenmine.base.views import api
 from greenmine.base.views import config
+from greenmine.base.views import export
 
 from greenmine.scrum.views import main
 
@@ -21,6 +22,13 @@ internapi_urlpatterns = patterns('',
         name='i18n-setlang'),
 )
 
+export_patterns = patterns('',
+    url(r'^$', export.ProjectExportView.as_view(), name='project-export-settings'),
+    url(r'^now/$', export.ProjectExportNow.as_view(), name='project-export-settings-now'),
+    url(r'^rehash/$', export.RehashExportsDirectory.as_view(), name='project-export-settings-rehash'),
+    url(r'^json/$', config.AdminProjectExport.as_view(), name='project-export-json'),
+)
+
 # FIXME: project administration is pending to refactor.
 main_patterns = patterns('',
     url(r'^$', main.HomeView.as_view(), name='projects'),
@@ -36,6 +44,7 @@ main_patterns = patterns('',
 urlpatterns = patterns('',
     url(r"^auth/", include("greenmine.profile.urls")),
     url(r"^project/", include("greenmine.scrum.urls")),
+    url(r"^project/(?P<pslug>[\w\d\-]+)/export/", include(export_patterns)),
     url(r"^project/(?P<pslug>[\w\d\-]+)/wiki/", include("greenmine.wiki.urls")),
     url(r"^project/(?P<pslug>[\w\d\-]+)/questions/", include("greenmine.questions.urls")),
     url(r"^project/(?P<pslug>[\w\d\-]+)/documents/", include("greenmine.documents.urls")),
@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+
+from difflib import SequenceMatcher
+import json
+
+
+def make_delta(old, new):
+    """
+    Build a compact line delta that transforms ``old`` text into
+    ``new`` text, serialized as json. It is a list of operations:
+    a positive number copies that many lines from the old text,
+    a negative number skips that many lines and a list of strings
+    inserts those lines.
+    """
+
+    old_lines = (old or u"").splitlines(True)
+    new_lines = (new or u"").splitlines(True)
+
+    operations = []
+    matcher = SequenceMatcher(None, old_lines, new_lines, autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == 'equal':
+            operations.append(i2 - i1)
+            continue
+
+        if i2 > i1:
+            operations.append(i1 - i2)
+        if j2 > j1:
+            operations.append(new_lines[j1:j2])
+
+    return json.dumps(operations, separators=(',', ':'))
+
+
+def apply_delta(old, delta):
+    """
+    Rebuild the new text from the ``old`` text and a delta built
+    with ``make_delta``.
+    """
+
+    old_lines = (old or u"").splitlines(True)
+    new_lines, position = [], 0
+
+    for operation in json.loads(delta):
+        if isinstance(operation, list):
+            new_lines.extend(operation)
+        elif operation > 0:
+            new_lines.extend(old_lines[position:position + operation])
+            position += operation
+        else:
+            position -= operation
+
+    return u"".join(new_lines)
@@ -0,0 +1,211 @@
+# -*- coding: utf-8 -*-
+
+from django.utils.html import escape
+
+from bisect import bisect_left
+from difflib import SequenceMatcher
+from itertools import izip_longest
+import re
+
+# Lines with more words than this are not diffed word by word.
+MAX_WORD_DIFF_TOKENS = 500
+
+_words_re = re.compile(r'(\s+)', re.U)
+
+
+def _unique_anchors(a, b, alo, ahi, blo, bhi):
+    """
+    Pairs of positions of the lines that appear exactly once in
+    both ranges, keeping the longest subsequence that is in order
+    in both of them.
+    """
+
+    lines = {}
+    for i in xrange(alo, ahi):
+        entry = lines.setdefault(a[i], [0, 0, i, None])
+        entry[0] += 1
+
+    for j in xrange(blo, bhi):
+        entry = lines.get(b[j])
+        if entry is not None:
+            entry[1] += 1
+            entry[3] = j
+
+    pairs = sorted((i, j) for count_a, count_b, i, j in lines.itervalues()
+                   if count_a == 1 and count_b == 1)
+
+    # Longest increasing subsequence of b positions (patience sorting).
+    tails, tails_idx, previous = [], [], [None] * len(pairs)
+    for idx, (i, j) in enumerate(pairs):
+        pos = bisect_left(tails, j)
+        if pos > 0:
+            previous[idx] = tails_idx[pos - 1]
+        if pos == len(tails):
+            tails.append(j)
+            tails_idx.append(idx)
+        else:
+            tails[pos] = j
+            tails_idx[pos] = idx
+
+    anchors = []
+    idx = tails_idx[-1] if tails_idx else None
+    while idx is not None:
+        anchors.append(pairs[idx])
+        idx = previous[idx]
+
+    anchors.reverse()
+    return anchors
+
+
+def _matching_lines(a, b):
+    """
+    Matching line positions of ``a`` and ``b`` found with the
+    patience diff algorithm, in near linear time for usual texts.
+    """
+
+    matches = []
+    pending = [(0, len(a), 0, len(b))]
+
+    while pending:
+        alo, ahi, blo, bhi = pending.pop()
+
+        while alo < ahi and blo < bhi and a[alo] == b[blo]:
+            matches.append((alo, blo))
+            alo, blo = alo + 1, blo + 1
+
+        while alo < ahi and blo < bhi and a[ahi - 1] == b[bhi - 1]:
+            ahi, bhi = ahi - 1, bhi - 1
+            matches.append((ahi, bhi))
+
+        if alo == ahi or blo == bhi:
+            continue
+
+        last_i, last_j = alo, blo
+        for i, j in _unique_anchors(a, b, alo, ahi, blo, bhi):
+            matches.append((i, j))
+            pending.append((last_i, i, last_j, j))
+            last_i, last_j = i + 1, j + 1
+
+        if last_i != alo:
+            pending.append((last_i, ahi, last_j, bhi))
+
+    matches.sort()
+    return matches
+
+
+def get_opcodes(a, b):
+    """
+    Same as ``SequenceMatcher(None, a, b).get_opcodes()`` but
+    using the patience diff of ``_matching_lines``.
+    """
+
+    opcodes = []
+    i, j = 0, 0
+
+    for mi, mj in _matching_lines(a, b) + [(len(a), len(b))]:
+        if i < mi and j < mj:
+            opcodes.append(('replace', i, mi, j, mj))
+        elif i < mi:
+            opcodes.append(('delete', i, mi, j, mj))
+        elif j < mj:
+            opcodes.append(('insert', i, mi, j, mj))
+
+        if mi == len(a) and mj == len(b):
+            break
+
+        if opcodes and opcodes[-1][0] == 'equal':
+            tag, i1, i2, j1, j2 = opcodes.pop()
+            opcodes.append(('equal', i1, mi + 1, j1, mj + 1))
+        else:
+            opcodes.append(('equal', mi, mi + 1, mj, mj + 1))
+
+        i, j = mi + 1, mj + 1
+
+    return opcodes
+
+
+def _highlight_words(old, new):
+    old_words, new_words = _words_re.split(old), _words_re.split(new)
+    if len(old_words) + len(new_words) > MAX_WORD_DIFF_TOKENS:
+        return u"<del>{0}</del>".format(escape(old)), u"<ins>{0}</ins>".format(escape(new))
+
+    old_html, new_html = [], []
+    matcher = SequenceMatcher(None, old_words, new_words, autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        old_part = escape(u"".join(old_words[i1:i2]))
+        new_part = escape(u"".join(new_words[j1:j2]))
+
+        if tag == 'equal':
+            old_html.append(old_part)
+            new_html.append(new_part)
+            continue
+
+        if old_part:
+            old_html.append(u"<del>{0}</del>".format(old_part))
+        if new_part:
+            new_html.append(u"<ins>{0}</ins>".format(new_part))
+
+    return u"".join(old_html), u"".join(new_html)
+
+
+def side_by_side_diff(old, new, context=3):
+    """
+    Build the rows of a side by side diff of two texts. Each row
+    is a dict with the change ``tag``, the line numbers and the
+    html of both sides. Unchanged lines further than ``context``
+    lines from a change are collapsed in a single 'skip' row.
+    """
+
+    old_lines = (old or u"").splitlines()
+    new_lines = (new or u"").splitlines()
+    opcodes = get_opcodes(old_lines, new_lines)
+
+    rows = []
+    for index, (tag, i1, i2, j1, j2) in enumerate(opcodes):
+        if tag == 'equal':
+            first, last = index == 0, index == len(opcodes) - 1
+            head = 0 if first else context
+            tail = 0 if last else context
+
+            if i2 - i1 > head + tail:
+                equal = [(i1 + x, j1 + x) for x in xrange(head)]
+                equal.append(None)
+                equal.extend((i2 - x, j2 - x) for x in xrange(tail, 0, -1))
+            else:
+                equal = [(i1 + x, j1 + x) for x in xrange(i2 - i1)]
+
+            for pair in equal:
+                if pair is None:
+                    rows.append({'tag': 'skip'})
+                    continue
+
+                i, j = pair
+                rows.append({
+                    'tag': 'equal',
+                    'old_number': i + 1,
+                    'new_number': j + 1,
+                    'old_html': escape(old_lines[i]),
+                    'new_html': escape(new_lines[j]),
+                })
+            continue
+
+        pairs = izip_longest(xrange(i1, i2), xrange(j1, j2))
+        for i, j in pairs:
+            row = {'tag': tag, 'old_number': None, 'new_number': None,
+                   'old_html': u"", 'new_html': u""}
+
+            if i is not None and j is not None:
+                row['old_html'], row['new_html'] = _highlight_words(old_lines[i], new_lines[j])
+            elif i is not None:
+                row['old_html'] = u"<del>{0}</del>".format(escape(old_lines[i]))
+            else:
+                row['new_html'] = u"<ins>{0}</ins>".format(escape(new_lines[j]))
+
+            if i is not None:
+                row['old_number'] = i + 1
+            if j is not None:
+                row['new_number'] = j + 1
+
+            rows.append(row)
+
+    return rows
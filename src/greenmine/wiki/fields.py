@@ -1,8 +1,103 @@
 from django.db import models
+from django.db.models import signals
+from django.utils.functional import curry
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
 
 class WikiField(models.TextField):
+    """
+    Text field rendered with the markup of a project.
+
+    With ``html=True`` the rendered html is stored in two companion
+    columns, ``<name>_html`` and ``<name>_html_key``, updated on every
+    save and, if the renderer version, markup or project slug changed
+    since, lazily by ``get_<name>_html``. ``project_attr`` is the attribute
+    holding the project of the instance (None for the project itself).
+    """
+
     __metaclass__ = models.SubfieldBase
 
+    def __init__(self, *args, **kwargs):
+        self.html = kwargs.pop('html', False)
+        self.project_attr = kwargs.pop('project_attr', 'project')
+        super(WikiField, self).__init__(*args, **kwargs)
+
+    def contribute_to_class(self, cls, name):
+        super(WikiField, self).contribute_to_class(cls, name)
+
+        if not self.html or cls._meta.abstract:
+            return
+
+        self.html_attname = "{0}_html".format(name)
+        self.html_key_attname = "{0}_html_key".format(name)
+
+        cls.add_to_class(self.html_attname,
+            models.TextField(null=True, blank=True, editable=False))
+        cls.add_to_class(self.html_key_attname,
+            models.CharField(max_length=300, null=True, blank=True, editable=False))
+
+        setattr(cls, "get_{0}_html".format(name), curry(self._get_html))
+        signals.pre_save.connect(self._pre_save_render, sender=cls, weak=False)
+
+    def get_project(self, instance):
+        if self.project_attr is None:
+            return instance
+        return getattr(instance, self.project_attr)
+
+    def get_html_key(self, instance):
+        """
+        Key identifying how the field of an instance is rendered,
+        stored to detect html rendered with an older configuration.
+        """
+        from greenmine.core.utils.markup import MARKUP_RENDERER_VERSION
+
+        project = self.get_project(instance)
+        return u"{0}:{1}:{2}".format(MARKUP_RENDERER_VERSION, project.markup, project.slug)
+
+    def render(self, instance):
+        from greenmine.core.utils.markup import render_markup
+
+        project = self.get_project(instance)
+        value = getattr(instance, self.attname) or u""
+
+        if project.markup in ('rst', 'md'):
+            return render_markup(value, project)
+        return escape(value)
+
+    def _pre_save_render(self, sender, instance, raw=False, **kwargs):
+        if raw:
+            return
+
+        setattr(instance, self.html_attname, self.render(instance))
+        setattr(instance, self.html_key_attname, self.get_html_key(instance))
+
+    def update_html(self, instance, force=False):
+        """
+        Render the html of an instance again if it is missing or
+        outdated, and store it without saving the whole instance.
+        Returns True if the html was updated.
+        """
+
+        key = self.get_html_key(instance)
+        if not force and getattr(instance, self.html_attname) is not None \
+                and getattr(instance, self.html_key_attname) == key:
+            return False
+
+        html = self.render(instance)
+        setattr(instance, self.html_attname, html)
+        setattr(instance, self.html_key_attname, key)
+
+        if instance.pk is not None:
+            instance.__class__._default_manager.filter(pk=instance.pk).update(**{
+                self.html_attname: html,
+                self.html_key_attname: key,
+            })
+        return True
+
+    def _get_html(self, instance):
+        self.update_html(instance)
+        return mark_safe(getattr(instance, self.html_attname))
+
     def formfield(self, **kwargs):
         from greenmine.wiki.forms import WikiFormField
         # This is a fairly standard way to set up some defaults
@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from greenmine.wiki.models import WikiPage, WIKI_HISTORY_KEYFRAME_INTERVAL
+from greenmine.wiki.delta import make_delta, apply_delta
+
+
+class Command(BaseCommand):
+    help = "Store the wiki history entries saved with full content as deltas."
+
+    def handle(self, *args, **options):
+        compressed = 0
+        for wikipage in WikiPage.objects.order_by('pk').iterator():
+            with transaction.commit_on_success():
+                compressed += self.compress_history(wikipage)
+
+        self.stdout.write("%s history entries compressed\n" % (compressed))
+
+    def compress_history(self, wikipage):
+        previous_content, since_keyframe, compressed = None, 0, 0
+
+        for entry in wikipage.history_entries.order_by('pk').iterator():
+            if not entry.is_keyframe:
+                content = apply_delta(previous_content, entry.delta)
+                since_keyframe += 1
+            else:
+                content = entry.content
+                delta = None
+                if previous_content is not None and \
+                        since_keyframe < WIKI_HISTORY_KEYFRAME_INTERVAL - 1:
+                    delta = make_delta(previous_content, content)
+                    if len(delta) >= len(content or u""):
+                        delta = None
+
+                if delta is None:
+                    since_keyframe = 0
+                else:
+                    wikipage.history_entries.filter(pk=entry.pk)\
+                        .update(content=None, delta=delta)
+                    since_keyframe += 1
+                    compressed += 1
+
+            previous_content = content
+
+        return compressed
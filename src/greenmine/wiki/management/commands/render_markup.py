@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import get_models
+
+from greenmine.wiki.fields import WikiField
+
+from optparse import make_option
+
+
+class Command(BaseCommand):
+    help = "Render again the stored html of wiki fields that is missing or outdated."
+
+    option_list = BaseCommand.option_list + (
+        make_option('--force', action='store_true', dest='force', default=False,
+            help='Render all html, also the one that is up to date.'),
+        make_option('--batch-size', type='int', dest='batch_size', default=200,
+            help='Number of objects rendered in each transaction.'),
+    )
+
+    def handle(self, *args, **options):
+        for model in get_models():
+            for field in model._meta.fields:
+                if isinstance(field, WikiField) and field.html:
+                    self.render_field(model, field, options['force'], options['batch_size'])
+
+    def render_field(self, model, field, force, batch_size):
+        queryset = model._default_manager.order_by('pk')
+        if field.project_attr is not None:
+            queryset = queryset.select_related(field.project_attr)
+
+        last_pk, updated = 0, 0
+        while True:
+            objects = list(queryset.filter(pk__gt=last_pk)[:batch_size])
+            if not objects:
+                break
+
+            with transaction.commit_on_success():
+                for obj in objects:
+                    if field.update_html(obj, force=force):
+                        updated += 1
+
+            last_pk = objects[-1].pk
+
+        self.stdout.write("%s.%s: %s updated\n" % (model.__name__, field.name, updated))
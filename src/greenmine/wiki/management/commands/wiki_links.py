@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from greenmine.wiki.models import WikiPage
+
+
+class Command(BaseCommand):
+    help = "Rebuild the stored links between wiki pages."
+
+    @transaction.commit_on_success
+    def handle(self, *args, **options):
+        count = 0
+        for wikipage in WikiPage.objects.order_by('pk').iterator():
+            wikipage.update_links()
+            count += 1
+
+        self.stdout.write("%s wiki pages updated\n" % (count))
@@ -1,16 +1,61 @@
+from django.conf import settings
 from django.db import models
 from .fields import WikiField
+from .delta import make_delta, apply_delta
+from .templatetags.plugin_wikilinks import find_wikilinks
+
+# Maximum number of history entries between two full copies of the
+# content, which bounds the deltas applied to rebuild any revision.
+WIKI_HISTORY_KEYFRAME_INTERVAL = getattr(settings, 'WIKI_HISTORY_KEYFRAME_INTERVAL', 20)
+
+class WikiPageManager(models.Manager):
+    def orphans(self, project):
+        """
+        Pages of a project that are not linked from any other page.
+        """
+        linked = WikiLink.objects.filter(project=project)\
+            .exclude(source__slug=models.F('target_slug'))\
+            .values('target_slug')
+        return self.filter(project=project).exclude(slug__in=linked)
+
 
 class WikiPage(models.Model):
     project = models.ForeignKey('scrum.Project', related_name='wiki_pages')
     slug = models.SlugField(max_length=500, db_index=True)
-    content = WikiField(blank=False, null=True)
+    content = WikiField(blank=False, null=True, html=True)
     owner = models.ForeignKey("auth.User", related_name="wiki_pages", null=True)
 
     watchers = models.ManyToManyField('auth.User',
         related_name='wikipage_watchers', null=True)
 
     created_date = models.DateTimeField(auto_now_add=True)
+    modified_date = models.DateTimeField(auto_now_add=True)
+
+    objects = WikiPageManager()
+
+    def save(self, *args, **kwargs):
+        super(WikiPage, self).save(*args, **kwargs)
+        self.update_links()
+
+    def update_links(self):
+        """
+        Store the pages linked from the content of this page.
+        """
+        targets = find_wikilinks(self.content)
+        current = set(self.links.values_list('target_slug', flat=True))
+
+        if current - targets:
+            self.links.filter(target_slug__in=current - targets).delete()
+
+        WikiLink.objects.bulk_create([WikiLink(source=self, project_id=self.project_id,
+            target_slug=target) for target in targets - current])
+
+    def get_backlinks(self):
+        """
+        Pages of the same project linking to this page.
+        """
+        return self.__class__.objects.filter(project=self.project_id,
+            links__target_slug=self.slug).exclude(pk=self.pk)
 
     @models.permalink
     def get_absolute_url(self):
@@ -39,12 +84,87 @@ class WikiPage(models.Model):
 
 
 
+def rebuild_history_content(entries):
+    """
+    Rebuild the content of the first of a list of history entries
+    sorted from newest to oldest, which must end in a keyframe.
+    """
+
+    chain = []
+    for entry in entries:
+        chain.append(entry)
+        if entry.is_keyframe:
+            break
+    else:
+        return None
+
+    content = chain.pop().content
+    for entry in reversed(chain):
+        content = apply_delta(content, entry.delta)
+    return content
+
+
+class WikiPageHistoryManager(models.Manager):
+    def create_entry(self, wikipage, content, **kwargs):
+        """
+        Create a history entry of a wiki page, stored as a delta from
+        the previous entry, or as a keyframe with the full content if
+        the previous keyframe is too far away or the delta would not
+        be smaller than the content.
+
+        The page row is locked until the caller's transaction (or, in
+        autocommit, the save of the entry) is committed, so concurrent
+        edits do not store deltas from the same previous entry.
+        """
+
+        WikiPage.objects.select_for_update().get(pk=wikipage.pk)
+
+        entry = self.model(wikipage=wikipage, **kwargs)
+        entries = list(wikipage.history_entries\
+            .order_by('-pk')[:WIKI_HISTORY_KEYFRAME_INTERVAL - 1])
+
+        previous_content = rebuild_history_content(entries)
+        if previous_content is not None:
+            entry.delta = make_delta(previous_content, content)
+            if len(entry.delta) >= len(content or u""):
+                entry.delta = None
+
+        if entry.delta is None:
+            entry.content = content
+
+        entry.save()
+        return entry
+
+
 class WikiPageHistory(models.Model):
     wikipage = models.ForeignKey("WikiPage", related_name="history_entries")
+    # Full content on keyframes, None on the entries stored as
+    # a delta from the previous entry.
     content = WikiField(blank=True, null=True)
+    delta = models.TextField(blank=True, null=True)
     created_date = models.DateTimeField()
     owner = models.ForeignKey("auth.User", related_name="wiki_page_historys")
 
+    objects = WikiPageHistoryManager()
+
+    @property
+    def is_keyframe(self):
+        return self.delta is None
+
+    def get_content(self):
+        """
+        Get the full content of this revision of the page.
+        """
+        if self.is_keyframe:
+            return self.content
+
+        entries = self.wikipage.history_entries.filter(pk__lte=self.pk).order_by('-pk')
+        content = rebuild_history_content(entries[:WIKI_HISTORY_KEYFRAME_INTERVAL])
+        if content is None:
+            # Stored with a larger keyframe interval.
+            content = rebuild_history_content(entries.iterator())
+        return content
+
     # TODO: fix this permalink. this implementation is bad for performance.
 
     @models.permalink
@@ -52,6 +172,33 @@ class WikiPageHistory(models.Model):
         return ('wiki-page-history-view', (),
             {'pslug': self.wikipage.project.slug, 'wslug': self.wikipage.slug, 'hpk': self.pk})
 
+    @models.permalink
+    def get_diff_url(self, other='current'):
+        return ('wiki-page-history-diff', (),
+            {'pslug': self.wikipage.project.slug, 'wslug': self.wikipage.slug,
+             'hpk': self.pk, 'opk': other})
+
+
+class WikiLinkManager(models.Manager):
+    def broken(self, project):
+        """
+        Links of a project pointing to pages that do not exist.
+        """
+        existing = WikiPage.objects.filter(project=project).values('slug')
+        return self.filter(project=project).exclude(target_slug__in=existing)\
+            .select_related('source')
+
+
+class WikiLink(models.Model):
+    project = models.ForeignKey('scrum.Project', related_name='wiki_links')
+    source = models.ForeignKey('WikiPage', related_name='links')
+    target_slug = models.SlugField(max_length=500, db_index=True)
+
+    objects = WikiLinkManager()
+
+    class Meta:
+        unique_together = ('source', 'target_slug')
+
 
 class WikiPageAttachment(models.Model):
     wikipage = models.ForeignKey('WikiPage', related_name='attachments')
@@ -1,13 +1,18 @@
 # -* coding: utf-8 -*-
 from haystack import indexes
+
+from greenmine.search.indexes import ProjectSearchIndex
 from .models import WikiPage
 
 
-class WikiPageIndex(indexes.RealTimeSearchIndex, indexes.Indexable):
+class WikiPageIndex(ProjectSearchIndex, indexes.Indexable):
     text = indexes.CharField(document=True, use_template=True, template_name='search/indexes/wikipage_text.txt')
+    title = indexes.CharField(model_attr='slug', indexed=False)
+
+    snippet_attr = 'content'
 
     def get_model(self):
         return WikiPage
 
     def index_queryset(self):
-        return self.get_model().objects.all()
+        return self.get_model().objects.select_related('project')
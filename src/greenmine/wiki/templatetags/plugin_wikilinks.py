@@ -83,6 +83,21 @@ import re
 
 from django.template.defaultfilters import slugify
 
+WIKILINK_RE = r'\[\[([\w0-9_ -]+)\]\]'
+WIKILINK_RE2 = r'\[\[([\w0-9_ -]+)\|([\w0-9_ -]+)\]\]'
+
+_wikilinks_re = re.compile(r'\[\[([\w0-9_ -]+)(?:\|[\w0-9_ -]+)?\]\]', re.U)
+
+def find_wikilinks(text):
+    """
+    Return the set of page slugs linked from a text.
+    """
+    targets = set()
+    for label in _wikilinks_re.findall(text or u""):
+        if label.strip():
+            targets.add(slugify(label.strip()))
+    return targets
+
 def build_url(label, base, end):
     """ 
     Build a url from the label, a base, and an end. 
@@ -110,12 +125,10 @@ class WikiLinkExtension(markdown.Extension):
         self.md = md
     
         # append to end of inline patterns
-        WIKILINK_RE = r'\[\[([\w0-9_ -]+)\]\]'
         wikilinkPattern = WikiLinks(WIKILINK_RE, self.getConfigs())
         wikilinkPattern.md = md
         md.inlinePatterns.add('wikilink1', wikilinkPattern, "<not_strong")
 
-        WIKILINK_RE2 = r'\[\[([\w0-9_ -]+)\|([\w0-9_ -]+)\]\]'
         wikilinkPattern2 = WikiLinksWithTitle(WIKILINK_RE2, self.getConfigs())
         wikilinkPattern2.md = md
         md.inlinePatterns.add('wikilink2', wikilinkPattern2, "<wikilink1")
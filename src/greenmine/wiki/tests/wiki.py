@@ -9,6 +9,10 @@ from django.contrib.auth.models import User
 from greenmine.scrum.models import *
 from greenmine.base.models import *
 from greenmine.wiki.models import *
+from greenmine.core.utils import markup
+from greenmine.wiki.delta import make_delta, apply_delta
+from greenmine.wiki.diff import get_opcodes
+from greenmine.wiki import models as wiki_models
 
 
 class WikiRelatedTests(TestCase):
@@ -42,6 +46,7 @@ class WikiRelatedTests(TestCase):
         self.client.login(username='test', password='test')
 
     def tearDown(self):
+        WikiLink.objects.all().delete()
         WikiPageHistory.objects.all().delete()
         WikiPage.objects.all().delete()
         Project.objects.all().delete()
@@ -133,3 +138,112 @@ class WikiRelatedTests(TestCase):
 
         response = self.client.post(url, params, follow=True)
         self.assertEqual(response.status_code, 403)
+
+    def test_markup_cache(self):
+        project = Project.objects.get(name='test1')
+        markup.html_cache.clear()
+
+        html = markup.render_markup(u'Go to [[Some Page]]', project)
+        self.assertIn(u'href="/test1/wiki/some-page"', html)
+
+        key = markup.get_markup_cache_key(u'Go to [[Some Page]]', 'md', project)
+        self.assertEqual(markup.html_cache.get(key), html)
+        self.assertEqual(markup.render_markup(u'Go to [[Some Page]]', project), html)
+
+        other_project = Project.objects.get(name='test2')
+        html = markup.render_markup(u'Go to [[Some Page]]', other_project)
+        self.assertIn(u'href="/test2/wiki/some-page"', html)
+
+    def test_lru_cache(self):
+        cache = markup.LRUCache(2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+
+        self.assertEqual(cache.get('a'), 1)
+        self.assertEqual(cache.get('b'), None)
+        self.assertEqual(cache.get('c'), 3)
+
+    def test_wikipage_html(self):
+        project = Project.objects.get(name='test1')
+
+        wp = WikiPage.objects.create(
+            project = project,
+            content = 'Go to [[Some Page]]',
+            slug = 'test',
+            owner = self.user1,
+        )
+        self.assertIn(u'href="/test1/wiki/some-page"', wp.content_html)
+
+        WikiPage.objects.filter(pk=wp.pk).update(content_html=None)
+        wp = WikiPage.objects.get(pk=wp.pk)
+        self.assertIn(u'href="/test1/wiki/some-page"', wp.get_content_html())
+        self.assertIsNotNone(WikiPage.objects.get(pk=wp.pk).content_html)
+
+    def test_delta(self):
+        old = u"first line\nsecond line\nthird line\n"
+        new = u"first line\nchanged line\nthird line\nlast line"
+        self.assertEqual(apply_delta(old, make_delta(old, new)), new)
+        self.assertEqual(apply_delta(new, make_delta(new, old)), old)
+        self.assertEqual(apply_delta(None, make_delta(None, new)), new)
+
+    def test_wikipage_history_deltas(self):
+        project = Project.objects.get(name='test1')
+        wp = WikiPage.objects.create(project=project, content='', slug='test', owner=self.user1)
+
+        lines = [u"line {0}\n".format(x) for x in range(50)]
+        contents = []
+        for i in range(wiki_models.WIKI_HISTORY_KEYFRAME_INTERVAL * 2 + 3):
+            lines[i % 50] = u"edited {0}\n".format(i)
+            contents.append(u"".join(lines))
+            WikiPageHistory.objects.create_entry(wikipage=wp, content=contents[-1],
+                owner=self.user1, created_date=wp.created_date)
+
+        entries = list(wp.history_entries.order_by('pk'))
+        self.assertEqual([x.get_content() for x in entries], contents)
+        self.assertEqual(len([x for x in entries if x.is_keyframe]), 3)
+
+    def test_diff_opcodes(self):
+        old = ['a', 'b', 'c', 'd', 'e']
+        new = ['a', 'x', 'c', 'e', 'f']
+        self.assertEqual(get_opcodes(old, new), [
+            ('equal', 0, 1, 0, 1),
+            ('replace', 1, 2, 1, 2),
+            ('equal', 2, 3, 2, 3),
+            ('delete', 3, 4, 3, 3),
+            ('equal', 4, 5, 3, 4),
+            ('insert', 5, 5, 4, 5),
+        ])
+
+    def test_wikipage_history_diff(self):
+        project = Project.objects.get(name='test1')
+        project.add_user(self.user1, "developer")
+
+        wp = WikiPage.objects.create(project=project, content='new text', slug='test', owner=self.user1)
+        entry = WikiPageHistory.objects.create_entry(wikipage=wp, content='old text',
+            owner=self.user1, created_date=wp.created_date)
+
+        response = self.client.get(entry.get_diff_url())
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([(x['old_html'], x['new_html']) for x in response.context['rows']],
+                         [(u'<del>old</del> text', u'<ins>new</ins> text')])
+
+    def test_wikilinks(self):
+        project = Project.objects.get(name='test1')
+
+        home = WikiPage.objects.create(project=project, slug='home', owner=self.user1,
+            content='See [[Some Page]] and [[missing page|the missing one]].')
+        page = WikiPage.objects.create(project=project, slug='some-page', owner=self.user1,
+            content='Back to [[home]].')
+        orphan = WikiPage.objects.create(project=project, slug='orphan', owner=self.user1,
+            content='Nobody links [[orphan]].')
+
+        self.assertEqual(list(page.get_backlinks()), [home])
+        self.assertEqual(list(WikiPage.objects.orphans(project)), [orphan])
+        self.assertEqual([(x.source, x.target_slug) for x in WikiLink.objects.broken(project)],
+                         [(home, u'missing-page')])
+
+        home.content = 'See [[Some Page]].'
+        home.save()
+        self.assertEqual(list(WikiLink.objects.broken(project)), [])
@@ -6,10 +6,13 @@ from django.conf.urls.defaults import patterns, include, url
 from .views import *
 
 urlpatterns = patterns('',
+    url(r'^links/report/$', WikiLinksReportView.as_view(), name='wiki-links-report'),
     url(r'^(?P<wslug>[\d\w\-]+)/view/$', WikiPageView.as_view(), name='wiki-page'),
     url(r'^(?P<wslug>[\d\w\-]+)/view/history/$', WikiPageHistoryView.as_view(), name='wiki-page-history'),
     url(r'^(?P<wslug>[\d\w\-]+)/view/history/(?P<hpk>\d+)/$',
         WikiPageHistoryView.as_view(), name='wiki-page-history-view'),
+    url(r'^(?P<wslug>[\d\w\-]+)/view/history/(?P<hpk>\d+)/diff/(?P<opk>\d+|current)/$',
+        WikiPageHistoryDiffView.as_view(), name='wiki-page-history-diff'),
 
     url(r'^(?P<wslug>[\d\w\-]+)/edit/$', WikiPageEditView.as_view(), name='wiki-page-edit'),
     url(r'^(?P<wslug>[\d\w\-]+)/delete/$', WikipageDeleteView.as_view(), name='wiki-page-delete'),
@@ -2,6 +2,8 @@
 
 from __future__ import absolute_import
 
+from django.conf import settings
+from django.core.cache import cache
 from django.core.urlresolvers import reverse
 from django.template.defaultfilters import slugify
 from django.shortcuts import get_object_or_404
@@ -11,8 +13,13 @@ from ..core.generic import GenericView
 from ..core.decorators import login_required
 from ..scrum.models import Project
 
-from .models import WikiPage, WikiPageHistory
+from .models import WikiPage, WikiPageHistory, WikiLink
 from .forms import WikiPageEditForm
+from .diff import side_by_side_diff
+
+import hashlib
+
+WIKI_DIFF_CACHE_TIMEOUT = getattr(settings, 'WIKI_DIFF_CACHE_TIMEOUT', 60*60*24)
 
 
 class WikiPageView(GenericView):
@@ -37,6 +44,32 @@ class WikiPageView(GenericView):
         context = {
             'project': project,
             'wikipage': wikipage,
+            'backlinks': wikipage.get_backlinks().order_by('slug'),
+        }
+        return self.render_to_response(self.template_path, context)
+
+
+class WikiLinksReportView(GenericView):
+    """
+    Orphan pages and broken links of the wiki of a project.
+    """
+
+    menu = ['wiki']
+    template_path = 'wiki-links-report.html'
+
+    @login_required
+    def get(self, request, pslug):
+        project = get_object_or_404(Project, slug=pslug)
+
+        self.check_role(request.user, project, [
+            ('project', 'view'),
+            ('wiki', 'view'),
+        ])
+
+        context = {
+            'project': project,
+            'orphans': WikiPage.objects.orphans(project).order_by('slug'),
+            'broken_links': WikiLink.objects.broken(project).order_by('target_slug', 'source__slug'),
         }
         return self.render_to_response(self.template_path, context)
 
@@ -90,16 +123,16 @@ class WikiPageEditView(GenericView):
 
         if wikipage is not None:
             old_wikipage = WikiPage.objects.get(pk=wikipage.pk)
-            history_entry = WikiPageHistory(
+            WikiPageHistory.objects.create_entry(
                 wikipage = old_wikipage,
                 content = old_wikipage.content,
                 owner = old_wikipage.owner,
                 created_date = old_wikipage.created_date,
             )
-            history_entry.save()
 
         if not wikipage_new.slug:
-            wikipage_new.slug = slugify_uniquely(wslug, wikipage_new.__class__)
+            wikipage_new.slug = slugify_uniquely(wslug, WikiPage,
+                queryset=project.wiki_pages.all())
 
         if not wikipage_new.project_id:
             wikipage_new.project = project
@@ -134,6 +167,54 @@ class WikiPageHistoryView(GenericView):
         return self.render_to_response(self.template_path, context)
 
 
+class WikiPageHistoryDiffView(GenericView):
+    """
+    Side by side diff between a history entry and another one
+    (``opk``) or the current version of the page.
+    """
+
+    menu = ['wiki']
+    template_path = 'wiki-page-history-diff.html'
+
+    @login_required
+    def get(self, request, pslug, wslug, hpk, opk):
+        project = get_object_or_404(Project, slug=pslug)
+
+        self.check_role(request.user, project, [
+            ('project', 'view'),
+            ('wiki', 'view'),
+        ])
+
+        wikipage = get_object_or_404(project.wiki_pages, slug=wslug)
+        history_entry = get_object_or_404(wikipage.history_entries, pk=hpk)
+
+        if opk == 'current':
+            other_entry, other_content = None, wikipage.content or u""
+            # The page changes, history entries do not.
+            other_key = "current-" + hashlib.sha1(other_content.encode('utf-8')).hexdigest()
+        else:
+            other_entry = get_object_or_404(wikipage.history_entries, pk=opk)
+            other_content, other_key = None, other_entry.pk
+
+        cache_key = "wiki-diff:{0}:{1}:{2}".format(wikipage.pk, history_entry.pk, other_key)
+        rows = cache.get(cache_key)
+        if rows is None:
+            if other_entry is not None:
+                other_content = other_entry.get_content()
+
+            rows = side_by_side_diff(history_entry.get_content(), other_content)
+            cache.set(cache_key, rows, WIKI_DIFF_CACHE_TIMEOUT)
+
+        context = {
+            'project': project,
+            'wikipage': wikipage,
+            'history_entry': history_entry,
+            'other_entry': other_entry,
+            'rows': rows,
+        }
+        return self.render_to_response(self.template_path, context)
+
+
 class WikipageDeleteView(GenericView):
     template_path = 'wiki-page-delete.html'
 